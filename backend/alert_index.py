@@ -0,0 +1,77 @@
+"""
+Alert Index Module
+Index în memorie al alertelor, pentru potrivirea anunțurilor noi (sau ieftinite) văzute de crawler
+fără nicio căutare în plus. Cheia e (make, model) normalizat; pentru fiecare cheie alertele sunt
+ținute sortate după max_price, deci alertele care acceptă un preț p (intervalul [0, max_price]
+conține p) sunt un sufix al listei, găsit cu bisect în O(log n).
+"""
+
+import bisect
+import threading
+from typing import Dict, List, Tuple
+
+from car_database import normalize_ad_make, normalize_ad_text
+
+
+class AlertIndex:
+    def __init__(self):
+        # (make_norm, model_norm) -> (max_price sortate, alertele în aceeași ordine)
+        self._prices: Dict[Tuple[str, str], List[int]] = {}
+        self._alerts: Dict[Tuple[str, str], List[Dict]] = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(make: str, model: str) -> Tuple[str, str]:
+        return normalize_ad_make(make), normalize_ad_text(model)
+
+    def _insert(self, alert: Dict):
+        key = self._key(alert["make"], alert["model"])
+        prices = self._prices.setdefault(key, [])
+        alerts = self._alerts.setdefault(key, [])
+        max_price = alert["max_price"] or 0
+        pos = bisect.bisect_right(prices, max_price)
+        prices.insert(pos, max_price)
+        alerts.insert(pos, alert)
+
+    def build(self, alerts: List[Dict], version=None):
+        with self._lock:
+            self._prices, self._alerts = {}, {}
+            for alert in alerts:
+                self._insert(alert)
+            self._version = version
+
+    def add(self, alert: Dict):
+        """Alertă nouă (add_alert); versiunea rămâne, deci nu forțează o reîncărcare"""
+        with self._lock:
+            self._insert(alert)
+            if self._version is not None:
+                count, max_id = self._version
+                self._version = (count + 1, max(max_id or 0, alert["id"]))
+
+    @property
+    def version(self):
+        """Versiunea tabelei alerts din care a fost construit (vezi get_alerts_version)"""
+        return self._version
+
+    def match(self, make: str, model: str, price) -> List[Dict]:
+        """Alertele pentru (make, model) al căror max_price acceptă prețul"""
+        try:
+            price = int(price or 0)
+        except (TypeError, ValueError):
+            return []
+        if price <= 0:
+            return []
+        key = self._key(make, model)
+        with self._lock:
+            prices = self._prices.get(key)
+            if not prices:
+                return []
+            return self._alerts[key][bisect.bisect_left(prices, price):]
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(prices) for prices in self._prices.values())
+
+
+alert_index = AlertIndex()
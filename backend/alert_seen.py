@@ -0,0 +1,80 @@
+"""
+Alert Seen Module
+Ce anunțuri au fost deja trimise pe email pentru fiecare alertă, ca notificările să conțină
+doar anunțuri noi. Adevărul e în tabela alert_notified (alert_id, ad_id); în memorie fiecare
+alertă are un Bloom filter compact peste ea:
+- "sigur nevăzut" -> anunțul e revendicat direct cu INSERT OR IGNORE, fără SELECT
+- "poate văzut" -> verificare exactă în tabelă (un SELECT pe lot)
+Revendicarea e INSERT OR IGNORE, deci două procese (API și crawler) nu trimit același anunț de două ori.
+"""
+
+import hashlib
+import math
+from typing import Iterable, List
+
+BLOOM_FP_RATE = 0.01
+BLOOM_MIN_CAPACITY = 1024
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, fp_rate: float = BLOOM_FP_RATE):
+        self.capacity = max(capacity, 1)
+        self.num_bits = max(8, int(-self.capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Double hashing (Kirsch-Mitzenmacher) din două jumătăți ale unui singur digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    @property
+    def full(self) -> bool:
+        return self.count > self.capacity
+
+
+def load_bloom(cursor, alert_id: int) -> BloomFilter:
+    ad_ids = [row[0] for row in cursor.execute("SELECT ad_id FROM alert_notified WHERE alert_id = ?", (alert_id,))]
+    bloom = BloomFilter(max(BLOOM_MIN_CAPACITY, 2 * len(ad_ids)))
+    for ad_id in ad_ids:
+        bloom.add(ad_id)
+    return bloom
+
+
+def notified_subset(cursor, alert_id: int, ad_ids: List[str]) -> set:
+    """Care dintre ad_ids au fost deja trimise (verificarea exactă pentru pozitivele Bloom)"""
+    seen = set()
+    for start in range(0, len(ad_ids), 500):
+        batch = ad_ids[start:start + 500]
+        placeholders = ",".join("?" * len(batch))
+        cursor.execute(
+            f"SELECT ad_id FROM alert_notified WHERE alert_id = ? AND ad_id IN ({placeholders})",
+            [alert_id, *batch]
+        )
+        seen.update(row[0] for row in cursor.fetchall())
+    return seen
+
+
+def claim(cursor, alert_id: int, ad_ids: Iterable[str]) -> List[str]:
+    """Marchează anunțurile ca trimise; întoarce doar pe cele revendicate acum (nu de alt proces)"""
+    claimed = []
+    for ad_id in ad_ids:
+        cursor.execute(
+            "INSERT OR IGNORE INTO alert_notified (alert_id, ad_id, notified_at) "
+            "VALUES (?, ?, CAST(strftime('%s', 'now') AS INTEGER))",
+            (alert_id, ad_id)
+        )
+        if cursor.rowcount:
+            claimed.append(ad_id)
+    return claimed
@@ -0,0 +1,56 @@
+"""
+Async Database Facade
+Fațadă async peste CarDatabaseOptimizer: apelurile SQLite (sincrone) rulează pe
+un executor dedicat, nu pe event loop, deci o căutare nu mai blochează celelalte
+cereri cât timp așteaptă după baza de date.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+from car_database import CarDatabaseOptimizer, car_db_optimizer, get_optimized_search_params
+
+
+class AsyncCarDatabase:
+    """
+    Aceleași metode ca CarDatabaseOptimizer, dar awaitable:
+        info = await async_car_db.get_model_info("bmw", "x5")
+    Fiecare thread al executorului își păstrează conexiunea din pool (vezi db_pool).
+    """
+
+    def __init__(self, optimizer: CarDatabaseOptimizer, max_workers: int = 2):
+        self._optimizer = optimizer
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="car-db")
+
+    async def run(self, func, *args, **kwargs):
+        """Rulează orice funcție sincronă de DB pe executorul dedicat"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def __getattr__(self, name):
+        attr = getattr(self._optimizer, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        return method
+
+    async def get_optimized_search_params(self, make: str, model: str,
+                                          user_min_year: int = None,
+                                          user_max_year: int = None,
+                                          generation: str = None) -> Dict:
+        # Cele 3-4 interogări rulează împreună, într-un singur drum pe executor
+        return await self.run(get_optimized_search_params, make, model,
+                              user_min_year, user_max_year, generation)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+# Instanță globală, peste optimizatorul global
+async_car_db = AsyncCarDatabase(car_db_optimizer)
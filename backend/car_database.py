@@ -6,13 +6,64 @@ datelor din scrapere cu informațiile din baza de date auto.
 
 import sqlite3
 import json
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 import re
+import time
+from scraper.listing_ids import canonical_ad_key, SOURCE_LABELS
+from db_pool import SQLiteConnectionManager
+from market_stats import apply_market_deltas, rebuild_market_stats, read_market_stats
+from price_model import deal_scores, fit_all_price_models
+from alert_seen import claim, load_bloom, notified_subset
+from change_log import CHANGE_LOG_TABLES, CHANGE_LOG_TRIGGERS, commit_offset, prune_changes, read_changes, subscriber_offset
+from crawl_scheduler import (CRAWL_MAX_SEARCH_TARGETS, CRAWL_TARGETS_TABLE, FAILURE_RETRY, recrawl_interval,
+                             update_churn)
+import unicodedata
+
+# Forma normalizată a mărcii/modelului (coloanele make_norm / model_norm din ads):
+# căutarea se face pe egalitate, deci poate folosi indexul compus
+_MAKE_ALIASES = {
+    "mercedes benz": "mercedes",
+    "mercedesbenz": "mercedes",
+    "vw": "volkswagen",
+}
+
+
+def normalize_ad_text(value) -> Optional[str]:
+    """"Seria-3" -> "seria 3": fără diacritice, lowercase, separatori comasați"""
+    if value is None:
+        return None
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    text = re.sub(r"[\s_\-/]+", " ", text).strip()
+    return text or None
+
+
+def normalize_ad_make(make) -> Optional[str]:
+    text = normalize_ad_text(make)
+    return _MAKE_ALIASES.get(text, text)
 
 
 class CarDatabaseOptimizer:
+    # Migrări de schemă, aplicate în ordine; versiunea curentă e ținută în PRAGMA user_version
+    MIGRATIONS = [
+        "_migrate_canonical_ad_keys",
+        "_migrate_search_stats_unique",
+        "_migrate_ads_search_indexes",
+        "_migrate_price_history",
+        "_migrate_market_stats",
+        "_migrate_deal_scores",
+        "_migrate_ad_changes",
+        "_migrate_crawl_full_pass",
+        "_migrate_crawl_leases",
+    ]
+    # Cât timp e refolosit un model de preț încărcat din price_models (crawler-ul îl re-potrivește)
+    PRICE_MODEL_CACHE_TTL = 600
+
     def __init__(self, db_path: str = "../database/db.sqlite"):
         self.db_path = db_path
+        self.db = SQLiteConnectionManager(db_path)
+        self._price_models = {}
+        self._alert_blooms = {}
         self.init_database()
 
     def format_brand_name(self, brand: str) -> str:
@@ -84,9 +135,11 @@ class CarDatabaseOptimizer:
     
     def init_database(self):
         """Inițializează baza de date cu tabela pentru modelele de mașini"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
+        with self.db.transaction() as cursor:
+            self._create_tables(cursor)
+        self._run_migrations()
+
+    def _create_tables(self, cursor):
         # Creează tabela pentru modelele de mașini cu informații despre anii de producție
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS car_models (
@@ -115,7 +168,12 @@ class CarDatabaseOptimizer:
                 last_searched TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 avg_price REAL,
                 avg_year REAL,
-                avg_km REAL
+                avg_km REAL,
+                -- Numărul de valori din care e calculată fiecare medie (pentru media ponderată)
+                price_samples INTEGER DEFAULT 0,
+                year_samples INTEGER DEFAULT 0,
+                km_samples INTEGER DEFAULT 0,
+                UNIQUE(make, model)
             )
         """)
 
@@ -132,11 +190,22 @@ class CarDatabaseOptimizer:
             )
         """)
 
+        # Anunțurile deja trimise pe email per alertă (vezi alert_seen.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS alert_notified (
+                alert_id INTEGER NOT NULL,
+                ad_id TEXT NOT NULL,
+                notified_at INTEGER,
+                PRIMARY KEY (alert_id, ad_id)
+            ) WITHOUT ROWID
+        """)
+
         # Creează tabela pentru anunțuri (Ads)
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS ads (
-                id TEXT PRIMARY KEY,       -- Unic, bazat pe link hash sau ID site
-                source TEXT,               -- OLX, Autovit
+                id TEXT PRIMARY KEY,       -- ID canonic "<source>:<external_id>"
+                source TEXT,               -- olx, autovit
+                external_id TEXT,          -- ID-ul anunțului pe site (sau hash pe link normalizat)
                 title TEXT,
                 price INTEGER,
                 currency TEXT DEFAULT 'EUR',
@@ -144,6 +213,9 @@ class CarDatabaseOptimizer:
                 image TEXT,
                 make TEXT,
                 model TEXT,
+                make_norm TEXT,            -- normalize_ad_make(make)
+                model_norm TEXT,           -- normalize_ad_text(model)
+                deal_score REAL,           -- sub prețul așteptat (vezi price_model.py), NULL fără model
                 year INTEGER,
                 km INTEGER,
                 fuel TEXT,
@@ -156,35 +228,313 @@ class CarDatabaseOptimizer:
                 active BOOLEAN DEFAULT 1
             )
         """)
-        
-        # Index pentru viteza
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ads_make_model ON ads(make, model)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ads_price ON ads(price)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ads_link ON ads(link)")
-        
-        conn.commit()
-        conn.close()
+        # Indexurile pentru ads (compuse + FTS) sunt create de migrarea 3
+
+        # Istoricul prețurilor: append-only, un rând doar când prețul chiar se schimbă.
+        # Prețul e delta față de observația anterioară (primul rând = prețul întreg),
+        # deci rândurile rămân mici; prețul la pasul N = SUM(price_delta) până la seq N.
+        # observed_at rămâne absolut (unix), ca să poată fi filtrat pe interval.
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ad_price_history (
+                ad_id TEXT NOT NULL,           -- ID canonic din ads
+                seq INTEGER NOT NULL,          -- 0, 1, 2... per anunț
+                observed_at INTEGER NOT NULL,  -- unix timestamp
+                price_delta INTEGER NOT NULL,
+                PRIMARY KEY (ad_id, seq)
+            ) WITHOUT ROWID
+        """)
+        # Index parțial: doar scăderile de preț, pentru /api/price-drops
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_price_history_drops
+            ON ad_price_history(observed_at) WHERE price_delta < 0
+        """)
+
+        # Statistici de piață materializate (vezi market_stats.py), un rând per
+        # (make_norm, model_norm, interval de ani); sketch-ul și histograma sunt JSON
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS market_stats (
+                make_norm TEXT NOT NULL,
+                model_norm TEXT NOT NULL,
+                year_bucket INTEGER NOT NULL,   -- primul an din interval, 0 = an necunoscut
+                ad_count INTEGER NOT NULL,
+                price_sum REAL,
+                year_count INTEGER,
+                year_sum REAL,
+                km_count INTEGER,
+                km_sum REAL,
+                price_sketch TEXT,
+                km_hist TEXT,
+                p10 REAL,
+                p25 REAL,
+                median REAL,
+                p75 REAL,
+                p90 REAL,
+                updated_at INTEGER,
+                PRIMARY KEY (make_norm, model_norm, year_bucket)
+            ) WITHOUT ROWID
+        """)
+
+        # Modele de preț per (make, model): coeficienții regresiei, ca JSON (vezi price_model.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS price_models (
+                make_norm TEXT NOT NULL,
+                model_norm TEXT NOT NULL,
+                model_json TEXT NOT NULL,
+                n_samples INTEGER,
+                fitted_at INTEGER,
+                PRIMARY KEY (make_norm, model_norm)
+            ) WITHOUT ROWID
+        """)
+
+        # Jurnalul de schimbări din ads și offset-urile abonaților (vezi change_log.py)
+        for statement in CHANGE_LOG_TABLES:
+            cursor.execute(statement)
+
+        # Țintele crawler-ului, cu churn și următorul crawl programat (vezi crawl_scheduler.py)
+        cursor.execute(CRAWL_TARGETS_TABLE)
+
+        # Lease-uri pentru joburile care trebuie să ruleze într-un singur proces (vezi scheduler.py)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS scheduler_leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+
+    def _run_migrations(self):
+        """Aplică migrările care lipsesc, fiecare în tranzacția ei"""
+        for target_version, migration in enumerate(self.MIGRATIONS, start=1):
+            with self.db.transaction() as cursor:
+                # Citit în tranzacție: alt proces poate fi aplicat deja migrarea
+                version = cursor.execute("PRAGMA user_version").fetchone()[0]
+                if version >= target_version:
+                    continue
+                getattr(self, migration)(cursor)
+                cursor.execute(f"PRAGMA user_version = {target_version}")
+
+    def _migrate_canonical_ad_keys(self, cursor):
+        """
+        Migrarea 1: cheie unică (source, external_id) pentru ads.
+        Rândurile vechi (id = md5 pe link) primesc ID-ul canonic; variantele de URL
+        ale aceluiași anunț sunt comasate, păstrând rândul văzut cel mai recent.
+        """
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(ads)")}
+        if "external_id" not in columns:
+            cursor.execute("ALTER TABLE ads ADD COLUMN external_id TEXT")
+
+        rows = cursor.execute(
+            "SELECT rowid, id, source, link FROM ads ORDER BY last_seen DESC, rowid DESC"
+        ).fetchall()
+
+        kept = set()
+        to_delete = []
+        to_update = []
+        for rowid, old_id, source, link in rows:
+            src, external_id = canonical_ad_key(link, source)
+            if not external_id:
+                external_id = old_id
+            if (src, external_id) in kept:
+                to_delete.append((rowid,))
+                continue
+            kept.add((src, external_id))
+            to_update.append((f"{src}:{external_id}", src, external_id, rowid))
+
+        cursor.executemany("DELETE FROM ads WHERE rowid = ?", to_delete)
+        cursor.executemany("UPDATE ads SET id = ?, source = ?, external_id = ? WHERE rowid = ?", to_update)
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_ads_source_external ON ads(source, external_id)")
+
+    def _migrate_search_stats_unique(self, cursor):
+        """
+        Migrarea 2: search_stats cu UNIQUE(make, model) și număr de valori per medie.
+        Tabela veche nu avea cheie unică (INSERT OR REPLACE adăuga un rând la fiecare
+        căutare); rândurile aceluiași model sunt comasate într-unul singur.
+        """
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(search_stats)")}
+        if "price_samples" in columns:
+            return
+        cursor.execute("ALTER TABLE search_stats RENAME TO search_stats_old")
+        self._create_tables(cursor)
+        cursor.execute("""
+            INSERT INTO search_stats
+            (make, model, search_count, last_searched, avg_price, avg_year, avg_km,
+             price_samples, year_samples, km_samples)
+            SELECT lower(make), lower(model), COUNT(*), MAX(last_searched),
+                   AVG(avg_price), AVG(avg_year), AVG(avg_km),
+                   COUNT(avg_price), COUNT(avg_year), COUNT(avg_km)
+            FROM search_stats_old
+            WHERE make IS NOT NULL AND model IS NOT NULL
+            GROUP BY lower(make), lower(model)
+        """)
+        cursor.execute("DROP TABLE search_stats_old")
+
+    def _migrate_ads_search_indexes(self, cursor):
+        """
+        Migrarea 3: indexuri pentru căutarea în ads.
+        - make_norm / model_norm + index (active, make_norm, model_norm, price): filtrul pe
+          model și sortarea după preț vin direct din index, fără LIKE '%x%' pe tot tabelul
+        - (active, last_seen) pentru deactivate_stale_ads și sortarea după noutate
+        - ads_fts: FTS5 external-content peste title/make/model, sincronizat prin triggere
+          (fallback când modelul nu se potrivește exact, ex. "320d" căutat în titlu)
+        """
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(ads)")}
+        for column in ("make_norm", "model_norm"):
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE ads ADD COLUMN {column} TEXT")
+
+        rows = cursor.execute(
+            "SELECT rowid, make, model FROM ads WHERE make_norm IS NULL OR model_norm IS NULL"
+        ).fetchall()
+        cursor.executemany(
+            "UPDATE ads SET make_norm = ?, model_norm = ? WHERE rowid = ?",
+            [(normalize_ad_make(make), normalize_ad_text(model), rowid) for rowid, make, model in rows]
+        )
+
+        # Înlocuite de indexurile compuse (link are deja indexul implicit din UNIQUE)
+        for index in ("idx_ads_make_model", "idx_ads_price", "idx_ads_link"):
+            cursor.execute(f"DROP INDEX IF EXISTS {index}")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ads_active_make_model_price "
+            "ON ads(active, make_norm, model_norm, price)"
+        )
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ads_active_last_seen ON ads(active, last_seen)")
+
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS ads_fts USING fts5(
+                    title, make, model,
+                    content='ads', content_rowid='rowid',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            # SQLite compilat fără FTS5: căutarea rămâne pe potrivirea exactă a modelului
+            print(f"[DB] FTS5 indisponibil, ads_fts nu a fost creat: {e}")
+            return
+
+        # ads are PRIMARY KEY TEXT, deci rowid-ul e implicit: după un VACUUM indexul trebuie
+        # reconstruit cu INSERT INTO ads_fts(ads_fts) VALUES('rebuild')
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS ads_fts_ai AFTER INSERT ON ads BEGIN
+                INSERT INTO ads_fts(rowid, title, make, model)
+                VALUES (new.rowid, new.title, new.make, new.model);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS ads_fts_ad AFTER DELETE ON ads BEGIN
+                INSERT INTO ads_fts(ads_fts, rowid, title, make, model)
+                VALUES ('delete', old.rowid, old.title, old.make, old.model);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS ads_fts_au AFTER UPDATE OF title, make, model ON ads
+            WHEN old.title IS NOT new.title OR old.make IS NOT new.make OR old.model IS NOT new.model
+            BEGIN
+                INSERT INTO ads_fts(ads_fts, rowid, title, make, model)
+                VALUES ('delete', old.rowid, old.title, old.make, old.model);
+                INSERT INTO ads_fts(rowid, title, make, model)
+                VALUES (new.rowid, new.title, new.make, new.model);
+            END
+        """)
+        cursor.execute("INSERT INTO ads_fts(ads_fts) VALUES ('rebuild')")
+
+    def _migrate_price_history(self, cursor):
+        """
+        Migrarea 4: ad_price_history (creată în _create_tables). Anunțurile existente
+        primesc prețul curent ca observație inițială, ca prima schimbare să aibă referință.
+        """
+        cursor.execute("""
+            INSERT OR IGNORE INTO ad_price_history (ad_id, seq, observed_at, price_delta)
+            SELECT id, 0, CAST(strftime('%s', COALESCE(updated_at, last_seen, CURRENT_TIMESTAMP)) AS INTEGER), price
+            FROM ads
+            WHERE price > 0
+        """)
+
+    def _migrate_market_stats(self, cursor):
+        """Migrarea 5: market_stats (creată în _create_tables), calculată din anunțurile existente"""
+        rebuild_market_stats(cursor)
+
+    def _migrate_deal_scores(self, cursor):
+        """Migrarea 6: ads.deal_score + index pentru sort=deal, apoi primul fit al modelelor de preț"""
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(ads)")}
+        if "deal_score" not in columns:
+            cursor.execute("ALTER TABLE ads ADD COLUMN deal_score REAL")
+        # Pe expresia folosită de sort=deal descrescător (NULL la final), ca ordinea să vină din index
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ads_active_make_model_deal "
+            "ON ads(active, make_norm, model_norm, COALESCE(deal_score, -2147483647))"
+        )
+        fit_all_price_models(cursor)
+
+    def _migrate_ad_changes(self, cursor):
+        """Migrarea 7: trigger-ele care completează ad_changes (jurnalul începe gol, de la starea curentă)"""
+        for statement in CHANGE_LOG_TRIGGERS:
+            cursor.execute(statement)
+
+    def _migrate_crawl_full_pass(self, cursor):
+        """Migrarea 8: crawl_targets.last_full_crawl_at (crawl incremental între parcurgeri complete)"""
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(crawl_targets)")}
+        if "last_full_crawl_at" not in columns:
+            cursor.execute("ALTER TABLE crawl_targets ADD COLUMN last_full_crawl_at INTEGER")
+
+    def _migrate_crawl_leases(self, cursor):
+        """Migrarea 9: lease-urile din crawl_targets (mai multe procese crawler în paralel)"""
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(crawl_targets)")}
+        for column, sql_type in (("leased_by", "TEXT"), ("lease_expires_at", "INTEGER")):
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE crawl_targets ADD COLUMN {column} {sql_type}")
 
     def delete_ad(self, ad_id: str):
-        """Sterge un anunț din baza de date"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM ads WHERE id = ?", (ad_id,))
-        conn.commit()
-        conn.close()
+        """Sterge un anunț din baza de date (ad_id = ID canonic, vezi canonical_ad_id)"""
+        with self.db.transaction() as cursor:
+            cursor.execute(
+                "SELECT make_norm, model_norm, year, km, price FROM ads WHERE id = ? AND active = 1", (ad_id,)
+            )
+            removed = cursor.fetchall()
+            cursor.execute("DELETE FROM ads WHERE id = ?", (ad_id,))
+            cursor.execute("DELETE FROM ad_price_history WHERE ad_id = ?", (ad_id,))
+            apply_market_deltas(cursor, [], removed)
 
-    def upsert_ad(self, ad_data: dict):
-        """Introduce sau actualizează un anunț în baza de date"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Generare ID simplu dacă nu există (hash la link)
-        import hashlib
+    def get_ad_links(self, ad_ids: List[str]) -> Dict[str, str]:
+        """Link-ul fiecărui anunț cunoscut, după ID-ul canonic"""
+        links = {}
+        with self.db.cursor() as cursor:
+            for start in range(0, len(ad_ids), 500):
+                batch = ad_ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                cursor.execute(f"SELECT id, link FROM ads WHERE id IN ({placeholders})", batch)
+                links.update(cursor.fetchall())
+        return links
+
+    # Un singur statement pentru upsert (simplu și bulk), deci rămâne în cache-ul de prepared statements.
+    # updated_at se schimbă doar când anunțul chiar s-a schimbat; last_seen la fiecare trecere.
+    _UPSERT_AD_SQL = """
+        INSERT INTO ads (
+            id, source, external_id, title, price, link, image, make, model, year, km,
+            fuel, transmission, body_type, city, make_norm, model_norm, last_seen, active, updated_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, 1, CURRENT_TIMESTAMP)
+        ON CONFLICT(source, external_id) DO UPDATE SET
+            updated_at = CASE
+                WHEN ads.price IS NOT excluded.price
+                  OR ads.active = 0
+                  OR (excluded.image IS NOT NULL AND ads.image IS NOT excluded.image)
+                THEN CURRENT_TIMESTAMP ELSE ads.updated_at END,
+            price = excluded.price,
+            link = excluded.link,
+            last_seen = CURRENT_TIMESTAMP,
+            active = 1,
+            image = COALESCE(excluded.image, ads.image),
+            year = COALESCE(excluded.year, ads.year),
+            km = COALESCE(excluded.km, ads.km),
+            fuel = COALESCE(excluded.fuel, ads.fuel)
+    """
+
+    def _ad_row(self, ad_data: dict) -> tuple:
+        """Rândul pentru _UPSERT_AD_SQL; ID-ul canonic (source, external_id) e derivat din link"""
         link = ad_data.get("link", "")
-        if not ad_data.get("id"):
-            ad_id = hashlib.md5(link.encode()).hexdigest()
-        else:
-            ad_id = ad_data["id"]
+        source, external_id = canonical_ad_key(link, ad_data.get("subsource") or ad_data.get("source"))
+        if not external_id:
+            raise ValueError(f"Anunț fără link valid: {ad_data.get('title')}")
 
         # Parse price safe
         try:
@@ -192,20 +542,10 @@ class CarDatabaseOptimizer:
         except:
              price_val = 0
 
-        cursor.execute("""
-            INSERT INTO ads (
-                id, source, title, price, link, image, make, model, year, km, 
-                fuel, transmission, body_type, city, last_seen, active, updated_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, 1, CURRENT_TIMESTAMP)
-            ON CONFLICT(link) DO UPDATE SET
-                price = excluded.price,
-                last_seen = CURRENT_TIMESTAMP,
-                active = 1,
-                updated_at = CURRENT_TIMESTAMP,
-                image = COALESCE(excluded.image, ads.image) 
-        """, (
-            ad_id,
-            ad_data.get("subsource") or ad_data.get("source", "Unknown"),
+        return (
+            f"{source}:{external_id}",
+            source,
+            external_id,
             ad_data.get("title"),
             price_val,
             link,
@@ -217,32 +557,316 @@ class CarDatabaseOptimizer:
             ad_data.get("fuel"),
             ad_data.get("transmission"),
             ad_data.get("body_type"),
-            ad_data.get("city")
-        ))
-        
-        conn.commit()
-        conn.close()
-        return ad_id
+            ad_data.get("city"),
+            normalize_ad_make(ad_data.get("make")),
+            normalize_ad_text(ad_data.get("model"))
+        )
 
-    def search_ads_db(self, make: str, model: str, min_price=None, max_price=None, 
-                     min_year=None, max_year=None, min_km=None, max_km=None, limit=100,
-                     sort_by="price", order="asc") -> List[Dict]:
-        """Caută anunțuri în baza de date locală"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        query = "SELECT * FROM ads WHERE active = 1"
-        params = []
-        
+    def upsert_ad(self, ad_data: dict):
+        """Introduce sau actualizează un anunț în baza de date"""
+        row = self._ad_row(ad_data)
+        self._upsert_chunk([row], self._new_upsert_result())
+        return row[0]
+
+    @staticmethod
+    def _new_upsert_result() -> Dict:
+        return {"inserted": 0, "updated": 0, "unchanged": 0, "invalid": 0, "price_changes": [],
+                "price_drops": [], "new_ads": []}
+
+    def bulk_upsert_ads(self, ads: Iterable[dict], chunk_size: int = 500) -> Dict:
+        """
+        Upsert în bloc: executemany pe bucăți de `chunk_size`, fiecare bucată într-o
+        singură tranzacție (un singur commit/fsync, nu unul per anunț).
+        Acceptă orice iterabil (inclusiv generatoare), deci anunțurile pot fi trimise pe măsură ce vin.
+        Întoarce numărul de anunțuri inserate / actualizate / neschimbate și schimbările de preț.
+        """
+        result = self._new_upsert_result()
+
+        chunk = {}
+        for ad_data in ads:
+            try:
+                row = self._ad_row(ad_data)
+            except ValueError:
+                result["invalid"] += 1
+                continue
+            chunk[row[0]] = row  # același anunț de două ori în bucată -> ultima variantă
+            if len(chunk) >= chunk_size:
+                self._upsert_chunk(list(chunk.values()), result)
+                chunk = {}
+        if chunk:
+            self._upsert_chunk(list(chunk.values()), result)
+
+        return result
+
+    def _upsert_chunk(self, rows: List[tuple], result: Dict):
+        ids = [row[0] for row in rows]
+        observed_at = int(time.time())
+        with self.db.transaction() as cursor:
+            # Starea anterioară, pentru clasificare (cheie primară, deci lookup indexat)
+            existing = {}
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                cursor.execute(f"""
+                    SELECT id, price, image, active, make_norm, model_norm, year, km
+                    FROM ads WHERE id IN ({placeholders})
+                """, batch)
+                for ad_id, *state in cursor.fetchall():
+                    existing[ad_id] = tuple(state)
+
+            cursor.executemany(self._UPSERT_AD_SQL, rows)
+            self._apply_market_changes(cursor, rows, existing)
+
+            # Istoric doar pentru anunțurile noi și cele cu preț schimbat, în aceeași tranzacție
+            priced = {row[0]: row[4] for row in rows
+                      if row[4] and (row[0] not in existing or existing[row[0]][0] != row[4])}
+            self._append_price_history(cursor, priced, observed_at)
+            self._score_deals(cursor, [row for row in rows if row[0] in priced], existing)
+
+        for row in rows:
+            ad_id, price, image = row[0], row[4], row[6]
+            if ad_id not in existing:
+                result["inserted"] += 1
+                result["new_ads"].append({
+                    "id": ad_id,
+                    "title": row[3],
+                    "link": row[5],
+                    "image": image,
+                    "make": row[7],
+                    "model": row[8],
+                    "price": price,
+                    "year": row[9],
+                    "km": row[10],
+                })
+                continue
+            old_price, old_image, old_active = existing[ad_id][:3]
+            if old_price != price:
+                change = {
+                    "id": ad_id,
+                    "title": row[3],
+                    "link": row[5],
+                    "make": row[7],
+                    "model": row[8],
+                    "old_price": old_price,
+                    "new_price": price,
+                }
+                result["price_changes"].append(change)
+                # Scădere reală (0 = preț necunoscut, nu contează)
+                if old_price and price and price < old_price:
+                    result["price_drops"].append(change)
+            if old_price != price or not old_active or (image is not None and image != old_image):
+                result["updated"] += 1
+            else:
+                result["unchanged"] += 1
+
+    @staticmethod
+    def _apply_market_changes(cursor, rows: List[tuple], existing: Dict):
+        """Delte pentru market_stats: starea de după upsert minus cea de dinainte (dacă era activ)"""
+        added, removed = [], []
+        for row in rows:
+            ad_id, price, year, km = row[0], row[4], row[9], row[10]
+            if ad_id not in existing:
+                added.append((row[15], row[16], year, km, price))
+                continue
+            old_price, _, old_active, make_norm, model_norm, old_year, old_km = existing[ad_id]
+            # La conflict, marca/modelul rămân cele vechi, iar an/km sunt completate cu COALESCE
+            new_item = (make_norm, model_norm, year if year is not None else old_year,
+                        km if km is not None else old_km, price)
+            old_item = (make_norm, model_norm, old_year, old_km, old_price) if old_active else None
+            if new_item != old_item:
+                added.append(new_item)
+                if old_item:
+                    removed.append(old_item)
+        apply_market_deltas(cursor, added, removed)
+
+    def _score_deals(self, cursor, rows: List[tuple], existing: Dict):
+        """deal_score pentru anunțurile noi / cu preț schimbat, cu modelul deja potrivit (fără re-fit)"""
+        by_model = {}
+        for row in rows:
+            old = existing.get(row[0])
+            year = row[9] if row[9] is not None or not old else old[5]
+            km = row[10] if row[10] is not None or not old else old[6]
+            # La conflict marca/modelul rămân cele vechi
+            key = (old[3], old[4]) if old else (row[15], row[16])
+            by_model.setdefault(key, []).append((row[0], year, km, row[4]))
+
+        updates = []
+        for (make_norm, model_norm), ads in by_model.items():
+            model = self._cached_price_model(cursor, make_norm, model_norm)
+            if not model:
+                continue
+            ids, years, kms, prices = zip(*ads)
+            scores = deal_scores(model, years, kms, prices)
+            updates.extend((None if score != score else round(score, 4), ad_id)
+                           for ad_id, score in zip(ids, scores.tolist()))
+        cursor.executemany("UPDATE ads SET deal_score = ? WHERE id = ?", updates)
+
+    def _cached_price_model(self, cursor, make_norm: str, model_norm: str) -> Optional[Dict]:
+        key = (make_norm, model_norm)
+        cached = self._price_models.get(key)
+        if cached and time.time() - cached[0] < self.PRICE_MODEL_CACHE_TTL:
+            return cached[1]
+        cursor.execute(
+            "SELECT model_json FROM price_models WHERE make_norm = ? AND model_norm = ?", key
+        )
+        row = cursor.fetchone()
+        model = json.loads(row[0]) if row else None
+        self._price_models[key] = (time.time(), model)
+        return model
+
+    def get_price_model(self, make: str, model: str) -> Optional[Dict]:
+        """Coeficienții modelului de preț pentru (make, model), None dacă nu a fost potrivit"""
+        with self.db.cursor() as cursor:
+            return self._cached_price_model(cursor, normalize_ad_make(make), normalize_ad_text(model))
+
+    def refit_price_models(self) -> int:
+        """Re-potrivește toate modelele de preț și recalculează deal_score (batch, din crawler)"""
+        with self.db.transaction() as cursor:
+            fitted = fit_all_price_models(cursor)
+        self._price_models = {}
+        return fitted
+
+    def _append_price_history(self, cursor, prices: Dict[str, int], observed_at: int):
+        """Adaugă câte o observație (delta față de ultimul preț cunoscut) pentru fiecare anunț"""
+        if not prices:
+            return
+        ids = list(prices)
+        last = {}
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            cursor.execute(f"""
+                SELECT ad_id, MAX(seq), SUM(price_delta)
+                FROM ad_price_history
+                WHERE ad_id IN ({placeholders})
+                GROUP BY ad_id
+            """, batch)
+            for ad_id, seq, price in cursor.fetchall():
+                last[ad_id] = (seq, price)
+
+        history_rows = []
+        for ad_id, price in prices.items():
+            seq, last_price = last.get(ad_id, (-1, 0))
+            if price != last_price:
+                history_rows.append((ad_id, seq + 1, observed_at, price - last_price))
+        cursor.executemany(
+            "INSERT INTO ad_price_history (ad_id, seq, observed_at, price_delta) VALUES (?, ?, ?, ?)",
+            history_rows
+        )
+
+    def get_price_history(self, ad_id: str) -> List[Dict]:
+        """Istoricul decodat: [{observed_at, price}] în ordine cronologică"""
+        with self.db.cursor() as cursor:
+            cursor.execute("""
+                SELECT observed_at, price_delta FROM ad_price_history
+                WHERE ad_id = ? ORDER BY seq
+            """, (ad_id,))
+            rows = cursor.fetchall()
+        history = []
+        price = 0
+        for observed_at, delta in rows:
+            price += delta
+            history.append({"observed_at": observed_at, "price": price})
+        return history
+
+    def get_price_drops(self, make: str = None, model: str = None, hours: int = 24,
+                        limit: int = 50) -> List[Dict]:
+        """Scăderile de preț din ultimele `hours` ore, cele mai mari (procentual) primele"""
+        since = int(time.time()) - int(hours) * 3600
+        query = """
+            SELECT a.id, a.title, a.link, a.image, a.make, a.model, a.year, a.km, a.source,
+                   h.observed_at,
+                   (SELECT SUM(p.price_delta) FROM ad_price_history p
+                    WHERE p.ad_id = h.ad_id AND p.seq <= h.seq) AS new_price,
+                   h.price_delta
+            FROM ad_price_history h
+            JOIN ads a ON a.id = h.ad_id
+            WHERE h.price_delta < 0 AND h.observed_at >= ? AND a.active = 1
+        """
+        params = [since]
         if make:
-            query += " AND make LIKE ?"
-            params.append(f"%{make}%")
+            query += " AND a.make_norm = ?"
+            params.append(normalize_ad_make(make))
         if model:
-            # Simplu fuzzy matching
-            query += " AND (model LIKE ? OR title LIKE ?)"
-            params.append(f"%{model}%")
-            params.append(f"%{model}%")
+            query += " AND a.model_norm = ?"
+            params.append(normalize_ad_text(model))
+
+        with self.db.cursor(row_factory=sqlite3.Row) as cursor:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+
+        drops = []
+        for r in rows:
+            d = dict(r)
+            delta = d.pop("price_delta")
+            d["old_price"] = d["new_price"] - delta
+            d["drop_pct"] = round(-delta * 100 / d["old_price"], 1) if d["old_price"] else None
+            d["subsource"] = SOURCE_LABELS.get(d.get("source"), d.get("source"))
+            drops.append(d)
+        drops.sort(key=lambda d: d["drop_pct"] or 0, reverse=True)
+        return drops[:limit]
+
+    # Coloanele după care search_ads_db poate sorta (sort_by vine din request, nu se interpolează direct)
+    _ADS_SORT_COLUMNS = {"price": "price", "year": "year", "km": "km", "created_at": "created_at",
+                         "last_seen": "last_seen", "deal": "deal_score"}
+    # Coloane care pot lipsi: valorile NULL merg la final indiferent de direcție
+    # (înlocuite cu o santinelă în cheia de sortare, ca paginarea keyset să rămână o simplă comparație)
+    _ADS_NULLABLE_SORT = {"year", "km", "deal_score"}
+    _NULL_SORT_LAST = {"ASC": 2147483647, "DESC": -2147483647}
+
+    def has_ads_fts(self) -> bool:
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ads_fts'")
+            return cursor.fetchone() is not None
+
+    @staticmethod
+    def _fts_phrase(text: str) -> str:
+        """Fraza FTS5 pentru model, căutată în titlu și model ("seria 3" -> {title model} : "seria 3")"""
+        return '{title model} : "' + normalize_ad_text(text).replace('"', '""') + '"'
+
+    def _build_ads_search_query(self, make: str, model: str, min_price=None, max_price=None,
+                                min_year=None, max_year=None, min_km=None, max_km=None, limit=100,
+                                sort_by="price", order="asc", source=None,
+                                model_match="exact", after=None, count=False) -> Tuple[str, list]:
+        """
+        SQL + parametri pentru căutarea în ads.
+        model_match: "exact" (model_norm, prin indexul compus), "fts" (titlu/model prin ads_fts)
+        sau "like" (fallback fără FTS5).
+        after: (cheie de sortare, rowid) al ultimului rând din pagina anterioară (paginare keyset).
+        count: doar COUNT(*) pentru aceleași filtre.
+        """
+        sort_column = self._ADS_SORT_COLUMNS.get(sort_by, "price")
+        direction = "DESC" if str(order).lower() == "desc" else "ASC"
+        sort_key = sort_column
+        if sort_column in self._ADS_NULLABLE_SORT:
+            sort_key = f"COALESCE({sort_column}, {self._NULL_SORT_LAST[direction]})"
+
+        if count:
+            query = "SELECT COUNT(*) FROM ads WHERE active = 1"
+        else:
+            query = f"SELECT {sort_key} AS _sort_key, rowid AS _rowid, * FROM ads WHERE active = 1"
+        params = []
+
+        make_norm = normalize_ad_make(make)
+        model_norm = normalize_ad_text(model)
+        if make_norm:
+            query += " AND make_norm = ?"
+            params.append(make_norm)
+        if model_norm:
+            if model_match == "exact":
+                query += " AND model_norm = ?"
+                params.append(model_norm)
+            elif model_match == "fts":
+                query += " AND rowid IN (SELECT rowid FROM ads_fts WHERE ads_fts MATCH ?)"
+                params.append(self._fts_phrase(model_norm))
+            else:
+                query += " AND (model LIKE ? OR title LIKE ?)"
+                params.append(f"%{model}%")
+                params.append(f"%{model}%")
+
+        if source:
+            query += " AND source = ?"
+            params.append(source)
             
         if min_price:
             query += " AND price >= ?"
@@ -253,40 +877,341 @@ class CarDatabaseOptimizer:
             params.append(max_price)
             
         if min_year:
-            query += " AND year >= ?"
+            query += " AND (year IS NULL OR year >= ?)"
             params.append(min_year)
         if max_year:
-            query += " AND year <= ?"
+            query += " AND (year IS NULL OR year <= ?)"
             params.append(max_year)
-            
+
+        if min_km:
+            query += " AND (km IS NULL OR km >= ?)"
+            params.append(min_km)
         if max_km:
-            query += " AND km <= ?"
+            query += " AND (km IS NULL OR km <= ?)"
             params.append(max_km)
+
+        if count:
+            return query, params
+
+        if after is not None:
+            # Row value: SQLite o transformă în interval pe index (fără OFFSET, cost constant per pagină)
+            query += f" AND ({sort_key}, rowid) {'<' if direction == 'DESC' else '>'} (?, ?)"
+            params.extend(after)
             
-        query += " ORDER BY created_at DESC LIMIT ?"
+        # Departajare pe rowid: ordinea e deterministă și, la sortarea după preț,
+        # vine direct din indexul (active, make_norm, model_norm, price)
+        query += f" ORDER BY {sort_key} {direction}, rowid {direction} LIMIT ?"
         params.append(limit)
-        
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        
+        return query, params
+
+    def search_ads_page(self, make: str, model: str, page_size: int = 24, after=None,
+                        model_match: str = None, with_total: bool = False, **filters) -> Dict:
+        """
+        O pagină de anunțuri din DB (paginare keyset).
+        Modelul se caută întâi exact (model_norm), apoi în titlu prin FTS; varianta folosită
+        e întoarsă în "model_match" și trebuie păstrată pentru paginile următoare.
+        Întoarce results, next (poziția pentru pagina următoare sau None), model_match și total.
+        """
+        if model_match:
+            matches = [model_match]
+        else:
+            matches = ["exact"]
+            if normalize_ad_text(model):
+                matches.append("fts" if self.has_ads_fts() else "like")
+
+        rows = []
+        total = None
+        with self.db.cursor(row_factory=sqlite3.Row) as cursor:
+            for model_match in matches:
+                # Un rând în plus: știm dacă mai există o pagină fără un COUNT separat
+                query, params = self._build_ads_search_query(
+                    make, model, model_match=model_match, after=after, limit=page_size + 1, **filters
+                )
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
+                if rows or after is not None:
+                    break
+            if with_total:
+                query, params = self._build_ads_search_query(make, model, model_match=model_match,
+                                                             count=True, **filters)
+                cursor.execute(query, params)
+                total = cursor.fetchone()[0]
+
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
         ads = []
         for r in rows:
             d = dict(r)
-            # Format price for UI compatibility
-            d["price"] = f"{d['price']} €"
+            d.pop("_sort_key")
+            d.pop("_rowid")
+            # Preț numeric, ca la rezultatele live (UI-ul sortează numeric)
+            d["price"] = d["price"] or 0
+            d["subsource"] = SOURCE_LABELS.get(d.get("source"), d.get("source"))
             ads.append(d)
-            
-        conn.close()
-        return ads
+
+        return {
+            "results": ads,
+            "next": (rows[-1]["_sort_key"], rows[-1]["_rowid"]) if has_more else None,
+            "model_match": model_match,
+            "total": total,
+        }
+
+    def search_ads_db(self, make: str, model: str, min_price=None, max_price=None, 
+                     min_year=None, max_year=None, min_km=None, max_km=None, limit=100,
+                     sort_by="price", order="asc", source=None) -> List[Dict]:
+        """
+        Caută anunțuri în baza de date locală (alimentată de crawler).
+        Ca la căutarea live, anunțurile fără an/km trec de filtrele pe an/km.
+        """
+        return self.search_ads_page(
+            make, model, page_size=limit,
+            min_price=min_price, max_price=max_price, min_year=min_year, max_year=max_year,
+            min_km=min_km, max_km=max_km, sort_by=sort_by, order=order, source=source
+        )["results"]
+
+    def refresh_market_stats(self) -> int:
+        """Recalculează market_stats din toate anunțurile active (ex. după deactivate_stale_ads)"""
+        with self.db.transaction() as cursor:
+            return rebuild_market_stats(cursor)
+
+    # Cât timp rămân în ad_changes schimbările confirmate de toți abonații
+    AD_CHANGES_RETENTION_HOURS = 72
+
+    def get_ad_changes(self, subscriber: str, limit: int = 1000, ops: Optional[List[str]] = None) -> Dict:
+        """
+        Schimbările din ads de după offset-ul abonatului (în ordinea seq). Offset-ul nu avansează
+        singur: abonatul apelează commit_ad_changes(subscriber, result["last_seq"]) după procesare.
+        """
+        with self.db.transaction() as cursor:
+            offset = subscriber_offset(cursor, subscriber)
+            changes = read_changes(cursor, offset, limit, ops)
+        return {
+            "changes": changes,
+            "last_seq": changes[-1]["seq"] if changes else offset,
+            "has_more": len(changes) == limit,
+        }
+
+    def commit_ad_changes(self, subscriber: str, seq: int):
+        with self.db.transaction() as cursor:
+            commit_offset(cursor, subscriber, seq)
+
+    def prune_ad_changes(self, keep_hours: int = None) -> int:
+        """Curăță jurnalul de schimbările procesate de toți abonații (din crawler, o dată pe ciclu)"""
+        keep_hours = self.AD_CHANGES_RETENTION_HOURS if keep_hours is None else keep_hours
+        with self.db.transaction() as cursor:
+            return prune_changes(cursor, keep_hours * 3600)
+
+    _CRAWL_TARGET_COLUMNS = ("make_norm", "model_norm", "make", "model", "search_count", "alert_count",
+                             "churn_rate", "last_crawled_at", "last_changes", "last_full_crawl_at", "next_crawl_at",
+                             "leased_by", "lease_expires_at")
+
+    def seed_crawl_targets(self, defaults: Iterable[Dict] = (), max_search_targets: int = None) -> int:
+        """
+        Adaugă / actualizează țintele crawler-ului: `defaults`, modelele cu alerte și cele mai
+        căutate modele din search_stats. Churn-ul și programarea țintelor existente rămân neatinse;
+        numele de afișare e cel de la prima adăugare (defaults și alertele au prioritate).
+        Întoarce numărul de ținte.
+        """
+        max_search_targets = CRAWL_MAX_SEARCH_TARGETS if max_search_targets is None else max_search_targets
+        with self.db.transaction() as cursor:
+            alerts = cursor.execute("SELECT make, model, COUNT(*) FROM alerts GROUP BY make, model").fetchall()
+            searches = cursor.execute("""
+                SELECT make, model, search_count FROM search_stats
+                ORDER BY search_count DESC, last_searched DESC
+                LIMIT ?
+            """, (max_search_targets,)).fetchall()
+
+            targets = {}
+
+            def add(make, model, searched=0, alerted=0, formatted=False):
+                make_norm, model_norm = normalize_ad_make(make), normalize_ad_text(model)
+                if not make_norm or not model_norm:
+                    return
+                target = targets.setdefault((make_norm, model_norm), {
+                    "make": self.format_brand_name(make) if formatted else make,
+                    "model": self.format_model_name(model) if formatted else model,
+                    "search_count": 0,
+                    "alert_count": 0,
+                })
+                target["search_count"] += searched
+                target["alert_count"] += alerted
+
+            for target in defaults:
+                add(target["make"], target["model"])
+            for make, model, count in alerts:
+                add(make, model, alerted=count)
+            for make, model, count in searches:
+                add(make, model, searched=count, formatted=True)
+
+            cursor.execute("UPDATE crawl_targets SET search_count = 0, alert_count = 0")
+            cursor.executemany("""
+                INSERT INTO crawl_targets (make_norm, model_norm, make, model, search_count, alert_count)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(make_norm, model_norm) DO UPDATE SET
+                    search_count = excluded.search_count,
+                    alert_count = excluded.alert_count
+            """, [(make_norm, model_norm, t["make"], t["model"], t["search_count"], t["alert_count"])
+                  for (make_norm, model_norm), t in targets.items()])
+            return cursor.execute("SELECT COUNT(*) FROM crawl_targets").fetchone()[0]
+
+    def get_crawl_targets(self) -> List[Dict]:
+        with self.db.cursor() as cursor:
+            cursor.execute(f"SELECT {', '.join(self._CRAWL_TARGET_COLUMNS)} FROM crawl_targets ORDER BY next_crawl_at")
+            return [dict(zip(self._CRAWL_TARGET_COLUMNS, row)) for row in cursor.fetchall()]
+
+    def get_crawl_target(self, make_norm: str, model_norm: str) -> Optional[Dict]:
+        with self.db.cursor() as cursor:
+            row = cursor.execute(
+                f"SELECT {', '.join(self._CRAWL_TARGET_COLUMNS)} FROM crawl_targets WHERE make_norm = ? AND model_norm = ?",
+                (make_norm, model_norm)
+            ).fetchone()
+        return dict(zip(self._CRAWL_TARGET_COLUMNS, row)) if row else None
+
+    def claim_crawl_target(self, make_norm: str, model_norm: str, owner: str, ttl_seconds: int) -> bool:
+        """
+        Ia (sau reînnoiește) lease-ul pe o țintă scadentă. Eșuează dacă ținta a fost între timp
+        parcursă și re-programată, sau dacă alt proces are un lease neexpirat pe ea.
+        """
+        with self.db.transaction() as cursor:
+            cursor.execute("""
+                UPDATE crawl_targets
+                SET leased_by = ?, lease_expires_at = CAST(strftime('%s', 'now') AS INTEGER) + ?
+                WHERE make_norm = ? AND model_norm = ?
+                  AND next_crawl_at <= CAST(strftime('%s', 'now') AS INTEGER)
+                  AND (leased_by IS NULL OR leased_by = ?
+                       OR lease_expires_at < CAST(strftime('%s', 'now') AS INTEGER))
+            """, (owner, ttl_seconds, make_norm, model_norm, owner))
+            return cursor.rowcount > 0
+
+    def request_crawl(self, make: str, model: str) -> bool:
+        """
+        Face ținta scadentă acum (next_crawl_at = 0), adăugând-o dacă nu există; crawler-ul o ia
+        la următoarea trecere, cu lease și bugetele per site. Un crawl în curs nu e atins.
+        Întoarce False doar pentru make / model care nu se normalizează la nimic.
+        """
+        make_norm, model_norm = normalize_ad_make(make), normalize_ad_text(model)
+        if not make_norm or not model_norm:
+            return False
+        with self.db.transaction() as cursor:
+            cursor.execute("""
+                INSERT INTO crawl_targets (make_norm, model_norm, make, model)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(make_norm, model_norm) DO UPDATE SET next_crawl_at = 0
+                WHERE crawl_targets.next_crawl_at > 0
+                  AND (crawl_targets.leased_by IS NULL
+                       OR crawl_targets.lease_expires_at < CAST(strftime('%s', 'now') AS INTEGER))
+            """, (make_norm, model_norm, self.format_brand_name(make), self.format_model_name(model)))
+        return True
+
+    def get_requested_crawl_targets(self) -> List[Dict]:
+        """Țintele făcute scadente de request_crawl (sau adăugate de seed) și nepreluate de niciun crawler"""
+        with self.db.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT {', '.join(self._CRAWL_TARGET_COLUMNS)} FROM crawl_targets
+                WHERE next_crawl_at = 0
+                  AND (leased_by IS NULL OR lease_expires_at < CAST(strftime('%s', 'now') AS INTEGER))
+            """)
+            return [dict(zip(self._CRAWL_TARGET_COLUMNS, row)) for row in cursor.fetchall()]
+
+    def record_crawl(self, make_norm: str, model_norm: str, changes: Optional[int], started_at: int,
+                     owner: str, full: bool = True) -> Optional[Dict]:
+        """
+        Rezultatul unui crawl: `changes` = anunțuri noi + actualizate (None = crawl eșuat),
+        `full` = parcurgere completă (nu incrementală).
+        Actualizează churn-ul, eliberează lease-ul, programează următorul crawl și întoarce ținta actualizată.
+        Doar procesul care deține lease-ul (`owner`) o poate face; dacă lease-ul a fost pierdut între
+        timp, ținta rămâne neatinsă și e întoarsă așa cum e în DB.
+        """
+        columns = ", ".join(self._CRAWL_TARGET_COLUMNS)
+        with self.db.transaction() as cursor:
+            row = cursor.execute(
+                f"SELECT {columns} FROM crawl_targets WHERE make_norm = ? AND model_norm = ?",
+                (make_norm, model_norm)
+            ).fetchone()
+            if row is None:
+                return None
+            target = dict(zip(self._CRAWL_TARGET_COLUMNS, row))
+            if target["leased_by"] != owner:
+                return target
+            target["leased_by"] = target["lease_expires_at"] = None
+            if changes is None:
+                target["next_crawl_at"] = int(time.time()) + FAILURE_RETRY
+            else:
+                elapsed = started_at - target["last_crawled_at"] if target["last_crawled_at"] else None
+                target["churn_rate"] = update_churn(target["churn_rate"], changes, elapsed)
+                target["last_crawled_at"] = started_at
+                target["last_changes"] = changes
+                if full:
+                    target["last_full_crawl_at"] = started_at
+                target["next_crawl_at"] = int(time.time()) + recrawl_interval(
+                    target["churn_rate"], target["search_count"], target["alert_count"]
+                )
+            cursor.execute("""
+                UPDATE crawl_targets
+                SET churn_rate = ?, last_crawled_at = ?, last_changes = ?, last_full_crawl_at = ?,
+                    next_crawl_at = ?, leased_by = NULL, lease_expires_at = NULL
+                WHERE make_norm = ? AND model_norm = ? AND leased_by = ?
+            """, (target["churn_rate"], target["last_crawled_at"], target["last_changes"],
+                  target["last_full_crawl_at"], target["next_crawl_at"], make_norm, model_norm, owner))
+        return target
+
+    def get_market_stats(self, make: str, model: str) -> Optional[Dict]:
+        """Statisticile de piață materializate pentru un model (None dacă nu există anunțuri)"""
+        with self.db.cursor() as cursor:
+            stats = read_market_stats(cursor, normalize_ad_make(make), normalize_ad_text(model))
+        if stats:
+            stats.update({"make": make.lower(), "model": model.lower()})
+        return stats
+
+    def get_ads_freshness(self, make: str, model: str) -> Dict:
+        """Câte anunțuri active are (make, model) în DB și când a fost văzut ultimul"""
+        with self.db.cursor() as cursor:
+            cursor.execute("""
+                SELECT COUNT(*), MAX(last_seen)
+                FROM ads
+                WHERE active = 1 AND make_norm = ? AND model_norm = ?
+            """, (normalize_ad_make(make), normalize_ad_text(model)))
+            count, last_seen = cursor.fetchone()
+        return {"count": count, "last_seen": last_seen}
+
+    def get_recently_seen_ids(self, ad_ids: List[str], hours: int = 24) -> set:
+        """Care dintre ad_ids sunt active în ads și văzute în ultimele `hours` ore (crawl incremental)"""
+        seen = set()
+        with self.db.cursor() as cursor:
+            for start in range(0, len(ad_ids), 500):
+                batch = ad_ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                cursor.execute(f"""
+                    SELECT id FROM ads
+                    WHERE id IN ({placeholders}) AND active = 1 AND last_seen >= datetime('now', ?)
+                """, [*batch, f"-{int(hours)} hours"])
+                seen.update(row[0] for row in cursor.fetchall())
+        return seen
+
+    def touch_ads_last_seen(self, make: str, model: str, seen_since: int) -> int:
+        """
+        După un crawl incremental oprit devreme: last_seen = acum pentru anunțurile active ale
+        modelului văzute de la `seen_since` (ultima parcurgere completă) încoace, ca
+        deactivate_stale_ads să nu le expire doar pentru că paginile lor n-au mai fost cerute.
+        """
+        with self.db.transaction() as cursor:
+            cursor.execute("""
+                UPDATE ads SET last_seen = CURRENT_TIMESTAMP
+                WHERE active = 1 AND make_norm = ? AND model_norm = ?
+                  AND last_seen >= datetime(?, 'unixepoch')
+            """, (normalize_ad_make(make), normalize_ad_text(model), int(seen_since)))
+            return cursor.rowcount
 
     def deactivate_stale_ads(self, hours_threshold=24):
         """Marchează ca inactive anunțurile care nu au fost văzute recent"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(f"UPDATE ads SET active = 0 WHERE last_seen < datetime('now', '-{hours_threshold} hours')")
-        count = cursor.rowcount
-        conn.commit()
-        conn.close()
+        with self.db.transaction() as cursor:
+            cursor.execute(
+                # active = 1 în condiție: folosește indexul (active, last_seen), nu scanează tabela
+                "UPDATE ads SET active = 0 WHERE active = 1 AND last_seen < datetime('now', ?)",
+                (f"-{int(hours_threshold)} hours",)
+            )
+            count = cursor.rowcount
         return count
 
     
@@ -295,35 +1220,27 @@ class CarDatabaseOptimizer:
                      body_type: str = None, model_variants: List[str] = None,
                      engine_types: List[str] = None):
         """Adaugă un model de mașină în baza de date"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         variants_json = json.dumps(model_variants) if model_variants else None
         engines_json = json.dumps(engine_types) if engine_types else None
-        
-        cursor.execute("""
-            INSERT OR REPLACE INTO car_models 
-            (make, model, model_variants, min_year, max_year, generation, body_type, engine_types, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-        """, (make.lower(), model.lower(), variants_json, min_year, max_year, 
-              generation, body_type, engines_json))
-        
-        conn.commit()
-        conn.close()
+
+        with self.db.transaction() as cursor:
+            cursor.execute("""
+                INSERT OR REPLACE INTO car_models 
+                (make, model, model_variants, min_year, max_year, generation, body_type, engine_types, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """, (make.lower(), model.lower(), variants_json, min_year, max_year, 
+                  generation, body_type, engines_json))
     
     def get_model_info(self, make: str, model: str) -> Optional[Dict]:
         """Obține informațiile despre un model de mașină"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT make, model, model_variants, min_year, max_year, generation, body_type, engine_types
-            FROM car_models 
-            WHERE make = ? AND model = ?
-        """, (make.lower(), model.lower()))
-        
-        result = cursor.fetchone()
-        conn.close()
+        with self.db.cursor() as cursor:
+            cursor.execute("""
+                SELECT make, model, model_variants, min_year, max_year, generation, body_type, engine_types
+                FROM car_models 
+                WHERE make = ? AND model = ?
+            """, (make.lower(), model.lower()))
+
+            result = cursor.fetchone()
         
         if result:
             return {
@@ -351,17 +1268,14 @@ class CarDatabaseOptimizer:
             return generations
         
         # Dacă nu găsim în funcția hardcodată, încercăm din baza de date SQLite
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT generation, min_year, max_year, body_type, engine_types
-            FROM car_models 
-            WHERE make = ? AND model = ?
-        """, (make_normalized, model_normalized))
-        
-        result = cursor.fetchone()
-        conn.close()
+        with self.db.cursor() as cursor:
+            cursor.execute("""
+                SELECT generation, min_year, max_year, body_type, engine_types
+                FROM car_models 
+                WHERE make = ? AND model = ?
+            """, (make_normalized, model_normalized))
+
+            result = cursor.fetchone()
         
         if result and result[0]:  # Dacă există generația
             # Pentru modele cu o singură generație, o returnăm
@@ -528,47 +1442,81 @@ class CarDatabaseOptimizer:
         
         return model_lc
     
+    # Upsert pe (make, model): mediile sunt combinate ponderat cu numărul de valori
+    _UPSERT_SEARCH_STATS_SQL = """
+        INSERT INTO search_stats
+        (make, model, search_count, last_searched, avg_price, avg_year, avg_km,
+         price_samples, year_samples, km_samples)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(make, model) DO UPDATE SET
+            search_count = search_count + excluded.search_count,
+            last_searched = MAX(COALESCE(last_searched, ''), excluded.last_searched),
+            avg_price = CASE WHEN excluded.price_samples > 0 THEN
+                (COALESCE(avg_price, 0) * price_samples + excluded.avg_price * excluded.price_samples)
+                / (price_samples + excluded.price_samples) ELSE avg_price END,
+            avg_year = CASE WHEN excluded.year_samples > 0 THEN
+                (COALESCE(avg_year, 0) * year_samples + excluded.avg_year * excluded.year_samples)
+                / (year_samples + excluded.year_samples) ELSE avg_year END,
+            avg_km = CASE WHEN excluded.km_samples > 0 THEN
+                (COALESCE(avg_km, 0) * km_samples + excluded.avg_km * excluded.km_samples)
+                / (km_samples + excluded.km_samples) ELSE avg_km END,
+            price_samples = price_samples + excluded.price_samples,
+            year_samples = year_samples + excluded.year_samples,
+            km_samples = km_samples + excluded.km_samples
+    """
+
     def update_search_stats(self, make: str, model: str, avg_price: float = None,
                            avg_year: float = None, avg_km: float = None):
-        """Actualizează statisticile de căutare"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT OR REPLACE INTO search_stats 
-            (make, model, search_count, last_searched, avg_price, avg_year, avg_km)
-            VALUES (?, ?, 
-                COALESCE((SELECT search_count FROM search_stats WHERE make = ? AND model = ?), 0) + 1,
-                CURRENT_TIMESTAMP, ?, ?, ?)
-        """, (make.lower(), model.lower(), make.lower(), model.lower(), 
-              avg_price, avg_year, avg_km))
-        
-        conn.commit()
-        conn.close()
+        """Actualizează statisticile de căutare (o căutare, fiecare medie cu pondere 1)"""
+        self.apply_search_stats([{
+            'make': make,
+            'model': model,
+            'search_count': 1,
+            'last_searched': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+            'avg_price': avg_price,
+            'price_samples': 1 if avg_price is not None else 0,
+            'avg_year': avg_year,
+            'year_samples': 1 if avg_year is not None else 0,
+            'avg_km': avg_km,
+            'km_samples': 1 if avg_km is not None else 0,
+        }])
+
+    def apply_search_stats(self, aggregates: List[Dict]):
+        """
+        Scrie un lot de statistici agregate (vezi stats_writer) într-o singură tranzacție.
+        Fiecare element: make, model, search_count, last_searched, avg_* și *_samples.
+        """
+        rows = [
+            (a['make'].lower(), a['model'].lower(), a['search_count'], a['last_searched'],
+             a['avg_price'], a['avg_year'], a['avg_km'],
+             a['price_samples'], a['year_samples'], a['km_samples'])
+            for a in aggregates
+        ]
+        if not rows:
+            return
+        with self.db.transaction() as cursor:
+            cursor.executemany(self._UPSERT_SEARCH_STATS_SQL, rows)
     
     def get_popular_models(self, make: str = None, limit: int = 10) -> List[Dict]:
         """Obține modelele cele mai căutate"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        if make:
-            cursor.execute("""
-                SELECT make, model, search_count, avg_price, avg_year, avg_km
-                FROM search_stats 
-                WHERE make = ?
-                ORDER BY search_count DESC, last_searched DESC
-                LIMIT ?
-            """, (make.lower(), limit))
-        else:
-            cursor.execute("""
-                SELECT make, model, search_count, avg_price, avg_year, avg_km
-                FROM search_stats 
-                ORDER BY search_count DESC, last_searched DESC
-                LIMIT ?
-            """, (limit,))
-        
-        results = cursor.fetchall()
-        conn.close()
+        with self.db.cursor() as cursor:
+            if make:
+                cursor.execute("""
+                    SELECT make, model, search_count, avg_price, avg_year, avg_km
+                    FROM search_stats 
+                    WHERE make = ?
+                    ORDER BY search_count DESC, last_searched DESC
+                    LIMIT ?
+                """, (make.lower(), limit))
+            else:
+                cursor.execute("""
+                    SELECT make, model, search_count, avg_price, avg_year, avg_km
+                    FROM search_stats 
+                    ORDER BY search_count DESC, last_searched DESC
+                    LIMIT ?
+                """, (limit,))
+
+            results = cursor.fetchall()
         
         return [
             {
@@ -584,17 +1532,14 @@ class CarDatabaseOptimizer:
 
     def get_model_stats(self, make: str, model: str) -> Optional[Dict]:
         """Obține statistici pentru un model specific"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT make, model, search_count, avg_price, avg_year, avg_km, last_searched
-            FROM search_stats 
-            WHERE make = ? AND model = ?
-        """, (make.lower(), model.lower()))
-        
-        result = cursor.fetchone()
-        conn.close()
+        with self.db.cursor() as cursor:
+            cursor.execute("""
+                SELECT make, model, search_count, avg_price, avg_year, avg_km, last_searched
+                FROM search_stats 
+                WHERE make = ? AND model = ?
+            """, (make.lower(), model.lower()))
+
+            result = cursor.fetchone()
         
         if result:
             return {
@@ -656,19 +1601,14 @@ class CarDatabaseOptimizer:
 
     def add_alert(self, user_email: str, make: str, model: str, max_price: int):
         """Adaugă o alertă nouă în baza de date"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO alerts (user_email, make, model, max_price, last_checked)
-            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-        """, (user_email, make, model, max_price))
-        
-        # Get the ID of the new row
-        alert_id = cursor.lastrowid
-        
-        conn.commit()
-        conn.close()
+        with self.db.transaction() as cursor:
+            cursor.execute("""
+                INSERT INTO alerts (user_email, make, model, max_price, last_checked)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """, (user_email, make, model, max_price))
+
+            # Get the ID of the new row
+            alert_id = cursor.lastrowid
         
         return {
             "id": alert_id,
@@ -678,44 +1618,105 @@ class CarDatabaseOptimizer:
             "max_price": max_price
         }
 
+    def get_alerts_version(self) -> Tuple[int, Optional[int]]:
+        """(număr, ID maxim) pentru alerts: se schimbă la orice adăugare sau ștergere"""
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*), MAX(id) FROM alerts")
+            return tuple(cursor.fetchone())
+
+    def get_alert_candidates(self, alert: Dict, limit: int = 100) -> List[Dict]:
+        """
+        Anunțurile active care se potrivesc alertei, noi sau schimbate după last_checked și încă
+        netrimise (altfel, peste `limit` candidați, aceleași anunțuri ar reveni la fiecare verificare)
+        """
+        with self.db.cursor(row_factory=sqlite3.Row) as cursor:
+            cursor.execute("""
+                SELECT id, title, link, image, make, model, price, year, km
+                FROM ads
+                WHERE active = 1 AND make_norm = ? AND model_norm = ?
+                  AND price > 0 AND price <= ?
+                  AND updated_at > COALESCE(?, '')
+                  AND NOT EXISTS (
+                      SELECT 1 FROM alert_notified
+                      WHERE alert_notified.alert_id = ? AND alert_notified.ad_id = ads.id
+                  )
+                ORDER BY price
+                LIMIT ?
+            """, (normalize_ad_make(alert["make"]), normalize_ad_text(alert["model"]),
+                  alert["max_price"] or 0, alert.get("last_checked"), alert["id"], limit))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def claim_alert_notifications(self, alert_id: int, ad_ids: List[str], limit: int = None,
+                                  checked_at: str = None) -> List[str]:
+        """
+        Din ad_ids, primele `limit` anunțuri încă netrimise pentru alertă, marcate acum ca trimise.
+        Cu checked_at, last_checked avansează în aceeași tranzacție, dar doar dacă n-a rămas
+        niciun anunț netrimis (tăiat de limit), ca acesta să fie găsit la verificarea următoare.
+        """
+        ad_ids = list(dict.fromkeys(ad_ids))
+        with self.db.transaction() as cursor:
+            bloom = self._alert_blooms.get(alert_id)
+            if bloom is None or bloom.full:
+                bloom = self._alert_blooms[alert_id] = load_bloom(cursor, alert_id)
+            # Negativele Bloom sunt sigur netrimise; doar pozitivele merg la verificarea exactă
+            maybe_seen = [ad_id for ad_id in ad_ids if ad_id in bloom]
+            seen = notified_subset(cursor, alert_id, maybe_seen) if maybe_seen else set()
+            unseen = [ad_id for ad_id in ad_ids if ad_id not in seen]
+            claimed = claim(cursor, alert_id, unseen[:limit] if limit else unseen)
+            if checked_at and len(claimed) == len(unseen):
+                cursor.execute(
+                    "UPDATE alerts SET last_checked = ? WHERE id = ? AND (last_checked IS NULL OR last_checked < ?)",
+                    (checked_at, alert_id, checked_at)
+                )
+        for ad_id in claimed:
+            bloom.add(ad_id)
+        return claimed
+
+    def acquire_lease(self, name: str, owner: str, ttl_seconds: int) -> bool:
+        """Preia sau reînnoiește lease-ul; reușește dacă e liber, expirat sau deja al lui owner"""
+        with self.db.transaction() as cursor:
+            cursor.execute("""
+                INSERT INTO scheduler_leases (name, owner, expires_at)
+                VALUES (?, ?, CAST(strftime('%s', 'now') AS INTEGER) + ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    owner = excluded.owner,
+                    expires_at = excluded.expires_at
+                WHERE scheduler_leases.owner = excluded.owner
+                   OR scheduler_leases.expires_at < CAST(strftime('%s', 'now') AS INTEGER)
+            """, (name, owner, ttl_seconds))
+            return cursor.rowcount > 0
+
+    def release_lease(self, name: str, owner: str):
+        with self.db.transaction() as cursor:
+            cursor.execute("DELETE FROM scheduler_leases WHERE name = ? AND owner = ?", (name, owner))
+
     def get_alerts(self):
         """Obține toate alertele active"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Pentru a accesa coloanele prin nume
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM alerts")
-        rows = cursor.fetchall()
-        
-        alerts = []
-        for row in rows:
-            alerts.append(dict(row))
-            
-        conn.close()
+        with self.db.cursor(row_factory=sqlite3.Row) as cursor:
+            cursor.execute("SELECT * FROM alerts")
+            rows = cursor.fetchall()
+
+            alerts = []
+            for row in rows:
+                alerts.append(dict(row))
         return alerts
 
     def get_all_brands(self) -> List[str]:
         """Obține toate mărcile distincte din baza de date"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT DISTINCT make FROM car_models ORDER BY make ASC")
-        rows = cursor.fetchall()
-        
-        brands = [self.format_brand_name(row[0]) for row in rows if row[0]]
-        conn.close()
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT make FROM car_models ORDER BY make ASC")
+            rows = cursor.fetchall()
+
+            brands = [self.format_brand_name(row[0]) for row in rows if row[0]]
         return sorted(list(set(brands)))
 
     def get_models(self, make: str) -> List[str]:
         """Obține toate modelele pentru o marcă din baza de date"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT DISTINCT model FROM car_models WHERE make = ? ORDER BY model ASC", (make.lower(),))
-        rows = cursor.fetchall()
-        
-        models = [self.format_model_name(row[0]) for row in rows if row[0]]
-        conn.close()
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT model FROM car_models WHERE make = ? ORDER BY model ASC", (make.lower(),))
+            rows = cursor.fetchall()
+
+            models = [self.format_model_name(row[0]) for row in rows if row[0]]
         return sorted(list(set(models)))
 
 
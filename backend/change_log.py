@@ -0,0 +1,132 @@
+"""
+Change Log Module
+Jurnal append-only al schimbărilor din ads (CDC), completat de trigger-e SQLite, deci prinde
+orice scriere: upsert (anunț nou, preț schimbat, reactivare), deactivate_stale_ads, delete_ad.
+Fiecare schimbare are un seq strict crescător (AUTOINCREMENT, nerefolosit nici după ștergeri).
+
+Consumatorii (alerte, statistici, invalidare de cache, export) au fiecare un offset în
+change_subscribers: citesc schimbările de după offset, le procesează, apoi confirmă ultimul seq.
+Confirmarea după procesare înseamnă livrare at-least-once.
+"""
+
+from typing import Dict, List, Optional
+
+OP_INSERT = "insert"
+OP_PRICE = "price"            # preț schimbat
+OP_UPDATE = "update"          # titlu / imagine / an / km schimbate
+OP_DEACTIVATE = "deactivate"
+OP_REACTIVATE = "reactivate"
+OP_DELETE = "delete"
+
+_NOW = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+CHANGE_LOG_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS ad_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        ad_id TEXT NOT NULL,
+        op TEXT NOT NULL,
+        make_norm TEXT,
+        model_norm TEXT,
+        old_price INTEGER,
+        new_price INTEGER,
+        changed_at INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS change_subscribers (
+        name TEXT PRIMARY KEY,
+        last_seq INTEGER NOT NULL DEFAULT 0,
+        updated_at INTEGER
+    )
+    """,
+]
+
+# Upsert-ul rescrie toate coloanele la fiecare trecere (last_seen), deci fiecare trigger
+# de UPDATE are WHEN pe schimbarea reală, altfel jurnalul ar primi un rând per anunț văzut.
+CHANGE_LOG_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ad_changes_insert AFTER INSERT ON ads BEGIN
+        INSERT INTO ad_changes (ad_id, op, make_norm, model_norm, old_price, new_price, changed_at)
+        VALUES (new.id, '{OP_INSERT}', new.make_norm, new.model_norm, NULL, new.price, {_NOW});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ad_changes_price AFTER UPDATE OF price ON ads
+    WHEN old.price IS NOT new.price BEGIN
+        INSERT INTO ad_changes (ad_id, op, make_norm, model_norm, old_price, new_price, changed_at)
+        VALUES (new.id, '{OP_PRICE}', new.make_norm, new.model_norm, old.price, new.price, {_NOW});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ad_changes_update AFTER UPDATE OF title, image, year, km ON ads
+    WHEN old.title IS NOT new.title OR old.image IS NOT new.image
+      OR old.year IS NOT new.year OR old.km IS NOT new.km BEGIN
+        INSERT INTO ad_changes (ad_id, op, make_norm, model_norm, old_price, new_price, changed_at)
+        VALUES (new.id, '{OP_UPDATE}', new.make_norm, new.model_norm, old.price, new.price, {_NOW});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ad_changes_active AFTER UPDATE OF active ON ads
+    WHEN old.active IS NOT new.active BEGIN
+        INSERT INTO ad_changes (ad_id, op, make_norm, model_norm, old_price, new_price, changed_at)
+        VALUES (new.id, CASE WHEN new.active THEN '{OP_REACTIVATE}' ELSE '{OP_DEACTIVATE}' END,
+                new.make_norm, new.model_norm, old.price, new.price, {_NOW});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ad_changes_delete AFTER DELETE ON ads BEGIN
+        INSERT INTO ad_changes (ad_id, op, make_norm, model_norm, old_price, new_price, changed_at)
+        VALUES (old.id, '{OP_DELETE}', old.make_norm, old.model_norm, old.price, NULL, {_NOW});
+    END
+    """,
+]
+
+_CHANGE_COLUMNS = ("seq", "ad_id", "op", "make_norm", "model_norm", "old_price", "new_price", "changed_at")
+
+
+def subscriber_offset(cursor, subscriber: str) -> int:
+    """Ultimul seq confirmat; un abonat nou pornește de la capătul curent al jurnalului"""
+    row = cursor.execute("SELECT last_seq FROM change_subscribers WHERE name = ?", (subscriber,)).fetchone()
+    if row is not None:
+        return row[0]
+    head = cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM ad_changes").fetchone()[0]
+    cursor.execute(
+        f"INSERT OR IGNORE INTO change_subscribers (name, last_seq, updated_at) VALUES (?, ?, {_NOW})",
+        (subscriber, head)
+    )
+    return head
+
+
+def read_changes(cursor, after_seq: int, limit: int = 1000, ops: Optional[List[str]] = None) -> List[Dict]:
+    query = f"SELECT {', '.join(_CHANGE_COLUMNS)} FROM ad_changes WHERE seq > ?"
+    params = [after_seq]
+    if ops:
+        query += f" AND op IN ({','.join('?' * len(ops))})"
+        params.extend(ops)
+    query += " ORDER BY seq LIMIT ?"
+    params.append(limit)
+    return [dict(zip(_CHANGE_COLUMNS, row)) for row in cursor.execute(query, params)]
+
+
+def commit_offset(cursor, subscriber: str, seq: int):
+    """Avansează offset-ul (niciodată înapoi: o confirmare întârziată nu re-livrează nimic)"""
+    cursor.execute(f"""
+        INSERT INTO change_subscribers (name, last_seq, updated_at) VALUES (?, ?, {_NOW})
+        ON CONFLICT(name) DO UPDATE SET
+            last_seq = MAX(last_seq, excluded.last_seq),
+            updated_at = excluded.updated_at
+    """, (subscriber, seq))
+
+
+def prune_changes(cursor, keep_seconds: int) -> int:
+    """
+    Șterge schimbările confirmate de toți abonații (toate, dacă nu există abonați)
+    și mai vechi de keep_seconds (păstrate un timp ca un abonat resetat să poată relua).
+    """
+    cursor.execute(f"""
+        DELETE FROM ad_changes
+        WHERE seq <= COALESCE((SELECT MIN(last_seq) FROM change_subscribers), seq)
+          AND changed_at < {_NOW} - ?
+    """, (keep_seconds,))
+    return cursor.rowcount
@@ -0,0 +1,166 @@
+"""
+Crawl Scheduler
+Țintele crawler-ului (make/model) stau în tabela crawl_targets, alimentată din popularitatea
+căutărilor (search_stats) și din alertele active. Fiecare țintă are propria frecvență:
+- churn_rate = anunțuri noi / schimbate pe oră, medie exponențială peste crawl-urile observate
+- intervalul de recrawl ≈ timpul în care apar TARGET_CHANGES_PER_CRAWL schimbări,
+  scurtat pentru modelele căutate des sau cu alerte, limitat la [MIN_RECRAWL, MAX_RECRAWL]
+Crawler-ul ia mereu ținta cu next_crawl_at cel mai mic dintr-un heap (CrawlQueue).
+Mai multe procese crawler (și mașini care împart volumul DB) pot rula în paralel: o țintă
+scadentă e parcursă doar de procesul care i-a luat lease-ul (leased_by / lease_expires_at),
+reînnoit cât durează crawl-ul; lease-ul unui proces căzut expiră după CRAWL_LEASE_TTL.
+API-ul nu crawl-ează singur: cere un crawl făcând ținta scadentă (request_crawl, next_crawl_at = 0),
+iar crawler-ul preia țintele cerute la fiecare trecere prin buclă.
+
+Crawl incremental: sursele sunt cerute cu cele mai noi anunțuri primele, iar paginarea se
+oprește după INCREMENTAL_STOP_AFTER anunțuri consecutive deja în ads și văzute recent
+(IncrementalStop); last_seen pentru restul e reîmprospătat în bloc. O dată la
+FULL_CRAWL_INTERVAL ținta e parcursă complet, ca anunțurile dispărute să poată expira.
+"""
+
+import heapq
+import math
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+DEFAULT_RECRAWL = 600            # secunde; ținte fără istoric (ca vechiul ciclu de 10 minute)
+MIN_RECRAWL = 300
+MAX_RECRAWL = 6 * 3600           # sub pragul de 24h din deactivate_stale_ads
+ALERT_MAX_RECRAWL = 1800         # țintele cu alerte nu așteaptă mai mult de atât
+FAILURE_RETRY = 900              # după un crawl eșuat
+TARGET_CHANGES_PER_CRAWL = 5
+CHURN_SMOOTHING = 0.3            # ponderea ultimei observații în medie
+CRAWL_MAX_SEARCH_TARGETS = 50    # câte modele populare din search_stats devin ținte
+FULL_CRAWL_INTERVAL = 12 * 3600  # parcurgere completă (fără oprire la anunțuri cunoscute)
+INCREMENTAL_STOP_AFTER = 20      # anunțuri consecutive deja cunoscute după care paginarea se oprește
+RECENTLY_SEEN_HOURS = 24
+CRAWL_LEASE_TTL = 900            # secunde; reînnoit la fiecare treime cât timp crawl-ul rulează
+
+CRAWL_TARGETS_TABLE = """
+    CREATE TABLE IF NOT EXISTS crawl_targets (
+        make_norm TEXT NOT NULL,
+        model_norm TEXT NOT NULL,
+        make TEXT NOT NULL,
+        model TEXT NOT NULL,
+        search_count INTEGER NOT NULL DEFAULT 0,
+        alert_count INTEGER NOT NULL DEFAULT 0,
+        churn_rate REAL,
+        last_crawled_at INTEGER,
+        last_changes INTEGER,
+        last_full_crawl_at INTEGER,
+        next_crawl_at INTEGER NOT NULL DEFAULT 0,
+        leased_by TEXT,
+        lease_expires_at INTEGER,
+        PRIMARY KEY (make_norm, model_norm)
+    ) WITHOUT ROWID
+"""
+
+
+def update_churn(previous: Optional[float], changes: int, elapsed_seconds: Optional[float]) -> Optional[float]:
+    """
+    Noua estimare a churn-ului (schimbări / oră). Primul crawl nu are interval de referință
+    (și prinde tot stocul existent ca „nou”), deci nu schimbă estimarea.
+    """
+    if not elapsed_seconds or elapsed_seconds <= 0:
+        return previous
+    observed = changes / max(elapsed_seconds / 3600, MIN_RECRAWL / 3600)
+    if previous is None:
+        return observed
+    return CHURN_SMOOTHING * observed + (1 - CHURN_SMOOTHING) * previous
+
+
+def needs_full_crawl(target: Dict, now: float) -> bool:
+    last_full = target.get("last_full_crawl_at")
+    return not last_full or now - last_full >= FULL_CRAWL_INTERVAL
+
+
+def recrawl_interval(churn_rate: Optional[float], search_count: int = 0, alert_count: int = 0) -> int:
+    if churn_rate is None:
+        interval = DEFAULT_RECRAWL
+    elif churn_rate <= 0:
+        interval = MAX_RECRAWL
+    else:
+        interval = TARGET_CHANGES_PER_CRAWL / churn_rate * 3600
+    # Cererea contează și ea: un model căutat des e verificat mai des la același churn
+    interval /= 1 + math.log1p(search_count or 0) / 2
+    ceiling = ALERT_MAX_RECRAWL if alert_count else MAX_RECRAWL
+    return int(min(max(interval, MIN_RECRAWL), ceiling))
+
+
+class IncrementalStop:
+    """
+    Callback `stop_paging` pentru scrapere (câte o instanță per sursă): primește anunțurile
+    fiecărei pagini, în ordinea listării, și întoarce True când ultimele `stop_after` anunțuri
+    consecutive sunt deja în ads cu last_seen recent. `lookup(ids)` -> setul celor cunoscute.
+    """
+
+    def __init__(self, lookup: Callable[[List[str]], Awaitable[set]], stop_after: int = INCREMENTAL_STOP_AFTER):
+        self.lookup = lookup
+        self.stop_after = stop_after
+        self.run = 0
+        self.pages = 0
+        self.stopped = False
+
+    async def __call__(self, page_ads: List[Dict]) -> bool:
+        self.pages += 1
+        ids = [ad["id"] for ad in page_ads if ad.get("id")]
+        known = await self.lookup(ids) if ids else set()
+        for ad_id in ids:
+            self.run = self.run + 1 if ad_id in known else 0
+        self.stopped = self.run >= self.stop_after
+        return self.stopped
+
+
+class CrawlQueue:
+    """Heap de ținte după next_crawl_at; intrările vechi (țintă re-programată) sunt ignorate la pop"""
+
+    def __init__(self):
+        self._heap = []
+        self._targets: Dict[tuple, Dict] = {}
+
+    @staticmethod
+    def _key(target: Dict) -> tuple:
+        return target["make_norm"], target["model_norm"]
+
+    def load(self, targets: Iterable[Dict]):
+        self._targets = {self._key(t): t for t in targets}
+        self._heap = [(t["next_crawl_at"], key) for key, t in self._targets.items()]
+        heapq.heapify(self._heap)
+
+    def push(self, target: Dict):
+        key = self._key(target)
+        current = self._targets.get(key)
+        self._targets[key] = target
+        # Aceeași programare deja în heap (ținta re-cerută cât așteaptă un slot): fără duplicat
+        if current is None or current["next_crawl_at"] != target["next_crawl_at"]:
+            heapq.heappush(self._heap, (target["next_crawl_at"], key))
+
+    def _discard_stale(self):
+        while self._heap:
+            due_at, key = self._heap[0]
+            target = self._targets.get(key)
+            if target is not None and target["next_crawl_at"] == due_at:
+                return
+            heapq.heappop(self._heap)
+
+    def pop_due(self, now: float) -> Optional[Dict]:
+        self._discard_stale()
+        if not self._heap or self._heap[0][0] > now:
+            return None
+        _, key = heapq.heappop(self._heap)
+        return self._targets.pop(key)
+
+    def pop_target(self, target: Dict):
+        """Scoate o țintă din coadă (intrarea ei din heap e ignorată la pop)"""
+        self._targets.pop(self._key(target), None)
+
+    def seconds_until_next(self, now: float) -> Optional[float]:
+        self._discard_stale()
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - now)
+
+    def snapshot(self) -> List[Dict]:
+        return sorted(self._targets.values(), key=lambda t: t["next_crawl_at"])
+
+    def __len__(self) -> int:
+        return len(self._targets)
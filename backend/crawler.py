@@ -1,8 +1,11 @@
 import asyncio
 import logging
-from functii import search_cars
-from car_database import car_db_optimizer
-import random
+from async_db import async_car_db
+import time
+from ingest import ingest_target
+from crawl_scheduler import CRAWL_LEASE_TTL, INCREMENTAL_STOP_AFTER, CrawlQueue, needs_full_crawl
+from rate_limit import site_budgets
+from scheduler import WORKER_ID
 
 # Configure Logging
 logging.basicConfig(
@@ -10,8 +13,8 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-# Define Targets (Eventually load from DB or config)
-TARGETS = [
+# Initial targets; the rest come from search_stats and alerts (see crawl_scheduler.py)
+SEED_TARGETS = [
     {"make": "BMW", "model": "X6"},
     {"make": "BMW", "model": "Seria 3"},
     {"make": "BMW", "model": "Seria 5"},
@@ -22,149 +25,165 @@ TARGETS = [
     {"make": "Volkswagen", "model": "Golf"},
 ]
 
-async def crawl_target(target):
+RESEED_INTERVAL = 3600       # reload targets from search_stats / alerts
+MAINTENANCE_INTERVAL = 600   # stale ads, market stats, price models, change log
+MAX_IDLE_SLEEP = 60
+# Targets crawled at once by this process; requests are paced by the per-site budgets
+CRAWL_CONCURRENCY = 3
+
+async def crawl_target(target, full=True, budgets=None):
     make = target["make"]
     model = target["model"]
     
-    logging.info(f"🕷️  Crawling {make} {model} (using Unified Scraper Logic)...")
+    mode = "full" if full else "incremental"
+    logging.info(f"🕷️  Crawling {make} {model} ({mode})...")
     
     try:
-        # Use the EXACT same logic as the "Live Scraper" via search_cars
-        # We pass a very high max_price to get everything
-        results = await search_cars(
-            make=make,
-            model=model,
-            max_price=10000000, # Effectively no limit
-            site="both",
-            limit=1000, # Fetch deep
-            max_pages=20  # Go deep
-        )
-        
-        count = 0
-        for ad in results:
-            # search_cars returns cleaned, normalized data
-            # Format it for the DB
-            try:
-                # Safe price parsing (search_cars returns int for 'price' usually, or string)
-                price_val = 0
-                raw_price = str(ad.get("price", "0"))
-                # If it contains "EUR", strip it. Ideally search_cars returns int.
-                # Let's handle both.
-                if isinstance(ad.get("price"), int):
-                    price_val = ad.get("price")
-                else: 
-                     # fallback
-                     import re
-                     p_clean = re.sub(r"\D", "", raw_price)
-                     price_val = int(p_clean) if p_clean else 0
-
-                # Emergency Repair Logic
-                is_luxury = any(x in model.lower() for x in ["x6", "x7", "q8", "q7", "gle", "gls", "g-class"])
-                
-                # 1. Price Check: Luxury cars < 15k are flagged logic
-                is_suspicious_price = is_luxury and (0 < price_val < 15000)
-                
-                # 2. Image Check
-                is_missing_image = not ad.get("image") or "no_thumbnail" in str(ad.get("image"))
-
-                # Trigger repair only if image is missing to optimize performance.
-                # If image is missing, we also validate price.
-                if is_missing_image:
-                     logging.info(f"🔧 Attempting repair for: {ad.get('title')} (Price: {price_val})")
-                     try:
-                         import aiohttp
-                         from bs4 import BeautifulSoup
-                         import json as _json_fix
-                         
-                         async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False)) as sess:
-                             async with sess.get(ad.get("link"), timeout=10) as r:
-                                 # GHOST AD CHECK
-                                 # If 404 or redirected to homepage (autovit.ro / olx.ro main page), the ad is GONE.
-                                 if r.status == 404 or len(str(r.url)) < 30: # Simple heuristic for homepage redirect
-                                     logging.info(f"🗑️ Found GHOST AD (404/Redirect): {ad.get('title')}. Deleting...")
-                                     car_db_optimizer.delete_ad(ad.get("id"))
-                                     continue # Skip Upsert
-                                     
-                                 if r.status == 200:
-                                     html = await r.text()
-                                     soup = BeautifulSoup(html, "html.parser")
-                                     
-                                     # ALWAYS Try to Fix Price (if we are here)
-                                     # Try 1: Next Data
-                                     nd = soup.find("script", {"id": "__NEXT_DATA__"})
-                                     if nd and nd.string:
-                                         d = _json_fix.loads(nd.string)
-                                         pp = d.get("props", {}).get("pageProps", {})
-                                         adv = pp.get("advert") or pp.get("data", {}).get("advert")
-                                         if adv:
-                                             p = adv.get("price", {}).get("value")
-                                             if p:
-                                                 new_p = int(p)
-                                                 # Update if new price is better/different and looks valid
-                                                 # For suspicious ones, we take the new price.
-                                                 # For others, we assume deep fetch is more accurate.
-                                                 if new_p > price_val: 
-                                                     price_val = new_p
-                                                     logging.info(f"    ✅ Fixed Price: {price_val}")
-                                     
-                                     # ALWAYS Try to Fix Image (if we are here)
-                                     if is_missing_image:
-                                         og = soup.find("meta", attrs={"property": "og:image"})
-                                         if og and og.get("content"):
-                                             ad["image"] = og.get("content")
-                                             logging.info(f"    ✅ Fixed Image")
-                                         elif not ad.get("image"):
-                                             # Try finding gallery image
-                                             gal = soup.find("img", {"class": "css-1bmvjcs"}) # Common OLX/Autovit class
-                                             if gal:
-                                                  ad["image"] = gal.get("src")
-                     except Exception as e:
-                         logging.warning(f"    ❌ Repair failed: {e}")
-
-                db_ad = {
-                    "source": ad.get("subsource") or ad.get("source", "Unknown"),
-                    "make": make,
-                    "model": model,
-                    "title": ad.get("title"),
-                    "link": ad.get("link"),
-                    "image": ad.get("image"),
-                    "price": price_val,
-                    "year": ad.get("year"),
-                    "km": ad.get("km"),
-                    "id": ad.get("id") 
-                }
-                
-                car_db_optimizer.upsert_ad(db_ad)
-                count += 1
-            except Exception as e:
-                logging.warning(f"Failed to upsert ad: {e}")
+        # Listings stream from the scrapers straight into batched upserts (see ingest.py);
+        # incremental: newest first, stop once the pages are back to ads we already have
+        totals = await ingest_target(make, model, full=full, stop_after_seen=INCREMENTAL_STOP_AFTER,
+                                     budgets=budgets)
+
+        if not full and target.get("last_full_crawl_at"):
+            # The pages we skipped hold ads from the last full pass; keep them from going stale
+            touched = await async_car_db.touch_ads_last_seen(make, model, target["last_full_crawl_at"])
+            totals["touched"] = touched
+            logging.info(f"👀 Refreshed last_seen for {touched} ads not re-downloaded.")
                 
-        logging.info(f"✅ Finished {make} {model}: Saved {count} ads.")
+        logging.info(
+            f"✅ Finished {make} {model}: {totals['inserted']} new, {totals['updated']} updated, "
+            f"{totals['unchanged']} unchanged, {totals['price_changes']} price changes "
+            f"({totals['price_drops']} drops), {totals['deleted']} ghost ads deleted, "
+            f"{totals['skipped']} listings skipped."
+        )
+        return totals
         
     except Exception as e:
         logging.error(f"Error crawling {make} {model}: {e}")
+        return None
+
+async def run_maintenance():
+    # Clean up stale ads
+    cleaned = await async_car_db.deactivate_stale_ads(hours_threshold=24)
+    if cleaned > 0:
+        logging.info(f"🧹 Deactivated {cleaned} stale ads.")
+
+    # Upsert-urile țin market_stats la zi incremental; recalcularea completă scoate și anunțurile dezactivate
+    groups = await async_car_db.refresh_market_stats()
+    logging.info(f"📊 Market stats refreshed ({groups} groups).")
+
+    # Re-fit modele de preț (coeficienți + ads.deal_score pentru sort=deal)
+    fitted = await async_car_db.refit_price_models()
+    logging.info(f"💸 Price models refitted ({fitted} models).")
+
+    pruned = await async_car_db.prune_ad_changes()
+    if pruned:
+        logging.info(f"🧾 Pruned {pruned} processed ad changes.")
+
+async def hold_lease(target):
+    # Renew the target's lease while it is being crawled, so a slow crawl is not picked up twice
+    while True:
+        await asyncio.sleep(CRAWL_LEASE_TTL / 3)
+        if not await async_car_db.claim_crawl_target(target["make_norm"], target["model_norm"],
+                                                     WORKER_ID, CRAWL_LEASE_TTL):
+            logging.warning(f"Lost the crawl lease on {target['make']} {target['model']}.")
+            return
+
+async def run_target(target, budgets):
+    started_at = int(time.time())
+    full = needs_full_crawl(target, started_at)
+    renewal = asyncio.create_task(hold_lease(target))
+    try:
+        totals = await crawl_target(target, full=full, budgets=budgets)
+    finally:
+        renewal.cancel()
+    changes = None if totals is None else totals["inserted"] + totals["updated"]
+    updated = await async_car_db.record_crawl(target["make_norm"], target["model_norm"], changes, started_at,
+                                              WORKER_ID, full=full)
+    if updated:
+        churn = f"{updated['churn_rate']:.1f}/h" if updated["churn_rate"] is not None else "n/a"
+        logging.info(
+            f"🗓️  {target['make']} {target['model']}: churn {churn}, "
+            f"next crawl in {updated['next_crawl_at'] - int(time.time())}s."
+        )
+    return updated
+
+async def claim_due_targets(queue, slots):
+    """Pops due targets and leases them in the DB; targets owned or already crawled elsewhere are rescheduled"""
+    claimed = []
+    while len(claimed) < slots:
+        target = queue.pop_due(time.time())
+        if target is None:
+            break
+        if await async_car_db.claim_crawl_target(target["make_norm"], target["model_norm"],
+                                                 WORKER_ID, CRAWL_LEASE_TTL):
+            claimed.append(target)
+            continue
+        fresh = await async_car_db.get_crawl_target(target["make_norm"], target["model_norm"])
+        if fresh:
+            # Leased by another worker: look again once its lease could have expired
+            fresh["next_crawl_at"] = max(fresh["next_crawl_at"], fresh["lease_expires_at"] or 0)
+            queue.push(fresh)
+    return claimed
 
 async def run_crawler():
-    logging.info("🚀 Starting Search Engine Crawler (Unified Mode)...")
+    logging.info(f"🚀 Starting Search Engine Crawler (Unified Mode, worker {WORKER_ID})...")
     
     # Initial DB Init
-    car_db_optimizer.init_database()
+    await async_car_db.init_database()
+
+    queue = CrawlQueue()
+    budgets = site_budgets()
+    running = {}
+    next_reseed = 0
+    next_maintenance = time.time() + MAINTENANCE_INTERVAL
     
     while True:
-        logging.info("♻️  Starting cycle...")
-        
-        for target in TARGETS:
-            await crawl_target(target)
-            # Sleep between requests to be polite
-            await asyncio.sleep(random.randint(5, 10))
-            
-        # Clean up stale ads
-        cleaned = car_db_optimizer.deactivate_stale_ads(hours_threshold=24)
-        if cleaned > 0:
-            logging.info(f"🧹 Deactivated {cleaned} stale ads.")
-            
-        logging.info("💤 Cycle done. Sleeping for 10 minutes...")
-        await asyncio.sleep(600)
+        now = time.time()
+        if now >= next_reseed:
+            count = await async_car_db.seed_crawl_targets(SEED_TARGETS)
+            queue.load(await async_car_db.get_crawl_targets())
+            # Targets in flight stay with their task; they are pushed back when it finishes
+            for target in running.values():
+                queue.pop_target(target)
+            logging.info(f"🎯 Loaded {count} crawl targets.")
+            next_reseed = now + RESEED_INTERVAL
+        else:
+            # Targets made due by the API (schedule_refresh) between reseeds
+            in_flight = {(t["make_norm"], t["model_norm"]) for t in running.values()}
+            for target in await async_car_db.get_requested_crawl_targets():
+                if (target["make_norm"], target["model_norm"]) not in in_flight:
+                    queue.push(target)
+
+        if now >= next_maintenance:
+            # One process does the maintenance for everyone
+            if await async_car_db.acquire_lease("crawler:maintenance", WORKER_ID, 2 * MAINTENANCE_INTERVAL):
+                await run_maintenance()
+            next_maintenance = time.time() + MAINTENANCE_INTERVAL
+
+        # The most overdue targets go first; targets are rescheduled by their churn
+        for target in await claim_due_targets(queue, CRAWL_CONCURRENCY - len(running)):
+            running[asyncio.create_task(run_target(target, budgets))] = target
+
+        wait = queue.seconds_until_next(time.time())
+        wait = min(MAX_IDLE_SLEEP if wait is None else wait, MAX_IDLE_SLEEP,
+                   max(0, next_maintenance - time.time()), max(0, next_reseed - time.time()))
+        if not running:
+            logging.info(f"💤 Nothing due. Sleeping for {wait:.0f}s...")
+            await asyncio.sleep(max(wait, 1))
+            continue
+
+        done, _ = await asyncio.wait(running, timeout=max(wait, 1), return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            target = running.pop(task)
+            try:
+                updated = task.result()
+            except Exception as e:
+                logging.error(f"Crawl task for {target['make']} {target['model']} failed: {e}")
+                updated = await async_car_db.record_crawl(target["make_norm"], target["model_norm"], None,
+                                                          int(time.time()), WORKER_ID)
+            if updated:
+                queue.push(updated)
 
 if __name__ == "__main__":
     asyncio.run(run_crawler())
@@ -0,0 +1,110 @@
+"""
+SQLite Connection Manager
+Conexiuni persistente per thread (în loc de sqlite3.connect la fiecare apel),
+în mod WAL, astfel încât endpoint-urile FastAPI, scheduler-ul de alerte și
+crawler-ul pot citi și scrie concurent fără erori "database is locked".
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class SQLiteConnectionManager:
+    def __init__(self, db_path: str, busy_timeout_ms: int = 10000,
+                 cached_statements: int = 256, cache_size_kb: int = 16384):
+        self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self.cache_size_kb = cache_size_kb
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._pid = os.getpid()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            # Cache de prepared statements (cheia e textul SQL, deci query-urile trebuie să fie constante)
+            cached_statements=self.cached_statements,
+            # Fiecare conexiune e folosită doar de thread-ul ei; flag-ul permite close_all() la shutdown
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """Conexiunea thread-ului curent (deschisă la prima folosire)"""
+        if os.getpid() != self._pid:
+            # Proces nou (fork): conexiunile părintelui nu pot fi refolosite
+            self._local = threading.local()
+            with self._lock:
+                self._connections = []
+            self._pid = os.getpid()
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def cursor(self, row_factory=None):
+        """Cursor pentru citiri (autocommit, fără tranzacție deschisă)"""
+        cur = self.connection().cursor()
+        if row_factory is not None:
+            cur.row_factory = row_factory
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+    @contextmanager
+    def transaction(self, row_factory=None):
+        """
+        Tranzacție de scriere: commit la final, rollback la excepție.
+        Apelurile imbricate fac parte din tranzacția exterioară.
+        """
+        conn = self.connection()
+        cur = conn.cursor()
+        if row_factory is not None:
+            cur.row_factory = row_factory
+        outermost = self._local.depth == 0
+        if outermost and not conn.in_transaction:
+            # IMMEDIATE: lock-ul de scriere se ia de la început, deci busy_timeout se aplică
+            # (o tranzacție DEFERRED care trece din citire în scriere poate eșua imediat cu SQLITE_BUSY)
+            conn.execute("BEGIN IMMEDIATE")
+        self._local.depth += 1
+        try:
+            yield cur
+        except BaseException:
+            self._local.depth -= 1
+            if outermost:
+                conn.rollback()
+            raise
+        else:
+            self._local.depth -= 1
+            if outermost:
+                conn.commit()
+        finally:
+            cur.close()
+
+    def close_all(self):
+        """Închide toate conexiunile (la oprirea aplicației)"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
@@ -0,0 +1,250 @@
+"""
+Listing Deduplication Module
+Detectează același anunț postat pe mai multe surse (OLX + Autovit) pe baza
+unei amprente: titlu normalizat, interval de preț, an, km și hash-ul imaginii.
+Titlurile aproape identice sunt găsite cu un index MinHash/LSH.
+"""
+
+import hashlib
+import math
+import random
+import re
+import unicodedata
+from typing import Callable, Dict, List, Optional
+
+# MinHash: 32 permutări împărțite în 8 benzi x 4 rânduri.
+# Două titluri cu similaritate Jaccard ~0.6 ajung în aceeași bandă cu probabilitate > 0.5.
+NUM_PERM = 32
+LSH_BANDS = 8
+LSH_ROWS = NUM_PERM // LSH_BANDS
+TITLE_SIMILARITY = 0.6
+# Cu an + km aproape identice (și preț compatibil) acceptăm titluri mai diferite
+# ("BMW Seria 3 320d" vs "BMW 320d 2016")
+TITLE_SIMILARITY_STRONG_ATTRS = 0.3
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1337)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+_TITLE_STOPWORDS = {
+    "vand", "vanzare", "de", "la", "si", "cu", "in", "pe", "urgent", "impecabil", "impecabila",
+    "stare", "foarte", "buna", "full", "options", "option", "proprietar", "inmatriculat",
+    "inmatriculata", "recent", "adus", "germania", "garantie", "variante", "schimb",
+}
+
+
+def normalize_title(title: str) -> str:
+    """Titlu fără diacritice, punctuație și cuvinte de umplutură ("vand", "urgent"...)."""
+    text = unicodedata.normalize("NFKD", title or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    tokens = [t for t in re.split(r"[^a-z0-9]+", text) if t and t not in _TITLE_STOPWORDS]
+    return " ".join(tokens)
+
+
+def price_bucket(price, width: float = 0.05) -> Optional[int]:
+    """Interval logaritmic de preț (~5% lățime), robust la diferențe mici între surse."""
+    try:
+        value = float(price)
+    except (TypeError, ValueError):
+        return None
+    if value <= 0:
+        return None
+    return int(math.log(value) / math.log1p(width))
+
+
+def image_hash(url: str) -> Optional[str]:
+    """Hash pe calea imaginii, fără parametri de dimensiune (";s=1000x700", "?w=640")."""
+    if not url or "no_thumbnail" in url or "/app/static" in url:
+        return None
+    path = re.sub(r"^https?://[^/]+", "", url.strip())
+    path = path.split("?")[0].split(";")[0]
+    path = re.sub(r"/image(/.*)?$", "/image", path)
+    return hashlib.md5(path.encode()).hexdigest()[:16]
+
+
+def _shingles(norm_title: str) -> set:
+    tokens = norm_title.split()
+    compact = norm_title.replace(" ", "")
+    grams = {compact[i:i + 3] for i in range(max(1, len(compact) - 2))}
+    return set(tokens) | grams
+
+
+def minhash_signature(norm_title: str) -> tuple:
+    shingles = _shingles(norm_title)
+    hashed = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingles]
+    return tuple(
+        min(((a * h + b) % _MERSENNE_PRIME) for h in hashed)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def _signature_similarity(sig_a: tuple, sig_b: tuple) -> float:
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / len(sig_a)
+
+
+def _to_int(value) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, int):
+        return value
+    digits = re.sub(r"\D", "", str(value))
+    return int(digits) if digits else None
+
+
+def _price_eur(value) -> Optional[int]:
+    """
+    Prețul în EUR, ca în search_cars: RON / lei împărțit la 5. Zecimalele sunt ignorate
+    ("12.500,50 €" -> 12500), nu lipite de partea întreagă.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value)
+    match = re.search(r"\d[\d\s.,]*", text)
+    if not match:
+        return None
+    number = re.sub(r"[.,]\d{1,2}$", "", match.group().strip())
+    price = int(re.sub(r"\D", "", number))
+    if "ron" in text.lower() or "lei" in text.lower():
+        price = int(price / 5)
+    return price
+
+
+class _Entry:
+    __slots__ = ("listing", "signature", "year", "km", "price", "price_bucket", "image_hash")
+
+    def __init__(self, listing: Dict):
+        self.listing = listing
+        self.signature = minhash_signature(normalize_title(listing.get("title") or listing.get("name") or ""))
+        self.year = _to_int(listing.get("year"))
+        self.km = _to_int(listing.get("km"))
+        self.price = _price_eur(listing.get("price"))
+        self.price_bucket = price_bucket(self.price)
+        self.image_hash = image_hash(str(listing.get("image") or ""))
+
+
+class ListingDeduplicator:
+    """
+    Index incremental de anunțuri. `add()` întoarce anunțul deja existent
+    cu care cel nou a fost unit, sau None dacă anunțul e nou.
+    """
+
+    def __init__(self, key: Optional[Callable[[Dict], Optional[str]]] = None):
+        self.key = key
+        self.entries: List[_Entry] = []
+        self._by_key: Dict[str, _Entry] = {}
+        self._by_image: Dict[str, _Entry] = {}
+        self._by_attrs: Dict[tuple, List[_Entry]] = {}
+        self._bands: List[Dict[tuple, List[_Entry]]] = [{} for _ in range(LSH_BANDS)]
+
+    def _attributes_compatible(self, a: _Entry, b: _Entry) -> bool:
+        if a.year and b.year and a.year != b.year:
+            return False
+        if a.km is not None and b.km is not None and abs(a.km - b.km) > max(1000, 0.02 * max(a.km, b.km)):
+            return False
+        if a.price_bucket is not None and b.price_bucket is not None and abs(a.price_bucket - b.price_bucket) > 1:
+            return False
+        return True
+
+    def _find(self, entry: _Entry) -> Optional[_Entry]:
+        if entry.image_hash and entry.image_hash in self._by_image:
+            candidate = self._by_image[entry.image_hash]
+            # Aceeași imagine poate fi o poză de stoc a dealerului sau un placeholder comun:
+            # cerem și un titlu apropiat sau un an / km cunoscut la ambele (și compatibil)
+            if (self._attributes_compatible(entry, candidate)
+                    and (_signature_similarity(entry.signature, candidate.signature) >= TITLE_SIMILARITY_STRONG_ATTRS
+                         or (entry.year and candidate.year)
+                         or (entry.km is not None and candidate.km is not None))):
+                return candidate
+
+        if entry.year and entry.km:
+            km_slot = entry.km // 1000
+            for slot in (km_slot - 1, km_slot, km_slot + 1):
+                for candidate in self._by_attrs.get((entry.year, slot), ()):
+                    if (candidate.price_bucket is not None and entry.price_bucket is not None
+                            and self._attributes_compatible(entry, candidate)
+                            and _signature_similarity(entry.signature, candidate.signature) >= TITLE_SIMILARITY_STRONG_ATTRS):
+                        return candidate
+
+        seen = set()
+        for band_idx, band in enumerate(self._bands):
+            band_key = entry.signature[band_idx * LSH_ROWS:(band_idx + 1) * LSH_ROWS]
+            for candidate in band.get(band_key, ()):
+                if id(candidate) in seen:
+                    continue
+                seen.add(id(candidate))
+                # Titlul singur nu e suficient: cerem și an/km/preț compatibile
+                if (_signature_similarity(entry.signature, candidate.signature) >= TITLE_SIMILARITY
+                        and self._attributes_compatible(entry, candidate)
+                        and (entry.year or entry.km is not None or entry.image_hash)):
+                    return candidate
+        return None
+
+    def _index(self, entry: _Entry):
+        self.entries.append(entry)
+        if entry.image_hash:
+            self._by_image.setdefault(entry.image_hash, entry)
+        if entry.year and entry.km:
+            self._by_attrs.setdefault((entry.year, entry.km // 1000), []).append(entry)
+        for band_idx, band in enumerate(self._bands):
+            band_key = entry.signature[band_idx * LSH_ROWS:(band_idx + 1) * LSH_ROWS]
+            band.setdefault(band_key, []).append(entry)
+
+    def add(self, listing: Dict) -> Optional[Dict]:
+        key = self.key(listing) if self.key else None
+        if key and key in self._by_key:
+            existing = self._by_key[key].listing
+            _merge_into(existing, listing)
+            return existing
+
+        entry = _Entry(listing)
+        match = self._find(entry)
+        if match:
+            _merge_into(match.listing, listing)
+            if key:
+                self._by_key[key] = match
+            return match.listing
+
+        listing.setdefault("sources", [_source_of(listing)])
+        self._index(entry)
+        if key:
+            self._by_key[key] = entry
+        return None
+
+    def listings(self) -> List[Dict]:
+        return [e.listing for e in self.entries]
+
+
+def _source_of(listing: Dict) -> Dict:
+    return {
+        "source": listing.get("subsource") or listing.get("source") or "Unknown",
+        "link": listing.get("link") or listing.get("url"),
+        "price": listing.get("price"),
+    }
+
+
+def _merge_into(primary: Dict, duplicate: Dict):
+    """Unește duplicatul în anunțul principal: listă de surse + câmpuri lipsă completate."""
+    sources = primary.setdefault("sources", [_source_of(primary)])
+    dup_source = _source_of(duplicate)
+    if dup_source["link"] and all(s["link"] != dup_source["link"] for s in sources):
+        sources.append(dup_source)
+    for field, value in duplicate.items():
+        if field == "sources":
+            continue
+        if primary.get(field) in (None, "") and value not in (None, ""):
+            primary[field] = value
+    if "no_thumbnail" in str(primary.get("image") or "") and duplicate.get("image"):
+        primary["image"] = duplicate["image"]
+
+
+def merge_duplicates(listings: List[Dict], key: Optional[Callable[[Dict], Optional[str]]] = None) -> List[Dict]:
+    """
+    Elimină duplicatele dintr-o listă de anunțuri (exact pe `key`, aproximativ pe amprentă).
+    Ordinea primei apariții se păstrează; fiecare rezultat primește câmpul `sources`.
+    """
+    deduper = ListingDeduplicator(key=key)
+    for listing in listings:
+        deduper.add(listing)
+    return deduper.listings()
@@ -0,0 +1,246 @@
+"""
+Enrichment Module
+Completarea la cerere a unui anunț din pagina lui de detaliu: imagine, preț și dacă mai există.
+Căutarea întoarce anunțurile neîmbogățite (cu needs_enrichment), iar frontend-ul cere prin
+POST /api/enrich doar cardurile afișate. Rezultatele stau într-un cache cu TTL, iar fetch-urile
+rulează cu concurență limitată, o singură dată per anunț chiar dacă e cerut în paralel.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+ENRICH_CONCURRENCY = 8
+ENRICH_TIMEOUT = 8
+MAX_ENRICH_IDS = 50
+
+_GALLERY_SELECTORS = [
+    "img.css-1bmvjcs",                # OLX Legacy
+    "div.swiper-zoom-container img",  # OLX Mobile/New
+    "div.css-1bnh990 img",            # Autovit Desktop
+    "img.photo-handler",              # Generic Autovit
+    ".image-gallery-slide img",       # React Gallery
+]
+
+
+def is_missing_image(image) -> bool:
+    return not image or "no_thumbnail" in str(image) or "/app/static" in str(image)
+
+
+class EnrichmentCache:
+    """
+    Rezultatele îmbogățirii per ID de anunț (LRU cu TTL) și legăturile ID -> link
+    pentru anunțurile întoarse recent de căutare (live, deci nu neapărat în DB).
+    """
+
+    def __init__(self, max_entries: int = 5000, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._details: "OrderedDict[str, tuple]" = OrderedDict()
+        self._links: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, ad_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._details.get(ad_id)
+            if entry is None:
+                return None
+            created, details = entry
+            if time.time() - created > self.ttl:
+                del self._details[ad_id]
+                return None
+            self._details.move_to_end(ad_id)
+            return details
+
+    def put(self, ad_id: str, details: Dict):
+        with self._lock:
+            self._details[ad_id] = (time.time(), details)
+            self._details.move_to_end(ad_id)
+            while len(self._details) > self.max_entries:
+                self._details.popitem(last=False)
+
+    def remember_links(self, ads: Iterable[Dict]):
+        with self._lock:
+            for ad in ads:
+                if ad.get("id") and ad.get("link"):
+                    self._links[ad["id"]] = ad["link"]
+                    self._links.move_to_end(ad["id"])
+            while len(self._links) > self.max_entries:
+                self._links.popitem(last=False)
+
+    def link_for(self, ad_id: str) -> Optional[str]:
+        with self._lock:
+            return self._links.get(ad_id)
+
+
+enrichment_cache = EnrichmentCache()
+_in_flight: Dict[str, asyncio.Future] = {}
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _fetch_semaphore() -> asyncio.Semaphore:
+    # Comun tuturor cererilor: limita e pe proces, nu per apel
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(ENRICH_CONCURRENCY)
+    return _semaphore
+
+
+def parse_listing_page(html: str) -> Dict:
+    """Prețul (din __NEXT_DATA__ / JSON-LD) și imaginea (og:image, JSON-LD, galerie) din pagina de detaliu"""
+    soup = BeautifulSoup(html, "html.parser")
+    price = None
+    image = None
+
+    nd = soup.find("script", {"id": "__NEXT_DATA__"})
+    if nd and nd.string:
+        try:
+            data = json.loads(nd.string)
+            pp = data.get("props", {}).get("pageProps", {})
+            advert = pp.get("advert") or pp.get("data", {}).get("advert")
+            if advert:
+                value = (advert.get("price") or {}).get("value")
+                if value:
+                    price = int(float(value))
+        except (ValueError, TypeError, AttributeError):
+            pass
+
+    og = soup.find("meta", attrs={"property": "og:image"})
+    if og and og.get("content"):
+        image = og.get("content")
+
+    for script in soup.find_all("script", type="application/ld+json"):
+        if image and price:
+            break
+        try:
+            data = json.loads(script.string or "")
+        except ValueError:
+            continue
+        if not isinstance(data, dict):
+            continue
+        if not image and data.get("image"):
+            imgs = data["image"]
+            image = imgs[0] if isinstance(imgs, list) and imgs else imgs if isinstance(imgs, str) else None
+        offer_price = (data.get("offers") or {}).get("price") if isinstance(data.get("offers"), dict) else None
+        if not price and offer_price:
+            try:
+                price = int(float(offer_price))
+            except ValueError:
+                pass
+
+    if not image:
+        for selector in _GALLERY_SELECTORS:
+            gal = soup.select_one(selector)
+            if gal and (gal.get("src") or gal.get("data-src")):
+                image = gal.get("src") or gal.get("data-src")
+                break
+
+    return {"price": price, "image": image}
+
+
+def link_site(link: str) -> Optional[str]:
+    """Site-ul unui link de anunț, cheia din rate_limit.SITE_REQUEST_RATES ("olx" / "autovit")"""
+    link = (link or "").lower()
+    if "autovit.ro" in link:
+        return "autovit"
+    if "olx.ro" in link:
+        return "olx"
+    return None
+
+
+async def _fetch_details(session, semaphore: asyncio.Semaphore, ad_id: str, link: str,
+                         throttle: Optional[Callable[[], Awaitable[None]]] = None) -> Dict:
+    details = {"id": ad_id, "alive": True, "price": None, "image": None}
+    async with semaphore:
+        try:
+            if throttle is not None:
+                await throttle()
+            async with session.get(link, timeout=ENRICH_TIMEOUT) as response:
+                # 404 sau redirect pe pagina principală: anunțul a fost șters
+                if response.status == 404 or len(str(response.url)) < 30:
+                    details["alive"] = False
+                elif response.status == 200:
+                    details.update(parse_listing_page(await response.text()))
+                else:
+                    # Eroare temporară (429, 5xx): nu o păstrăm în cache
+                    return {**details, "error": f"HTTP {response.status}"}
+        except Exception as e:
+            return {**details, "error": str(e) or type(e).__name__}
+    details["enriched_at"] = int(time.time())
+    enrichment_cache.put(ad_id, details)
+    return details
+
+
+async def enrich_ads(ads: List[Dict], budgets: Optional[Dict] = None) -> Dict[str, Dict]:
+    """
+    Detaliile pentru o listă de anunțuri ({"id", "link"}), indexate după ID.
+    Din cache când există; restul cu cel mult ENRICH_CONCURRENCY fetch-uri simultane.
+    budgets: {"olx": bucket, "autovit": bucket} (crawler-ul, vezi rate_limit.site_budgets);
+    fiecare fetch așteaptă bucket-ul site-ului din link-ul anunțului.
+    """
+    budgets = budgets or {}
+    results = {}
+    pending = {}
+    waiting = {}
+    for ad in ads:
+        ad_id, link = ad.get("id"), ad.get("link")
+        if not ad_id or not link or ad_id in results or ad_id in pending:
+            continue
+        cached = enrichment_cache.get(ad_id)
+        if cached is not None:
+            results[ad_id] = cached
+        elif ad_id in _in_flight:
+            waiting[ad_id] = _in_flight[ad_id]
+        else:
+            pending[ad_id] = link
+
+    if pending:
+        loop = asyncio.get_running_loop()
+        futures = {ad_id: loop.create_future() for ad_id in pending}
+        _in_flight.update(futures)
+        semaphore = _fetch_semaphore()
+        try:
+            async with aiohttp.ClientSession(
+                headers={"User-Agent": "Mozilla/5.0"},
+                connector=aiohttp.TCPConnector(ssl=False)
+            ) as session:
+                fetched = await asyncio.gather(*[
+                    _fetch_details(session, semaphore, ad_id, link, budgets.get(link_site(link)))
+                    for ad_id, link in pending.items()
+                ])
+            for details in fetched:
+                results[details["id"]] = details
+                futures[details["id"]].set_result(details)
+        finally:
+            for ad_id, future in futures.items():
+                if not future.done():
+                    future.set_result({"id": ad_id, "alive": True, "price": None, "image": None, "error": "cancelled"})
+                _in_flight.pop(ad_id, None)
+
+    for ad_id, future in waiting.items():
+        results[ad_id] = await future
+    return results
+
+
+def apply_enrichment(ad: Dict, details: Optional[Dict]) -> Dict:
+    """Completează anunțul cu detaliile; prețul doar dacă lipsea sau e mai mare (ca la repair)"""
+    if not details or details.get("error"):
+        return ad
+    if details.get("image") and is_missing_image(ad.get("image")):
+        ad["image"] = details["image"]
+    new_price = details.get("price")
+    if new_price:
+        try:
+            current = int(ad.get("price") or 0)
+        except (TypeError, ValueError):
+            current = 0
+        if new_price > current:
+            ad["price"] = new_price
+    ad["needs_enrichment"] = False
+    return ad
@@ -1,11 +1,21 @@
 from scraper.olx_scraper import scrape_olx
 from scraper.autovit_scraper import scrape_autovit
-from car_database import get_optimized_search_params, car_db_optimizer
+from car_database import car_db_optimizer, normalize_ad_make, normalize_ad_text
+from async_db import async_car_db
+from stats_writer import search_stats_writer
+from dedup import merge_duplicates
+from scraper.listing_ids import canonical_ad_id
+from pagination import DEFAULT_PAGE_SIZE, db_page_response
+from price_anomaly import PriceAnomalyDetector
+from alert_index import alert_index
+from notifications import notification_dispatcher
+from enrichment import apply_enrichment, enrich_ads, enrichment_cache, is_missing_image
 import re
 import time
 import functools
 import json
 import asyncio
+from datetime import datetime, timedelta
 
 # --- Simple TTL Cache for Async ---
 _SEARCH_CACHE = {}
@@ -41,6 +51,30 @@ def ttl_cache(func):
         return result
     return wrapper
 
+def map_autovit_model(make_text: str, model_text: str) -> str:
+    """Slug-ul modelului în URL-ul Autovit (BMW: seria-3, x5)"""
+    make_lc = (make_text or "").strip().lower()
+    model_lc = (model_text or "").strip().lower()
+
+    m = re.match(r"^(x)?(\d)", model_lc)
+    if make_lc == "bmw" and m:
+        is_x = m.group(1) == "x"
+        digit = m.group(2)
+        if is_x:
+            return f"x{digit}"
+        return f"seria-{digit}"
+    return model_lc
+
+# Anunțuri de piese / dezmembrări, nu mașini întregi
+PARTS_KEYWORDS = {"dezmembrari", "piese", "motor", "cutie", "bara", "usa", "capota", "far", "stop", "anvelope", "roti", "jante", "boxe", "navigatie", "volan", "interior"}
+
+def model_tokens_match(model_tokens: set, searchable_tokens: set) -> bool:
+    """Fiecare token al modelului apare în titlu / link: identic sau, peste un caracter, ca subșir ("x5" în "x5m")"""
+    for m_tok in model_tokens:
+        if not any(m_tok == s_tok or (len(m_tok) > 1 and m_tok in s_tok) for s_tok in searchable_tokens):
+            return False
+    return True
+
 @ttl_cache
 async def search_cars(
     make: str,
@@ -66,7 +100,7 @@ async def search_cars(
         
     cars = []
 
-    optimized_params = get_optimized_search_params(make, model, min_year, max_year)
+    optimized_params = await async_car_db.get_optimized_search_params(make, model, min_year, max_year)
     optimized_min_year = optimized_params['min_year']
     optimized_max_year = optimized_params['max_year']
     # model_info = optimized_params['model_info']
@@ -76,20 +110,12 @@ async def search_cars(
     if generation:
         query += f" {generation}"
 
-    def map_autovit_model(make_text: str, model_text: str) -> str:
-        make_lc = (make_text or "").strip().lower()
-        model_lc = (model_text or "").strip().lower()
-
-        m = re.match(r"^(x)?(\d)", model_lc)
-        if make_lc == "bmw" and m:
-            is_x = m.group(1) == "x"
-            digit = m.group(2)
-            if is_x:
-                return f"x{digit}"
-            return f"seria-{digit}"
-        return model_lc
-
     site_lc = (site or "").lower()
+
+    # Detail-page fetch doar pentru prețurile implauzibile pentru model (benzi din market_stats)
+    price_check = None
+    if make and model:
+        price_check = PriceAnomalyDetector.from_market_stats(await async_car_db.get_market_stats(make, model))
     
     # Define Tasks
     tasks = []
@@ -103,6 +129,10 @@ async def search_cars(
             min_year=optimized_min_year,
             max_year=optimized_max_year,
             max_km=max_km,
+            min_cc=min_cc,
+            min_hp=min_hp,
+            price_check=price_check,
+            max_pages=max_pages,
         ))
         
     if site_lc in ["autovit", "both"]:
@@ -117,6 +147,9 @@ async def search_cars(
             min_year=optimized_min_year,
             max_year=optimized_max_year,
             max_km=max_km,
+            min_cc=min_cc,
+            min_hp=min_hp,
+            price_check=price_check,
         ))
 
     # Run concurrently
@@ -168,20 +201,9 @@ async def search_cars(
              continue
 
         # Model check
-        model_matches = True
-        if model_tokens:
-            for m_tok in model_tokens:
-                token_found = False
-                for s_tok in searchable_tokens:
-                    if m_tok == s_tok or (len(m_tok) > 1 and m_tok in s_tok): 
-                        token_found = True
-                        break
-                if not token_found:
-                    model_matches = False
-                    break
-
-        bad_keywords = {"dezmembrari", "piese", "motor", "cutie", "bara", "usa", "capota", "far", "stop", "anvelope", "roti", "jante", "boxe", "navigatie", "volan", "interior"}
-        if any(bad in title_tokens or bad in link_tokens for bad in bad_keywords):
+        model_matches = model_tokens_match(model_tokens, searchable_tokens)
+
+        if any(bad in title_tokens or bad in link_tokens for bad in PARTS_KEYWORDS):
             continue
         
         # Validations
@@ -267,128 +289,19 @@ async def search_cars(
 
     final_results = strict_filtered if strict_filtered else (loose_filtered if model else [])
 
-    # Enhanced Validation & Repair Logic
-    # Scans results for missing data (images/price) and triggers deep-fetch to correct them.
-    
-    ads_to_repair = []
-    
-    import aiohttp
-    from bs4 import BeautifulSoup
-    import json as _json_live
+    # Deduplicate before repair: exact on canonical (source, external_id), then cross-source
+    # (OLX + Autovit) on listing fingerprint. Duplicates are merged into one listing with a
+    # `sources` list, so they are repaired only once.
+    def get_ad_id(car_item):
+        car_item["id"] = car_item.get("id") or canonical_ad_id(car_item.get("link"), car_item.get("subsource"))
+        return car_item["id"]
 
-    async def repair_ad(ad):
-        # 1. Image Check: Attempt to recover missing images via multiple sources
-        # 2. Price Check: Validate price against page data if image is missing
-        
-        is_missing_image = not ad.get("image") or "no_thumbnail" in str(ad.get("image"))
-        
-        is_missing_image = not ad.get("image") or "no_thumbnail" in str(ad.get("image"))
-        
-        if is_missing_image:
-             try:
-                 async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False)) as sess:
-                     async with sess.get(ad.get("link"), timeout=5) as r: # Short timeout for live search
-                         # Ghost check
-                         if r.status == 404 or len(str(r.url)) < 30:
-                             return None # Signal to remove
-                             
-                         if r.status == 200:
-                             html = await r.text()
-                             soup = BeautifulSoup(html, "html.parser")
-                             
-                             # Fix Price
-                             nd = soup.find("script", {"id": "__NEXT_DATA__"})
-                             current_price = int(ad.get("price", 0))
-                             if nd and nd.string:
-                                 d = _json_live.loads(nd.string)
-                                 pp = d.get("props", {}).get("pageProps", {})
-                                 adv = pp.get("advert") or pp.get("data", {}).get("advert")
-                                 if adv:
-                                     p = adv.get("price", {}).get("value")
-                                     if p:
-                                         new_p = int(p)
-                                         if new_p > current_price: 
-                                             ad["price"] = new_p
-
-                             # Fix Image
-                             if is_missing_image:
-                                 # Priority 1: Open Graph (Best Quality)
-                                 og = soup.find("meta", attrs={"property": "og:image"})
-                                 if og and og.get("content"):
-                                     ad["image"] = og.get("content")
-                                 
-                                 # Priority 2: JSON-LD (Schema.org)
-                                 if not ad.get("image"):
-                                     scripts = soup.find_all('script', type='application/ld+json')
-                                     for s in scripts:
-                                        try:
-                                            data = _json_live.loads(s.string)
-                                            if isinstance(data, dict) and 'image' in data:
-                                                imgs = data['image']
-                                                if isinstance(imgs, list) and imgs:
-                                                    ad["image"] = imgs[0]
-                                                elif isinstance(imgs, str):
-                                                    ad["image"] = imgs
-                                                break
-                                        except: pass
-
-                                 # Priority 3: Common Gallery Selectors
-                                 if not ad.get("image"):
-                                     # Try finding gallery image
-                                     selectors = [
-                                         "img.css-1bmvjcs", # OLX Legacy
-                                         "div.swiper-zoom-container img", # OLX Mobile/New
-                                         "div.css-1bnh990 img", # Autovit Desktop
-                                         "img.photo-handler", # Generic Autovit
-                                         ".image-gallery-slide img" # React Gallery
-                                     ]
-                                     for sel in selectors:
-                                         gal = soup.select_one(sel)
-                                         if gal:
-                                             src = gal.get("src") or gal.get("data-src")
-                                             if src:
-                                                  ad["image"] = src
-                                                  break
-             except:
-                 pass
-        
-        # Final Quality Check
-        if not ad.get("image") or "no_thumbnail" in str(ad.get("image")):
-            return None # Still broken -> Remove
-            
-        return ad
+    final_results = merge_duplicates([c for c in final_results if c.get("link")], key=get_ad_id)
+
+    # Lazy enrichment: no detail-page fetch here. Listings with a missing image are flagged and
+    # resolved through POST /api/enrich only for the cards the frontend actually renders.
+    final_results = apply_cached_enrichment(final_results)
 
-    # Collect tasks
-    repair_tasks = []
-    for ad in final_results:
-        repair_tasks.append(repair_ad(ad))
-        
-    if repair_tasks:
-        # Run repairs concurrently
-        repaired_results = await asyncio.gather(*repair_tasks)
-        # Filter out Nones (Removed ads)
-        final_results = [r for r in repaired_results if r]
-
-    # Deduplicate by Ad ID
-    unique_map = {}
-    unique_list = []
-    
-    import re as _re_dedup
-    def get_ad_id(link_str):
-        m = _re_dedup.search(r"-ID([a-zA-Z0-9]+)\.html", link_str)
-        if m: return m.group(1)
-        return link_str
-
-    for c in final_results:
-        lnk = c.get("link")
-        if lnk:
-            ad_id = get_ad_id(lnk)
-            if ad_id not in unique_map:
-                unique_map[ad_id] = True
-                unique_list.append(c)
-    
-    final_results = unique_list
-    
     # Stats update
     if final_results and make and model:
         prices = [r['price'] for r in final_results if r.get('price')]
@@ -399,77 +312,266 @@ async def search_cars(
         avg_year = sum(years) / len(years) if years else None
         avg_km = sum(kms) / len(kms) if kms else None
         
-        car_db_optimizer.update_search_stats(
+        # Write-behind: agregat în memorie, scris periodic într-o singură tranzacție
+        search_stats_writer.record(
             make=make,
             model=model,
             avg_price=avg_price,
             avg_year=avg_year,
-            avg_km=avg_km
+            avg_km=avg_km,
+            price_count=len(prices),
+            year_count=len(years),
+            km_count=len(kms)
         )
 
     return final_results
 
-def add_alert(user_email: str, make: str, model: str, max_price: int):
-    return car_db_optimizer.add_alert(user_email, make, model, max_price)
+def apply_cached_enrichment(ads: list) -> list:
+    """
+    Aplică detaliile deja îmbogățite din cache și marchează cu needs_enrichment anunțurile
+    fără imagine; anunțurile găsite șterse la o îmbogățire anterioară sunt scoase.
+    """
+    enrichment_cache.remember_links(ads)
+    enriched = []
+    for ad in ads:
+        cached = enrichment_cache.get(ad["id"])
+        if cached is None:
+            ad["needs_enrichment"] = is_missing_image(ad.get("image"))
+        elif not cached["alive"]:
+            continue
+        else:
+            apply_enrichment(ad, cached)
+        enriched.append(ad)
+    return enriched
+
+async def enrich_listings(ad_ids: list) -> dict:
+    """Detaliile (imagine, preț, alive) pentru anunțurile cerute de frontend, din cache sau fetch"""
+    ads = []
+    unknown = []
+    for ad_id in ad_ids:
+        link = enrichment_cache.link_for(ad_id)
+        if link:
+            ads.append({"id": ad_id, "link": link})
+        else:
+            unknown.append(ad_id)
+    # Anunțuri din DB uitate de cache (ex. după restart)
+    if unknown:
+        links = await async_car_db.get_ad_links(unknown)
+        ads.extend({"id": ad_id, "link": link} for ad_id, link in links.items())
+
+    details = await enrich_ads(ads)
+    for ad_id, item in details.items():
+        if not item["alive"]:
+            await async_car_db.delete_ad(ad_id)
+    return details
+
+
+# ---------------- Căutare din DB (anunțurile salvate de crawler) ----------------
+# Mod hybrid: anunțurile unui (make, model) sunt proaspete dacă au fost văzute în ultimele N ore
+DB_FRESHNESS_HOURS = 6
+REFRESH_REQUEST_INTERVAL = 300
+_REFRESH_REQUESTS = {}
+
+async def search_cars_db(
+    make: str,
+    model: str,
+    site: str = "both",
+    *,
+    min_price: int | None = None,
+    max_price: int | None = None,
+    max_km: int | None = None,
+    min_year: int | None = None,
+    max_year: int | None = None,
+    sort: str = "price_asc",
+    page_size: int = DEFAULT_PAGE_SIZE,
+    cursor: dict | None = None,
+):
+    """
+    O pagină din tabela ads; sort în formatul /api/search ("price_asc", "year_desc"...).
+    cursor: cursorul decodat al paginii anterioare (None pentru prima pagină).
+    """
+    sort_by, _, order = sort.partition("_")
+    if not order:
+        # "deal": cele mai bune oferte primele
+        order = "desc" if sort_by == "deal" else "asc"
+    site_lc = (site or "").lower()
+    page = await async_car_db.search_ads_page(
+        make, model,
+        page_size=page_size,
+        after=tuple(cursor["a"]) if cursor else None,
+        model_match=cursor.get("m") if cursor else None,
+        # Totalul e numărat o singură dată, la prima pagină, apoi purtat în cursor
+        with_total=cursor is None,
+        min_price=min_price,
+        max_price=max_price,
+        min_year=min_year,
+        max_year=max_year,
+        max_km=max_km,
+        sort_by=sort_by,
+        order=order,
+        source=site_lc if site_lc in ("olx", "autovit") else None,
+    )
+    page["results"] = apply_cached_enrichment(page["results"])
+    total = page["total"] if cursor is None else cursor.get("n")
+    return db_page_response(page, page_size, total, sort)
+
+def is_stale(last_seen: str | None, hours: float = DB_FRESHNESS_HOURS) -> bool:
+    """last_seen vine din SQLite (CURRENT_TIMESTAMP, UTC)"""
+    if not last_seen:
+        return True
+    try:
+        seen = datetime.strptime(str(last_seen)[:19], "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return True
+    return datetime.utcnow() - seen > timedelta(hours=hours)
+
+async def schedule_refresh(make: str, model: str) -> bool:
+    """
+    Cere crawler-ului un crawl pentru (make, model): ținta devine scadentă în crawl_targets și
+    e luată de workeri (lease, bugete per site, record_crawl), nu crawl-ată în procesul API-ului.
+    Cererile repetate sunt comasate local timp de REFRESH_REQUEST_INTERVAL secunde.
+    Întoarce True dacă un crawl e cerut sau deja în așteptare.
+    """
+    key = (normalize_ad_make(make), normalize_ad_text(model))
+    now = time.monotonic()
+    if now - _REFRESH_REQUESTS.get(key, float("-inf")) < REFRESH_REQUEST_INTERVAL:
+        return True
+    try:
+        requested = await async_car_db.request_crawl(make, model)
+    except Exception as e:
+        print(f"Eroare la programarea crawl-ului pentru {make} {model}: {e}")
+        return False
+    if requested:
+        _REFRESH_REQUESTS[key] = now
+    return requested
 
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import os
+def add_alert(user_email: str, make: str, model: str, max_price: int):
+    alert = car_db_optimizer.add_alert(user_email, make, model, max_price)
+    alert_index.add(alert)
+    return alert
 
 def send_email_notification(to_email: str, car_list: list, search_details: str):
-    sender_email = os.environ.get("SENDER_EMAIL")
-    sender_password = os.environ.get("SENDER_PASSWORD")
-    
-    if not sender_email or not sender_password:
-        return
-
-    subject = f"Car Sniper: {len(car_list)} mașini regăsite pentru {search_details}"
-    html_content = f"<h2>Salut! Am găsit {len(car_list)} mașini pentru căutarea ta ({search_details}):</h2><br>"
-    for car in car_list:
-        html_content += f"""
-        <div style="border:1px solid #ddd; padding:10px; margin-bottom:10px; border-radius:5px;">
-            <h3><a href='{car.get('link') or car.get('url')}'>{car.get('title')}</a></h3>
-            <p><strong>Preț: {car.get('price')}</strong> | An: {car.get('year') or '?'} | Km: {car.get('km') or '?'}</p>
-        </div>
-        """
-    
-    msg = MIMEMultipart()
-    msg['From'] = sender_email
-    msg['To'] = to_email
-    msg['Subject'] = subject
-    msg.attach(MIMEText(html_content, 'html'))
-
+    """Pune emailul în coada dispatcher-ului (non-blocant); trimis în lot, comasat per utilizator"""
+    notification_dispatcher.enqueue(to_email, car_list, search_details)
+
+# Alertele pentru același (make, model) sunt verificate cu o singură căutare
+ALERT_GROUP_CONCURRENCY = 4   # grupuri căutate simultan
+ALERT_GROUP_LIMIT = 50        # rezultate per grup (împărțite apoi între alerte)
+ALERT_MAX_RESULTS = 10        # mașini per email, ca înainte
+ALERT_CANDIDATES_LIMIT = 100  # candidați din DB per alertă și verificare
+ALERT_PRICE_BAND_RATIO = 1.5  # max_price-urile unui grup diferă cel mult de atât
+
+def plan_alert_groups(alerts: list) -> list:
+    """
+    Grupează alertele după (make, model) normalizat și, în cadrul lui, pe benzi de max_price
+    (cel mult ALERT_PRICE_BAND_RATIO între cea mai mică și cea mai mare limită din bandă).
+    Fiecare grup e căutat o dată, cu cel mai mare max_price din grup; filtrarea per alertă se
+    face pe rezultate. Fără benzi, cele ALERT_GROUP_LIMIT rezultate căutate la limita cea mai
+    mare ar putea să nu conțină nimic sub limita unei alerte mult mai ieftine.
+    """
+    by_model = {}
+    for alert in alerts:
+        key = (normalize_ad_make(alert["make"]), normalize_ad_text(alert["model"]))
+        by_model.setdefault(key, []).append(alert)
+
+    groups = []
+    for model_alerts in by_model.values():
+        group = None
+        for alert in sorted(model_alerts, key=lambda a: a["max_price"] or 0):
+            max_price = alert["max_price"] or 0
+            if group is None or max_price > group["band_floor"] * ALERT_PRICE_BAND_RATIO:
+                group = {"make": alert["make"], "model": alert["model"], "max_price": 0,
+                         "band_floor": max_price, "alerts": []}
+                groups.append(group)
+            group["max_price"] = max_price
+            group["alerts"].append(alert)
+    return groups
+
+def alert_matches(alert: dict, car: dict) -> bool:
     try:
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        server.send_message(msg)
-        server.quit()
-        print(f"✅ Email trimis cu succes către {to_email}")
-    except Exception as e:
-        print(f"❌ Eroare la trimiterea emailului: {e}")
+        price = int(car.get("price") or 0)
+    except (TypeError, ValueError):
+        return False
+    return 0 < price <= (alert["max_price"] or 0)
+
+async def _notify_new_matches(alert: dict, cars: list, checked_at: str = None) -> bool:
+    """
+    Trimite doar mașinile încă netrimise pentru alertă (seen-set per alertă, vezi alert_seen.py).
+    Cu checked_at, last_checked avansează atomic cu marcarea ca trimise.
+    """
+    claimed = set(await async_car_db.claim_alert_notifications(
+        alert["id"], [car["id"] for car in cars if car.get("id")], ALERT_MAX_RESULTS, checked_at
+    ))
+    new_cars = [car for car in cars if car.get("id") in claimed]
+    if not new_cars:
+        return False
+    print(f"ALERT MATCH for {alert['user_email']}: {len(new_cars)} new cars.")
+    send_email_notification(alert["user_email"], new_cars, f"{alert['make']} {alert['model']}")
+    return True
+
+async def _check_alert_group(group: dict, semaphore: asyncio.Semaphore):
+    # Același format ca CURRENT_TIMESTAMP din SQLite (UTC), luat înainte de evaluare
+    checked_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    async with semaphore:
+        freshness = await async_car_db.get_ads_freshness(group["make"], group["model"])
+        from_db = freshness["count"] and not is_stale(freshness["last_seen"])
+        results = []
+        if not from_db:
+            try:
+                results = await search_cars(
+                    make=group["make"],
+                    model=group["model"],
+                    max_price=group["max_price"],
+                    site="both",
+                    limit=ALERT_GROUP_LIMIT
+                )
+                # Cele mai ieftine primele: o alertă primește mai întâi anunțurile cele mai sub limita ei
+                results = sorted(results, key=lambda car: car.get("price") or 0)
+            except Exception as e:
+                print(f"Eroare la căutarea pentru alertele {group['make']} {group['model']}: {e}")
+                return
 
-async def check_alerts():
-    alerts = car_db_optimizer.get_alerts()
-    print(f"[Scheduler] Verific {len(alerts)} alerte...")
-    
-    for alert in alerts:
+    for alert in group["alerts"]:
         try:
-            results = await search_cars(
-                make=alert["make"], 
-                model=alert["model"], 
-                max_price=alert["max_price"],
-                site="both", 
-                limit=10 
-            )
-            
-            if results:
-                print(f"ALERT MATCH for {alert['user_email']}: Found {len(results)} cars.")
-                send_email_notification(
-                    alert['user_email'], 
-                    results, 
-                    f"{alert['make']} {alert['model']}"
-                )
+            if from_db:
+                # Crawler-ul ține modelul la zi: doar anunțurile noi / schimbate după last_checked
+                matches = await async_car_db.get_alert_candidates(alert, ALERT_CANDIDATES_LIMIT)
+                # Lista tăiată la limită: last_checked rămâne pe loc, restul vin la verificările următoare
+                truncated = len(matches) >= ALERT_CANDIDATES_LIMIT
+            else:
+                matches = [car for car in results if alert_matches(alert, car)]
+                truncated = False
+            await _notify_new_matches(alert, matches, None if truncated else checked_at)
         except Exception as e:
-            print(f"Eroare la verificarea alertei {alert['id']}: {e}")
\ No newline at end of file
+            print(f"Eroare la verificarea alertei {alert['id']}: {e}")
+
+async def check_alerts():
+    alerts = await async_car_db.get_alerts()
+    groups = plan_alert_groups(alerts)
+    print(f"[Scheduler] Verific {len(alerts)} alerte ({len(groups)} căutări)...")
+
+    semaphore = asyncio.Semaphore(ALERT_GROUP_CONCURRENCY)
+    await asyncio.gather(*(_check_alert_group(group, semaphore) for group in groups))
+
+async def notify_matching_alerts(ads: list) -> int:
+    """
+    Potrivește anunțurile noi / ieftinite văzute de crawler direct pe alert_index, fără căutare.
+    ads: dict-uri cu make, model, price (ca new_ads / price_drops din bulk_upsert_ads).
+    Întoarce numărul de emailuri trimise.
+    """
+    if not ads:
+        return 0
+    # Alertele pot fi adăugate / șterse și din alt proces (API-ul vs crawler-ul)
+    version = await async_car_db.get_alerts_version()
+    if version != alert_index.version:
+        alert_index.build(await async_car_db.get_alerts(), version)
+
+    matches = {}
+    for ad in ads:
+        for alert in alert_index.match(ad.get("make"), ad.get("model"), ad.get("price")):
+            matches.setdefault(alert["id"], (alert, []))[1].append(ad)
+
+    notified = 0
+    for alert, cars in matches.values():
+        notified += await _notify_new_matches(alert, cars)
+    return notified
@@ -0,0 +1,225 @@
+"""
+Ingest Pipeline
+Drumul crawler-ului de la scrapere la DB, separat de search_cars (care servește utilizatorii:
+cache TTL, filtrare strictă/lejeră pe model, update_search_stats, enrichment la afișare).
+Anunțurile curg în flux: fiecare scraper produce pagini (iter_olx_pages / iter_autovit_pages)
+într-o coadă mărginită, iar consumatorul le normalizează și le scrie în loturi de
+INGEST_BATCH_SIZE. Memoria e constantă indiferent câte pagini are ținta: cel mult
+INGEST_QUEUE_PAGES pagini în coadă și un lot în lucru.
+"""
+
+import asyncio
+import functools
+import logging
+import re
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+
+from async_db import async_car_db
+from crawl_scheduler import RECENTLY_SEEN_HOURS, IncrementalStop
+from enrichment import apply_enrichment, enrich_ads, is_missing_image
+from functii import PARTS_KEYWORDS, map_autovit_model, model_tokens_match, notify_matching_alerts
+from price_anomaly import PriceAnomalyDetector
+from scraper.autovit_scraper import iter_autovit_pages
+from scraper.olx_scraper import iter_olx_pages
+
+INGEST_BATCH_SIZE = 200      # anunțuri per tranzacție (bulk_upsert_ads)
+INGEST_QUEUE_PAGES = 4       # pagini în așteptare; scraperele stau cât timp coada e plină
+INGEST_MAX_LISTINGS = 1000   # per sursă
+INGEST_MAX_PAGES = 20        # per sursă
+
+
+def _new_totals() -> Dict:
+    return {"inserted": 0, "updated": 0, "unchanged": 0, "invalid": 0, "skipped": 0, "deleted": 0,
+            "price_changes": 0, "price_drops": 0, "failed_batches": 0}
+
+
+# "Seria 3" / "Clasa E": anunțurile scriu de obicei codul motorizării (320d, E220), nu numele seriei
+_SERIES_MODEL = re.compile(r"(?:seria|series|clasa|class)\s*-?\s*([a-z0-9])")
+
+
+def _tokens(text: str) -> set:
+    return set(t for t in re.split(r"[^a-z0-9]", (text or "").lower()) if t)
+
+
+def _matches_model(tokens: set, model: str, model_aliases: Iterable[str]) -> bool:
+    if any(model_tokens_match(_tokens(name), tokens) for name in (model, *model_aliases)):
+        return True
+    series = _SERIES_MODEL.fullmatch((model or "").strip().lower())
+    if series:
+        code = re.compile(rf"{series.group(1)}\d{{2,3}}[a-z]*")
+        return any(code.fullmatch(token) for token in tokens)
+    return False
+
+
+def listing_to_ad(listing: dict, make: str, model: str, model_aliases: Iterable[str] = ()) -> Optional[dict]:
+    """
+    Anunțul din scraper -> rândul pentru bulk_upsert_ads; None pentru piese / fără preț / altă marcă
+    sau alt model. Căutarea OLX e text liber ("bmw x5" întoarce și X6, X3), deci anunțul e păstrat
+    doar dacă titlul / link-ul conține modelul țintei sau un alias (ex. slug-ul Autovit "seria-3").
+    """
+    raw_price = str(listing.get("price", ""))
+    digits = re.sub(r"\D", "", raw_price)
+    if not digits:
+        return None
+    price = int(digits)
+    if "ron" in raw_price.lower() or "lei" in raw_price.lower():
+        price = int(price / 5)
+
+    tokens = _tokens(f"{listing.get('title') or ''} {listing.get('link') or ''}")
+    if not _tokens(make).issubset(tokens) or tokens & PARTS_KEYWORDS:
+        return None
+    if not _matches_model(tokens, model, model_aliases):
+        return None
+
+    return {
+        "id": listing.get("id"),
+        "source": listing.get("subsource") or listing.get("source", "Unknown"),
+        "make": make,
+        "model": model,
+        "title": listing.get("title"),
+        "link": listing.get("link"),
+        "image": listing.get("image"),
+        "price": price,
+        "year": listing.get("year"),
+        "km": listing.get("km"),
+        "fuel": listing.get("fuel"),
+    }
+
+
+async def _produce(pages: AsyncIterator[List[dict]], stop: Optional[IncrementalStop], queue: asyncio.Queue):
+    try:
+        async with aclosing(pages):
+            async for page_ads in pages:
+                # Verificat înainte ca pagina să fie scrisă, altfel anunțurile ei noi ar părea deja văzute
+                stopped = stop is not None and await stop(page_ads)
+                await queue.put(page_ads)
+                if stopped:
+                    break
+    except asyncio.CancelledError:
+        # Anulat de stream_listings: consumatorul nu mai citește, un put() pe coada plină ar bloca
+        raise
+    except Exception as e:
+        logging.warning(f"[Ingest] Sursă oprită de eroare: {e}")
+    await queue.put(None)
+
+
+async def stream_listings(make: str, model: str, *, newest_first: bool = False,
+                          stop_after_seen: Optional[int] = None, budgets: Optional[Dict] = None,
+                          limit: int = INGEST_MAX_LISTINGS) -> AsyncIterator[dict]:
+    """
+    Anunțurile brute de pe OLX și Autovit, pe măsură ce sosesc (sursele rulează în paralel).
+    newest_first + stop_after_seen: crawl incremental (vezi crawl_scheduler.IncrementalStop);
+    budgets: {"olx": bucket, "autovit": bucket} împărțite între țintele crawl-ate în paralel.
+    """
+    budgets = budgets or {}
+    params = await async_car_db.get_optimized_search_params(make, model, None, None)
+    price_check = PriceAnomalyDetector.from_market_stats(await async_car_db.get_market_stats(make, model))
+    options = {
+        "min_year": params["min_year"],
+        "max_year": params["max_year"],
+        "price_check": price_check,
+        "newest_first": newest_first,
+    }
+    sources = [
+        iter_olx_pages(f"{make} {params['normalized_model']}", limit=limit, max_pages=INGEST_MAX_PAGES,
+                       throttle=budgets.get("olx"), **options),
+        iter_autovit_pages(make, map_autovit_model(make, model), limit=limit, max_pages=INGEST_MAX_PAGES,
+                           throttle=budgets.get("autovit"), **options),
+    ]
+
+    def stopper():
+        if not stop_after_seen:
+            return None
+        return IncrementalStop(functools.partial(async_car_db.get_recently_seen_ids, hours=RECENTLY_SEEN_HOURS),
+                               stop_after_seen)
+
+    queue = asyncio.Queue(maxsize=INGEST_QUEUE_PAGES)
+    producers = [asyncio.create_task(_produce(pages, stopper(), queue)) for pages in sources]
+    try:
+        remaining = len(producers)
+        while remaining:
+            page_ads = await queue.get()
+            if page_ads is None:
+                remaining -= 1
+                continue
+            for listing in page_ads:
+                yield listing
+    finally:
+        for task in producers:
+            task.cancel()
+        await asyncio.gather(*producers, return_exceptions=True)
+
+
+async def _repair_batch(batch: List[dict], totals: Dict, budgets: Optional[Dict] = None) -> List[dict]:
+    """
+    Imaginile lipsă din pagina de detaliu (concurență limitată, vezi enrichment; din aceleași
+    bugete per site ca listările); anunțurile moarte sunt șterse
+    """
+    repairs = await enrich_ads([ad for ad in batch if ad.get("id") and is_missing_image(ad.get("image"))],
+                               budgets)
+    if not repairs:
+        return batch
+    kept = []
+    for ad in batch:
+        details = repairs.get(ad.get("id"))
+        if details and not details["alive"]:
+            logging.info(f"🗑️ Found GHOST AD (404/Redirect): {ad.get('title')}. Deleting...")
+            await async_car_db.delete_ad(ad["id"])
+            totals["deleted"] += 1
+            continue
+        if details:
+            apply_enrichment(ad, details)
+        kept.append(ad)
+    return kept
+
+
+async def flush_batch(batch: List[dict], totals: Dict, budgets: Optional[Dict] = None):
+    if not batch:
+        return
+    ads = list(batch)
+    batch.clear()
+    try:
+        ads = await _repair_batch(ads, totals, budgets)
+        res = await async_car_db.bulk_upsert_ads(ads)
+    except Exception as e:
+        # Un lot eșuat nu oprește restul țintei
+        logging.warning(f"Failed to upsert batch: {e}")
+        totals["failed_batches"] += 1
+        return
+    for key in ("inserted", "updated", "unchanged", "invalid"):
+        totals[key] += res[key]
+    for change in res["price_changes"]:
+        logging.info(f"💶 Price change: {change['title']} {change['old_price']} -> {change['new_price']}")
+    totals["price_changes"] += len(res["price_changes"])
+    totals["price_drops"] += len(res["price_drops"])
+
+    # Alertele se declanșează direct din anunțurile noi / ieftinite ale acestui lot
+    fresh = res["new_ads"] + [{**drop, "price": drop["new_price"]} for drop in res["price_drops"]]
+    try:
+        notified = await notify_matching_alerts(fresh)
+        if notified:
+            logging.info(f"🔔 Notified {notified} alerts.")
+    except Exception as e:
+        logging.warning(f"Alert matching failed: {e}")
+
+
+async def ingest_target(make: str, model: str, *, full: bool = True, stop_after_seen: Optional[int] = None,
+                        budgets: Optional[Dict] = None) -> Dict:
+    """Crawl-ul unei ținte, de la scrapere până în ads; întoarce totalurile upsert-ului"""
+    totals = _new_totals()
+    batch = []
+    model_aliases = (map_autovit_model(make, model),)
+    listings = stream_listings(make, model, newest_first=not full,
+                               stop_after_seen=None if full else stop_after_seen, budgets=budgets)
+    async with aclosing(listings):
+        async for listing in listings:
+            ad = listing_to_ad(listing, make, model, model_aliases)
+            if ad is None:
+                totals["skipped"] += 1
+                continue
+            batch.append(ad)
+            if len(batch) >= INGEST_BATCH_SIZE:
+                await flush_batch(batch, totals, budgets)
+    await flush_batch(batch, totals, budgets)
+    return totals
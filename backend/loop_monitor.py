@@ -0,0 +1,54 @@
+"""
+Event Loop Lag Monitor
+Măsoară cât întârzie event loop-ul față de un sleep programat. O valoare mare
+înseamnă că ceva rulează cod blocant (ex. SQLite sincron) direct pe loop.
+"""
+
+import asyncio
+import logging
+import time
+
+
+class EventLoopLagMonitor:
+    def __init__(self, interval: float = 0.5, warn_ms: float = 200.0):
+        self.interval = interval
+        self.warn_ms = warn_ms
+        self.samples = 0
+        self.current_ms = 0.0
+        self.avg_ms = 0.0
+        self.max_ms = 0.0
+        self._task = None
+
+    async def run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (time.perf_counter() - start - self.interval) * 1000)
+            self.samples += 1
+            self.current_ms = lag_ms
+            self.max_ms = max(self.max_ms, lag_ms)
+            # Medie exponențială, ca valoarea să reflecte ultimele ~20 de eșantioane
+            self.avg_ms = lag_ms if self.samples == 1 else 0.9 * self.avg_ms + 0.1 * lag_ms
+            if lag_ms > self.warn_ms:
+                logging.warning(f"[LoopLag] Event loop blocat {lag_ms:.0f} ms")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def snapshot(self) -> dict:
+        return {
+            "current_ms": round(self.current_ms, 2),
+            "avg_ms": round(self.avg_ms, 2),
+            "max_ms": round(self.max_ms, 2),
+            "samples": self.samples,
+        }
+
+
+loop_lag_monitor = EventLoopLagMonitor()
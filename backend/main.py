@@ -1,15 +1,46 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-import threading, time
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
 from scraper.olx_scraper import scrape_olx
 from scraper.autovit_scraper import scrape_autovit
-from functii import search_cars, add_alert, check_alerts
+from functii import search_cars, search_cars_db, is_stale, schedule_refresh, enrich_listings, add_alert, check_alerts
 from car_database import car_db_optimizer, get_optimized_search_params
+from async_db import async_car_db
+from loop_monitor import loop_lag_monitor
+from pagination import DEFAULT_PAGE_SIZE, clamp_page_size, decode_cursor, result_snapshots, snapshot_page
+from stats_writer import search_stats_writer
+from notifications import notification_dispatcher
+from price_model import score_listings
+from enrichment import MAX_ENRICH_IDS
+from scheduler import app_scheduler
 import logging 
 logging.basicConfig(level=logging.INFO)
 
-app = FastAPI(title="Car Sniper API")
+ALERTS_INTERVAL = 10   # secunde între verificările alertelor
+
+
+async def run_alerts_job():
+    logging.info("[Scheduler] Verific alertele...")
+    await check_alerts()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_lag_monitor.start()
+    # Alertele rulează într-un singur worker (lease în DB), fără suprapuneri între rulări
+    app_scheduler.add_job("alerts", run_alerts_job, ALERTS_INTERVAL, jitter=2, leader=True)
+    app_scheduler.start()
+    yield
+    await app_scheduler.stop()
+    loop_lag_monitor.stop()
+    search_stats_writer.close()
+    notification_dispatcher.close()
+    async_car_db.shutdown()
+    car_db_optimizer.db.close_all()
+
+
+app = FastAPI(title="Car Sniper API", lifespan=lifespan)
 
 # ---------------- CORS ----------------
 app.add_middleware(
@@ -30,7 +61,6 @@ def decode_vin(vin: str):
     # Exemplu simplificat
     return {"vin": vin, "make": "BMW", "model": "330e", "year": 2019}
 
-import asyncio
 
 @app.get("/api/search")
 async def api_search(
@@ -47,11 +77,67 @@ async def api_search(
     generation: str | None = None,
     limit: int = 50,
     max_pages: int = 5,
-    sort: str = "price_asc"
+    sort: str = "price_asc",
+    mode: str = "live",
+    cursor: str | None = None,
+    page_size: int = DEFAULT_PAGE_SIZE
 ):
     """
     Cauta masini pe OLX sau Autovit si filtreaza dupa max_price
+    mode: live (scraping direct), db (doar anunțurile salvate de crawler),
+          hybrid (DB imediat + refresh în fundal dacă datele sunt vechi)
+    Rezultatele sunt paginate: răspunsul are next_cursor, de trimis ca `cursor`
+    (cu aceiași parametri) pentru pagina următoare.
     """
+    mode = (mode or "live").lower()
+    if mode not in ("live", "db", "hybrid"):
+        return {"error": "Mod necunoscut. Foloseste 'live', 'db' sau 'hybrid'."}
+    page_size = clamp_page_size(page_size)
+
+    page_cursor = None
+    if cursor:
+        try:
+            page_cursor = decode_cursor(cursor, sort)
+        except ValueError as e:
+            return {"error": str(e)}
+        if page_cursor["t"] == "live":
+            # Pagina următoare dintr-o căutare live: din snapshot, fără un nou scraping
+            snapshot = result_snapshots.get(page_cursor["s"])
+            if snapshot is None:
+                return {"error": "Rezultatele au expirat. Repetă căutarea."}
+            page = snapshot_page(snapshot, page_size, page_cursor["s"], page_cursor["o"])
+            return {**page, "mode": mode}
+
+    if mode in ("db", "hybrid") or page_cursor is not None:
+        # Aici page_cursor e doar de tip "db" (cele "live" au fost servite mai sus)
+        page = await search_cars_db(
+            make=make,
+            model=model,
+            site=site,
+            min_price=min_price,
+            max_price=max_price,
+            min_year=min_year,
+            max_year=max_year,
+            max_km=max_km,
+            sort=sort,
+            page_size=page_size,
+            cursor=page_cursor
+        )
+        if mode == "db" or page_cursor is not None:
+            return {**page, "mode": mode}
+
+        freshness = await async_car_db.get_ads_freshness(make, model)
+        if freshness["count"]:
+            refreshing = is_stale(freshness["last_seen"]) and await schedule_refresh(make, model)
+            return {
+                **page,
+                "mode": "hybrid",
+                "last_seen": freshness["last_seen"],
+                "refreshing": refreshing
+            }
+        # Model necunoscut în DB: răspundem doar live, fără un crawl în plus pentru aceleași anunțuri;
+        # căutarea intră în search_stats, iar seed_crawl_targets îl face țintă dacă e căutat des
+
     # Force deeper scan for Autovit/OLX to ensure full results (User requested limit 100 pages)
     if max_pages < 100:
         max_pages = 100
@@ -77,11 +163,21 @@ async def api_search(
     )
     
     # Manual Sort since we are not using SQL
+    # (pe o copie: lista vine din cache-ul search_cars și poate fi deja într-un snapshot)
+    results = list(results)
+    # deal_score pe tot setul dintr-o singură trecere vectorizată, cu modelul deja potrivit
+    price_model = await async_car_db.get_price_model(make, model) if make and model else None
+    results = score_listings([dict(r) for r in results], price_model)
     reverse = True if "desc" in sort else False
     key = "price"
     if "year" in sort: key = "year"
     elif "km" in sort: key = "km"
     
+    if "deal" in sort:
+        # Cele mai bune oferte primele; anunțurile fără scor la final
+        results.sort(key=lambda x: (x.get("deal_score") is None, -(x.get("deal_score") or 0)))
+        return {**snapshot_page(results, page_size), "mode": mode}
+
     try:
         results.sort(key=lambda x: int(str(x.get(key, 0)).replace(" ", "").replace("€", "") or 0), reverse=reverse)
         if "asc" in sort and not reverse: # Python default is asc, but my reverse logic was for desc
@@ -90,7 +186,7 @@ async def api_search(
     except:
         pass
 
-    return {"results": results}
+    return {**snapshot_page(results, page_size), "mode": mode}
 
 class AlertRequest(BaseModel):
     user_email: str
@@ -104,6 +200,19 @@ def api_create_alert(req: AlertRequest):
     alert = add_alert(req.user_email, req.make, req.model, req.max_price)
     return {"alert": alert}
 
+class EnrichRequest(BaseModel):
+    ids: list[str]
+
+@app.post("/api/enrich")
+async def api_enrich(req: EnrichRequest):
+    """
+    Imagine, preț și alive pentru anunțurile marcate needs_enrichment (doar cele afișate)
+    """
+    ids = list(dict.fromkeys(req.ids))
+    if len(ids) > MAX_ENRICH_IDS:
+        return {"error": f"Maxim {MAX_ENRICH_IDS} anunțuri per cerere"}
+    return {"results": await enrich_listings(ids)}
+
 @app.get("/api/scrape")
 async def api_scrape(site: str = "olx", make: str = "audi", model: str = "a4", page: int = 1):
     """
@@ -119,14 +228,19 @@ async def api_scrape(site: str = "olx", make: str = "audi", model: str = "a4", p
 
     return {"results": results}
 
-# ---------------- Scheduler alerte ----------------
-def run_alerts_scheduler():
-    while True:
-        logging.info("[Scheduler] Verific alertele...")
-        asyncio.run(check_alerts())
-        time.sleep(10)
+@app.get("/api/metrics/loop-lag")
+def get_loop_lag():
+    """
+    Întârzierea event loop-ului (ms); valori mari = cod blocant pe loop
+    """
+    return loop_lag_monitor.snapshot()
 
-threading.Thread(target=run_alerts_scheduler, daemon=True).start()
+@app.get("/api/metrics/scheduler")
+def get_scheduler_metrics():
+    """
+    Joburile periodice: rulări, eșecuri, durate, tick-uri sărite și cine deține lease-ul
+    """
+    return app_scheduler.snapshot()
 
 # ---------------- Database Optimization Endpoints ----------------
 
@@ -372,12 +486,26 @@ def get_models_for_brand(brand: str):
     except Exception as e:
         return {"error": f"Eroare la obținerea modelelor: {str(e)}"}
 
+@app.get("/api/price-drops")
+def get_price_drops(make: str = None, model: str = None, hours: int = 24, limit: int = 50):
+    """
+    Anunțurile care s-au ieftinit în ultimele `hours` ore (din istoricul scris de crawler)
+    """
+    drops = car_db_optimizer.get_price_drops(make, model, hours=hours, limit=limit)
+    return {"drops": drops, "hours": hours}
+
 @app.get("/api/stats/{make}/{model}")
 def get_model_stats(make: str, model: str):
     """
     Obține statistici despre un model (preț mediu, an mediu etc.)
+    Din market_stats (materializate peste anunțurile active: medii, percentile, histogramă km);
+    pentru modelele fără anunțuri în DB rămân statisticile din căutări.
     """
-    stats = car_db_optimizer.get_model_stats(make, model)
+    search_stats = car_db_optimizer.get_model_stats(make, model)
+    stats = car_db_optimizer.get_market_stats(make, model)
     if not stats:
-        return {"error": "Nu există statistici pentru acest model încă."}
+        if not search_stats:
+            return {"error": "Nu există statistici pentru acest model încă."}
+        return search_stats
+    stats["search_count"] = search_stats["search_count"] if search_stats else 0
     return stats
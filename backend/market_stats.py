@@ -0,0 +1,303 @@
+"""
+Market Stats Module
+Statistici de piață materializate peste tabela ads, per (make_norm, model_norm, interval de ani):
+număr de anunțuri, medii, percentile de preț (p10/p25/mediană/p75/p90) dintr-un sketch
+de cuantile mergeable și o histogramă de km.
+
+- upsert-urile aplică delte (anunț adăugat / scos din statistică) în aceeași tranzacție
+- rebuild_market_stats reconstruiește totul vectorizat cu NumPy (după dezactivarea anunțurilor vechi)
+- citirea pentru /api/stats combină câteva rânduri (câte unul per interval de ani), nu scanează ads
+"""
+
+import json
+import math
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from scraper.attributes import parse_int
+
+# Sketch de cuantile cu eroare relativă garantată (stil DDSketch): bucket-uri logaritmice,
+# deci două sketch-uri se combină adunând numărătorile, iar o valoare poate fi și scoasă.
+SKETCH_ALPHA = 0.02
+_GAMMA = (1 + SKETCH_ALPHA) / (1 - SKETCH_ALPHA)
+_LOG_GAMMA = math.log(_GAMMA)
+
+QUANTILES = {"p10": 0.10, "p25": 0.25, "median": 0.50, "p75": 0.75, "p90": 0.90}
+
+YEAR_BUCKET = 3          # ani per interval (2015-2017, 2018-2020...)
+UNKNOWN_YEAR_BUCKET = 0  # anunțuri fără an
+KM_BIN = 25000
+KM_BINS = 17             # 0-25k, ..., 375k-400k, 400k+
+
+# (make_norm, model_norm, year, km, price)
+MarketItem = Tuple[str, str, Optional[int], Optional[int], int]
+
+
+class QuantileSketch:
+    def __init__(self, buckets: Dict[int, int] = None):
+        self.buckets = buckets or {}
+
+    @staticmethod
+    def bucket_index(value: float) -> int:
+        return int(math.ceil(math.log(value) / _LOG_GAMMA))
+
+    @staticmethod
+    def bucket_value(index: int) -> float:
+        # Mijlocul bucket-ului (gamma^(i-1), gamma^i]: eroare relativă <= SKETCH_ALPHA
+        return 2 * _GAMMA ** index / (_GAMMA + 1)
+
+    @property
+    def count(self) -> int:
+        return sum(self.buckets.values())
+
+    def add(self, value: float, count: int = 1):
+        if value <= 0:
+            return
+        index = self.bucket_index(value)
+        new_count = self.buckets.get(index, 0) + count
+        if new_count > 0:
+            self.buckets[index] = new_count
+        else:
+            self.buckets.pop(index, None)
+
+    def remove(self, value: float):
+        self.add(value, -1)
+
+    def merge(self, other: "QuantileSketch"):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def quantile(self, q: float) -> Optional[float]:
+        total = self.count
+        if total <= 0:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return self.bucket_value(index)
+        return self.bucket_value(max(self.buckets))
+
+    def to_json(self) -> str:
+        return json.dumps({str(k): v for k, v in self.buckets.items()}, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, raw: Optional[str]) -> "QuantileSketch":
+        if not raw:
+            return cls()
+        return cls({int(k): v for k, v in json.loads(raw).items()})
+
+
+def year_bucket(year: Optional[int]) -> int:
+    if not year:
+        return UNKNOWN_YEAR_BUCKET
+    return int(year) // YEAR_BUCKET * YEAR_BUCKET
+
+
+def km_bin(km: int) -> int:
+    return min(int(km) // KM_BIN, KM_BINS - 1)
+
+
+class _Cell:
+    """Un rând din market_stats, decodat"""
+
+    def __init__(self, row: Optional[tuple] = None):
+        if row is None:
+            self.count, self.price_sum = 0, 0.0
+            self.year_count, self.year_sum = 0, 0.0
+            self.km_count, self.km_sum = 0, 0.0
+            self.sketch = QuantileSketch()
+            self.km_hist = [0] * KM_BINS
+            return
+        (self.count, self.price_sum, self.year_count, self.year_sum,
+         self.km_count, self.km_sum, sketch_json, km_hist_json) = row
+        self.sketch = QuantileSketch.from_json(sketch_json)
+        self.km_hist = json.loads(km_hist_json) if km_hist_json else [0] * KM_BINS
+
+    def apply(self, year: Optional[int], km: Optional[int], price: int, sign: int):
+        self.count += sign
+        self.price_sum += sign * price
+        self.sketch.add(price, sign)
+        if year:
+            self.year_count += sign
+            self.year_sum += sign * year
+        if km is not None:
+            self.km_count += sign
+            self.km_sum += sign * km
+            self.km_hist[km_bin(km)] += sign
+
+    def merge(self, other: "_Cell"):
+        self.count += other.count
+        self.price_sum += other.price_sum
+        self.year_count += other.year_count
+        self.year_sum += other.year_sum
+        self.km_count += other.km_count
+        self.km_sum += other.km_sum
+        self.sketch.merge(other.sketch)
+        self.km_hist = [a + b for a, b in zip(self.km_hist, other.km_hist)]
+
+    def row(self, key: Tuple[str, str, int], updated_at: int) -> tuple:
+        quantiles = [self.sketch.quantile(q) for q in QUANTILES.values()]
+        return (*key, self.count, self.price_sum, self.year_count, self.year_sum,
+                self.km_count, self.km_sum, self.sketch.to_json(), json.dumps(self.km_hist),
+                *quantiles, updated_at)
+
+    def summary(self) -> Dict:
+        summary = {
+            "count": self.count,
+            "avg_price": self.price_sum / self.count if self.count else None,
+            "avg_year": self.year_sum / self.year_count if self.year_count else None,
+            "avg_km": self.km_sum / self.km_count if self.km_count else None,
+        }
+        for name, q in QUANTILES.items():
+            summary[name] = self.sketch.quantile(q)
+        return summary
+
+
+_CELL_COLUMNS = "ad_count, price_sum, year_count, year_sum, km_count, km_sum, price_sketch, km_hist"
+
+_UPSERT_CELL_SQL = f"""
+    INSERT OR REPLACE INTO market_stats (
+        make_norm, model_norm, year_bucket, {_CELL_COLUMNS},
+        {", ".join(QUANTILES)}, updated_at
+    ) VALUES ({", ".join("?" * (11 + len(QUANTILES) + 1))})
+"""
+
+
+def apply_market_deltas(cursor, added: Iterable[MarketItem], removed: Iterable[MarketItem]):
+    """Actualizare incrementală: anunțuri intrate în / ieșite din statistică (în tranzacția apelantului)"""
+    deltas: Dict[Tuple[str, str, int], List[tuple]] = {}
+    for sign, items in ((1, added), (-1, removed)):
+        for make_norm, model_norm, year, km, price in items:
+            if not make_norm or not model_norm or not price or price <= 0:
+                continue
+            year, km = parse_int(year), parse_int(km)
+            key = (make_norm, model_norm, year_bucket(year))
+            deltas.setdefault(key, []).append((year, km, price, sign))
+    if not deltas:
+        return
+
+    updated_at = int(time.time())
+    rows = []
+    for key, changes in deltas.items():
+        cursor.execute(
+            f"SELECT {_CELL_COLUMNS} FROM market_stats WHERE make_norm = ? AND model_norm = ? AND year_bucket = ?",
+            key
+        )
+        cell = _Cell(cursor.fetchone())
+        for year, km, price, sign in changes:
+            cell.apply(year, km, price, sign)
+        if cell.count <= 0:
+            cursor.execute(
+                "DELETE FROM market_stats WHERE make_norm = ? AND model_norm = ? AND year_bucket = ?", key
+            )
+            continue
+        rows.append(cell.row(key, updated_at))
+    cursor.executemany(_UPSERT_CELL_SQL, rows)
+
+
+def rebuild_market_stats(cursor) -> int:
+    """
+    Reconstruiește market_stats din anunțurile active, vectorizat: bucket-urile sketch-ului și
+    ale histogramei sunt calculate cu NumPy pe toate anunțurile deodată, iar numărătorile per
+    (grup, bucket) vin dintr-un singur np.unique. Întoarce numărul de rânduri scrise.
+    """
+    cursor.execute("""
+        SELECT make_norm, model_norm, year, km, price FROM ads
+        WHERE active = 1 AND price > 0 AND make_norm IS NOT NULL AND model_norm IS NOT NULL
+    """)
+    data = cursor.fetchall()
+    cursor.execute("DELETE FROM market_stats")
+    if not data:
+        return 0
+
+    makes, models, years, kms, prices = zip(*data)
+    prices = np.asarray(prices, dtype=np.float64)
+    years = np.asarray([parse_int(y) or 0 for y in years], dtype=np.int64)
+    kms = [parse_int(k) for k in kms]
+    has_km = np.asarray([k is not None for k in kms], dtype=bool)
+    kms = np.asarray([k or 0 for k in kms], dtype=np.int64)
+
+    # Grupul fiecărui anunț: (make, model, interval de ani), codificat ca un singur întreg
+    model_keys, model_of = np.unique(
+        np.asarray([f"{a}\x1f{b}" for a, b in zip(makes, models)], dtype=object), return_inverse=True
+    )
+    year_buckets = np.where(years > 0, years // YEAR_BUCKET * YEAR_BUCKET, UNKNOWN_YEAR_BUCKET)
+    bucket_keys, bucket_of = np.unique(year_buckets, return_inverse=True)
+    groups, group_of = np.unique(model_of.ravel() * len(bucket_keys) + bucket_of.ravel(), return_inverse=True)
+    group_of = group_of.ravel()
+    n_groups = len(groups)
+
+    count = np.bincount(group_of, minlength=n_groups)
+    price_sum = np.bincount(group_of, weights=prices, minlength=n_groups)
+    has_year = years > 0
+    year_count = np.bincount(group_of, weights=has_year, minlength=n_groups)
+    year_sum = np.bincount(group_of, weights=np.where(has_year, years, 0), minlength=n_groups)
+    km_count = np.bincount(group_of, weights=has_km, minlength=n_groups)
+    km_sum = np.bincount(group_of, weights=np.where(has_km, kms, 0), minlength=n_groups)
+
+    # Sketch: (grup, bucket) -> număr
+    sketch_index = np.ceil(np.log(prices) / _LOG_GAMMA).astype(np.int64)
+    offset = sketch_index.min()
+    span = sketch_index.max() - offset + 1
+    pairs, pair_counts = np.unique(group_of * span + (sketch_index - offset), return_counts=True)
+    sketches = [dict() for _ in range(n_groups)]
+    for pair, pair_count in zip(pairs.tolist(), pair_counts.tolist()):
+        sketches[pair // span][pair % span + offset] = pair_count
+
+    # Histogramă km: bincount pe (grup, bin) doar pentru anunțurile cu km
+    km_bins = np.minimum(kms // KM_BIN, KM_BINS - 1)
+    km_hist = np.bincount(group_of[has_km] * KM_BINS + km_bins[has_km], minlength=n_groups * KM_BINS)
+    km_hist = km_hist.reshape(n_groups, KM_BINS)
+
+    updated_at = int(time.time())
+    rows = []
+    for g, group in enumerate(groups.tolist()):
+        make_norm, model_norm = model_keys[group // len(bucket_keys)].split("\x1f")
+        bucket = int(bucket_keys[group % len(bucket_keys)])
+        cell = _Cell((int(count[g]), float(price_sum[g]), int(year_count[g]), float(year_sum[g]),
+                      int(km_count[g]), float(km_sum[g]), None, None))
+        cell.sketch = QuantileSketch(sketches[g])
+        cell.km_hist = km_hist[g].tolist()
+        rows.append(cell.row((make_norm, model_norm, bucket), updated_at))
+    cursor.executemany(_UPSERT_CELL_SQL, rows)
+    return len(rows)
+
+
+def read_market_stats(cursor, make_norm: str, model_norm: str) -> Optional[Dict]:
+    """Statisticile unui model: totalul (rândurile per interval de ani combinate) + detaliul pe ani"""
+    cursor.execute(f"""
+        SELECT year_bucket, {_CELL_COLUMNS}, updated_at FROM market_stats
+        WHERE make_norm = ? AND model_norm = ?
+        ORDER BY year_bucket
+    """, (make_norm, model_norm))
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+
+    total = _Cell()
+    by_year = []
+    updated_at = 0
+    for row in rows:
+        cell = _Cell(row[1:-1])
+        total.merge(cell)
+        updated_at = max(updated_at, row[-1] or 0)
+        bucket = row[0]
+        by_year.append({
+            "year_from": bucket if bucket != UNKNOWN_YEAR_BUCKET else None,
+            "year_to": bucket + YEAR_BUCKET - 1 if bucket != UNKNOWN_YEAR_BUCKET else None,
+            **cell.summary(),
+        })
+
+    return {
+        **total.summary(),
+        "km_histogram": [
+            {"km_from": i * KM_BIN, "km_to": (i + 1) * KM_BIN if i < KM_BINS - 1 else None, "count": c}
+            for i, c in enumerate(total.km_hist)
+        ],
+        "by_year": by_year,
+        "updated_at": updated_at,
+    }
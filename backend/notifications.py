@@ -0,0 +1,208 @@
+"""
+Notification Dispatcher
+Emailurile de alertă nu mai sunt trimise pe loc (smtplib blocant, câte o conexiune SMTP +
+STARTTLS + login per email): sunt puse într-o coadă și trimise de un thread de fundal care:
+- ține o singură conexiune SMTP autentificată deschisă între loturi (NOOP înainte de refolosire)
+- la fiecare interval golește coada și comasează notificările aceluiași utilizator într-un digest
+- reîncearcă cu backoff exponențial emailurile eșuate, până la SEND_MAX_ATTEMPTS
+
+Configurare din env: SENDER_EMAIL, SENDER_PASSWORD, SMTP_HOST, SMTP_PORT, SMTP_STARTTLS.
+Fără parolă nu se face login (obligatorie doar pentru serverul implicit, Gmail), deci un server SMTP local (ex. `python -m aiosmtpd -n -l localhost:1025`
+cu SMTP_HOST=localhost, SMTP_PORT=1025, SMTP_STARTTLS=0) poate ține locul serverului real la teste.
+"""
+
+import atexit
+import logging
+import os
+import smtplib
+import threading
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Dict, List, Optional
+
+SEND_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 30      # secunde; dublat la fiecare încercare
+SMTP_IDLE_TIMEOUT = 300    # conexiunea e închisă după atâta timp fără emailuri
+DEFAULT_SMTP_HOST = "smtp.gmail.com"
+
+
+class _Notification:
+    __slots__ = ("to_email", "sections", "attempts", "not_before")
+
+    def __init__(self, to_email: str, sections: List[tuple]):
+        self.to_email = to_email
+        self.sections = sections      # [(search_details, car_list)]
+        self.attempts = 0
+        self.not_before = 0.0
+
+
+def render_digest(sections: List[tuple]) -> tuple:
+    """(subiect, HTML) pentru toate căutările unui utilizator dintr-un lot"""
+    total = sum(len(cars) for _, cars in sections)
+    searches = ", ".join(details for details, _ in sections)
+    subject = f"Car Sniper: {total} mașini regăsite pentru {searches}"
+    html_content = ""
+    for search_details, car_list in sections:
+        html_content += f"<h2>Salut! Am găsit {len(car_list)} mașini pentru căutarea ta ({search_details}):</h2><br>"
+        for car in car_list:
+            html_content += f"""
+            <div style="border:1px solid #ddd; padding:10px; margin-bottom:10px; border-radius:5px;">
+                <h3><a href='{car.get('link') or car.get('url')}'>{car.get('title')}</a></h3>
+                <p><strong>Preț: {car.get('price')}</strong> | An: {car.get('year') or '?'} | Km: {car.get('km') or '?'}</p>
+            </div>
+            """
+    return subject, html_content
+
+
+class NotificationDispatcher:
+    def __init__(self, flush_interval: float = 2.0):
+        self.flush_interval = flush_interval
+        self.sender_email = os.environ.get("SENDER_EMAIL")
+        self.sender_password = os.environ.get("SENDER_PASSWORD")
+        self.smtp_host = os.environ.get("SMTP_HOST", DEFAULT_SMTP_HOST)
+        self.smtp_port = int(os.environ.get("SMTP_PORT", "587"))
+        self.smtp_starttls = os.environ.get("SMTP_STARTTLS", "1").lower() not in ("0", "false", "no")
+        self._queue: List[_Notification] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()   # conexiunea SMTP e folosită de un singur flush odată
+        self._stop = threading.Event()
+        self._thread = None
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._smtp_last_used = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        # Gmail nu acceptă trimitere fără login; un server propriu (SMTP_HOST) poate să nu ceară parolă
+        if self.smtp_host == DEFAULT_SMTP_HOST and not self.sender_password:
+            return False
+        return bool(self.sender_email)
+
+    def enqueue(self, to_email: str, car_list: list, search_details: str):
+        """Pune un email în coadă (non-blocant); trimis la următorul lot"""
+        if not self.enabled or not car_list:
+            return
+        with self._lock:
+            self._queue.append(_Notification(to_email, [(search_details, list(car_list))]))
+        self._ensure_started()
+
+    def _take_due(self) -> Dict[str, _Notification]:
+        """Scoate din coadă notificările scadente, comasate per destinatar"""
+        now = time.time()
+        digests: Dict[str, _Notification] = {}
+        with self._lock:
+            waiting = []
+            for item in self._queue:
+                if item.not_before > now:
+                    waiting.append(item)
+                    continue
+                digest = digests.get(item.to_email)
+                if digest is None:
+                    digests[item.to_email] = item
+                else:
+                    digest.sections.extend(item.sections)
+                    digest.attempts = max(digest.attempts, item.attempts)
+            self._queue = waiting
+        return digests
+
+    def _connection(self) -> smtplib.SMTP:
+        if self._smtp is not None:
+            try:
+                self._smtp.noop()
+                return self._smtp
+            except (smtplib.SMTPException, OSError):
+                self._close_connection()
+        smtp = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=30)
+        if self.smtp_starttls:
+            smtp.starttls()
+        if self.sender_password:
+            smtp.login(self.sender_email, self.sender_password)
+        self._smtp = smtp
+        return smtp
+
+    def _close_connection(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._smtp = None
+
+    def _send(self, item: _Notification):
+        subject, html_content = render_digest(item.sections)
+        msg = MIMEMultipart()
+        msg['From'] = self.sender_email
+        msg['To'] = item.to_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(html_content, 'html'))
+        try:
+            self._connection().send_message(msg)
+        except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError):
+            # Conexiunea refolosită a căzut între NOOP și trimitere: încă o dată pe una nouă
+            self._close_connection()
+            self._connection().send_message(msg)
+        self._smtp_last_used = time.time()
+
+    def flush(self) -> int:
+        """Trimite lotul scadent; întoarce numărul de emailuri trimise"""
+        with self._flush_lock:
+            return self._flush_due()
+
+    def _flush_due(self) -> int:
+        digests = self._take_due()
+        sent = 0
+        for item in digests.values():
+            try:
+                self._send(item)
+                sent += 1
+                print(f"✅ Email trimis cu succes către {item.to_email}")
+            except Exception as e:
+                item.attempts += 1
+                if item.attempts >= SEND_MAX_ATTEMPTS:
+                    print(f"❌ Eroare la trimiterea emailului către {item.to_email}, renunț: {e}")
+                    continue
+                item.not_before = time.time() + RETRY_BASE_DELAY * 2 ** (item.attempts - 1)
+                logging.warning(f"[Email] Trimitere eșuată către {item.to_email} "
+                                f"(încercarea {item.attempts}), reîncerc: {e}")
+                with self._lock:
+                    self._queue.append(item)
+        if self._smtp is not None and time.time() - self._smtp_last_used > SMTP_IDLE_TIMEOUT:
+            self._close_connection()
+        return sent
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def close(self):
+        """
+        Oprește dispatcher-ul: tot ce e în coadă (inclusiv emailurile care își așteaptă
+        reîncercarea) primește o ultimă încercare; cele care eșuează și acum sunt logate.
+        """
+        self._stop.set()
+        with self._flush_lock:
+            with self._lock:
+                for item in self._queue:
+                    item.not_before = 0.0
+            self._flush_due()
+            self._close_connection()
+            with self._lock:
+                dropped, self._queue = self._queue, []
+        for item in dropped:
+            cars = sum(len(car_list) for _, car_list in item.sections)
+            logging.error(f"[Email] Netrimis la oprire către {item.to_email} "
+                          f"({cars} mașini, {item.attempts} încercări)")
+
+
+notification_dispatcher = NotificationDispatcher()
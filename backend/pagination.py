@@ -0,0 +1,144 @@
+"""
+Pagination Module
+Paginare pe server pentru /api/search, cu cursor opac (base64 peste JSON):
+- mod DB: keyset pe (cheia de sortare, rowid), vezi CarDatabaseOptimizer.search_ads_page
+- mod live: rezultatele scrapate sunt păstrate într-un snapshot, iar paginile sunt
+  citite din el (fără un nou scraping și fără să trimitem tot setul la client)
+"""
+
+import base64
+import binascii
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+def clamp_page_size(page_size: Optional[int]) -> int:
+    if not page_size or page_size < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+def encode_cursor(data: Dict) -> str:
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _valid_live_cursor(data: Dict) -> bool:
+    return isinstance(data.get("s"), str) and _is_int(data.get("o")) and data["o"] >= 0
+
+
+def _valid_db_cursor(data: Dict, sort: Optional[str]) -> bool:
+    after = data.get("a")
+    if not (isinstance(after, list) and len(after) == 2 and _is_int(after[1])):
+        return False
+    if after[0] is not None and (isinstance(after[0], bool) or not isinstance(after[0], (int, float, str))):
+        return False
+    if data.get("m") is not None and not isinstance(data["m"], str):
+        return False
+    if data.get("n") is not None and not _is_int(data["n"]):
+        return False
+    # Poziția keyset are sens doar pentru sortarea cu care a fost creată
+    return sort is None or data.get("k") == sort
+
+
+def decode_cursor(cursor: str, sort: Optional[str] = None) -> Dict:
+    """
+    ValueError pentru un cursor invalid (modificat de client, dintr-o versiune veche sau,
+    pentru cursoarele DB, refolosit cu alt `sort` decât cel al paginii care l-a creat)
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Cursor invalid")
+    if not isinstance(data, dict):
+        raise ValueError("Cursor invalid")
+    if data.get("t") == "live":
+        valid = _valid_live_cursor(data)
+    elif data.get("t") == "db":
+        valid = _valid_db_cursor(data, sort)
+    else:
+        valid = False
+    if not valid:
+        raise ValueError("Cursor invalid")
+    return data
+
+
+class ResultSnapshotStore:
+    """
+    Snapshot-uri ale rezultatelor live, în memorie: LRU limitat ca număr și cu TTL.
+    Un snapshot expirat înseamnă că utilizatorul trebuie să repete căutarea.
+    """
+
+    def __init__(self, max_snapshots: int = 200, ttl: float = 900):
+        self.max_snapshots = max_snapshots
+        self.ttl = ttl
+        self._snapshots: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, results: List[Dict]) -> str:
+        snapshot_id = uuid.uuid4().hex
+        with self._lock:
+            self._snapshots[snapshot_id] = (time.time(), results)
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        return snapshot_id
+
+    def get(self, snapshot_id: str) -> Optional[List[Dict]]:
+        with self._lock:
+            entry = self._snapshots.get(snapshot_id)
+            if entry is None:
+                return None
+            created, results = entry
+            if time.time() - created > self.ttl:
+                del self._snapshots[snapshot_id]
+                return None
+            self._snapshots.move_to_end(snapshot_id)
+            return results
+
+
+result_snapshots = ResultSnapshotStore()
+
+
+def snapshot_page(results: List[Dict], page_size: int, snapshot_id: str = None, offset: int = 0) -> Dict:
+    """
+    O pagină dintr-un set de rezultate live. La prima pagină (snapshot_id None)
+    setul este salvat și primește un ID; paginile următoare îl refolosesc.
+    """
+    if snapshot_id is None:
+        snapshot_id = result_snapshots.put(results)
+    end = offset + page_size
+    return {
+        "results": results[offset:end],
+        "next_cursor": encode_cursor({"t": "live", "s": snapshot_id, "o": end}) if end < len(results) else None,
+        "total": len(results),
+        "page_size": page_size,
+    }
+
+
+def db_page_response(page: Dict, page_size: int, total: Optional[int], sort: str) -> Dict:
+    """
+    Răspunsul pentru o pagină din search_ads_page; totalul (calculat la prima pagină) și
+    sortarea (verificată de decode_cursor) sunt purtate în cursor
+    """
+    next_cursor = None
+    if page["next"] is not None:
+        next_cursor = encode_cursor({"t": "db", "a": list(page["next"]), "m": page["model_match"], "n": total,
+                                     "k": sort})
+    return {
+        "results": page["results"],
+        "next_cursor": next_cursor,
+        "total": total,
+        "page_size": page_size,
+    }
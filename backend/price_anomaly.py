@@ -0,0 +1,58 @@
+"""
+Price Anomaly Module
+Detector de prețuri suspecte per (make, model), din percentilele materializate în market_stats.
+Un preț e suspect dacă iese mult din banda [p10, p90] a modelului pentru intervalul lui de ani:
+mult sub (rată lunară, avans, preț trunchiat la parsare) sau mult peste (zerouri în plus).
+Scraperele fac fetch pe pagina de detaliu doar pentru anunțurile semnalate.
+"""
+
+from typing import Dict, Optional, Tuple
+
+from market_stats import UNKNOWN_YEAR_BUCKET, year_bucket
+from scraper.attributes import parse_int
+
+MIN_BAND_ADS = 8          # sub atât anunțuri într-un interval de ani folosim banda întregului model
+LOW_FACTOR = 0.5          # sub jumătate din p10 -> suspect
+HIGH_FACTOR = 2.0         # peste dublul p90 -> suspect
+FALLBACK_MIN_PRICE = 2000 # model fără statistici: doar prețurile care arată a rată lunară / avans
+
+Band = Tuple[float, float]
+
+
+class PriceAnomalyDetector:
+    def __init__(self, bands: Dict[int, Band] = None, model_band: Optional[Band] = None):
+        self.bands = bands or {}
+        self.model_band = model_band
+
+    @classmethod
+    def from_market_stats(cls, stats: Optional[Dict]) -> "PriceAnomalyDetector":
+        """Din rezultatul read_market_stats (None = model necunoscut, doar pragul minim)"""
+        if not stats:
+            return cls()
+
+        def band(summary: Dict) -> Optional[Band]:
+            if summary.get("count", 0) < MIN_BAND_ADS or not summary.get("p10") or not summary.get("p90"):
+                return None
+            return summary["p10"] * LOW_FACTOR, summary["p90"] * HIGH_FACTOR
+
+        bands = {}
+        for row in stats.get("by_year", []):
+            row_band = band(row)
+            if row_band:
+                bands[row["year_from"] or UNKNOWN_YEAR_BUCKET] = row_band
+        return cls(bands, band(stats))
+
+    def band(self, year=None) -> Optional[Band]:
+        return self.bands.get(year_bucket(parse_int(year))) or self.model_band
+
+    def is_suspicious(self, price, year=None) -> bool:
+        price = parse_int(price) or 0
+        if price <= 0:
+            return True
+        band = self.band(year)
+        if band is None:
+            return price < FALLBACK_MIN_PRICE
+        low, high = band
+        return price < low or price > high
+
+    __call__ = is_suspicious
@@ -0,0 +1,139 @@
+"""
+Price Model Module
+Model de preț per (make_norm, model_norm): log(preț) regresat pe vechime și log(1 + km),
+potrivit în batch cu NumPy peste tabela ads și salvat ca și coeficienți (tabela price_models).
+Reziduul fiecărui anunț devine deal_score: cât de sub (sau peste) prețul așteptat este.
+Scorarea unui set de rezultate e o singură trecere vectorizată, fără re-fit.
+"""
+
+import datetime
+import json
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from scraper.attributes import parse_int
+
+MIN_SAMPLES = 20        # sub atât nu potrivim un model pentru (make, model)
+OUTLIER_SIGMAS = 3.0    # anunțurile cu reziduu mai mare sunt scoase la al doilea fit (prețuri greșite)
+
+# Coloanele matricei de design; an/km lipsă sunt înlocuite cu 0 + indicator de lipsă
+FEATURES = ("intercept", "age", "log_km", "year_missing", "km_missing")
+
+
+def design_matrix(years: Iterable, kms: Iterable, ref_year: int) -> np.ndarray:
+    years = np.asarray([parse_int(y) or 0 for y in years], dtype=np.float64)
+    kms = np.asarray([-1 if parse_int(k) is None else parse_int(k) for k in kms], dtype=np.float64)
+    year_missing = years <= 0
+    km_missing = kms < 0
+    return np.column_stack([
+        np.ones(len(years)),
+        np.where(year_missing, 0.0, np.maximum(ref_year - years, 0)),
+        np.where(km_missing, 0.0, np.log1p(np.maximum(kms, 0))),
+        year_missing.astype(np.float64),
+        km_missing.astype(np.float64),
+    ])
+
+
+def fit_price_model(years: List, kms: List, prices: List, ref_year: int = None) -> Optional[Dict]:
+    """Coeficienții modelului (dict salvabil ca JSON) sau None dacă sunt prea puține anunțuri"""
+    prices = np.asarray(prices, dtype=np.float64)
+    valid = prices > 0
+    if valid.sum() < MIN_SAMPLES:
+        return None
+    ref_year = ref_year or datetime.date.today().year
+
+    X = design_matrix(np.asarray(years, dtype=object)[valid], np.asarray(kms, dtype=object)[valid], ref_year)
+    y = np.log(prices[valid])
+
+    # lstsq tolerează coloane constante / colineare (ex. niciun anunț cu km)
+    coef = np.linalg.lstsq(X, y, rcond=None)[0]
+    residuals = y - X @ coef
+    keep = np.abs(residuals) <= OUTLIER_SIGMAS * max(residuals.std(), 1e-9)
+    if MIN_SAMPLES <= keep.sum() < len(y):
+        X, y = X[keep], y[keep]
+        coef = np.linalg.lstsq(X, y, rcond=None)[0]
+        residuals = y - X @ coef
+
+    return {
+        "ref_year": ref_year,
+        "coef": [float(c) for c in coef],
+        "resid_std": float(residuals.std()),
+        "n_samples": int(len(y)),
+    }
+
+
+def expected_prices(model: Dict, years: Iterable, kms: Iterable) -> np.ndarray:
+    X = design_matrix(years, kms, model["ref_year"])
+    return np.exp(X @ np.asarray(model["coef"]))
+
+
+def deal_scores(model: Dict, years: Iterable, kms: Iterable, prices: Iterable) -> np.ndarray:
+    """
+    (preț așteptat - preț) / preț așteptat: 0.15 = cu 15% sub piață, negativ = peste.
+    NaN pentru anunțurile fără preț.
+    """
+    prices = np.asarray([parse_int(p) or 0 for p in prices], dtype=np.float64)
+    expected = expected_prices(model, years, kms)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(prices > 0, (expected - prices) / expected, np.nan)
+
+
+def score_listings(listings: List[Dict], model: Optional[Dict]) -> List[Dict]:
+    """Adaugă deal_score și expected_price pe fiecare anunț (None fără model sau fără preț)"""
+    if not listings:
+        return listings
+    if not model:
+        for listing in listings:
+            listing.setdefault("deal_score", None)
+        return listings
+    years = [l.get("year") for l in listings]
+    kms = [l.get("km") for l in listings]
+    expected = expected_prices(model, years, kms)
+    scores = deal_scores(model, years, kms, [l.get("price") for l in listings])
+    for listing, score, exp_price in zip(listings, scores.tolist(), expected.tolist()):
+        listing["deal_score"] = None if np.isnan(score) else round(score, 4)
+        listing["expected_price"] = int(round(exp_price))
+    return listings
+
+
+def fit_all_price_models(cursor) -> int:
+    """
+    Re-fit pentru toate modelele din anunțurile active: salvează coeficienții în price_models
+    și recalculează ads.deal_score. Întoarce numărul de modele potrivite.
+    """
+    cursor.execute("""
+        SELECT id, make_norm, model_norm, year, km, price FROM ads
+        WHERE active = 1 AND make_norm IS NOT NULL AND model_norm IS NOT NULL
+        ORDER BY make_norm, model_norm
+    """)
+    groups: Dict[tuple, List[tuple]] = {}
+    for ad_id, make_norm, model_norm, year, km, price in cursor.fetchall():
+        groups.setdefault((make_norm, model_norm), []).append((ad_id, year, km, price))
+
+    fitted_at = int(time.time())
+    ref_year = datetime.date.today().year
+    model_rows = []
+    score_rows = []
+    for (make_norm, model_norm), ads in groups.items():
+        ids, years, kms, prices = zip(*ads)
+        prices = [parse_int(p) or 0 for p in prices]
+        model = fit_price_model(list(years), list(kms), prices, ref_year)
+        if not model:
+            continue
+        model_rows.append((make_norm, model_norm, json.dumps(model), model["n_samples"], fitted_at))
+        scores = deal_scores(model, years, kms, prices)
+        score_rows.extend(
+            (None if np.isnan(score) else round(score, 4), ad_id)
+            for ad_id, score in zip(ids, scores.tolist())
+        )
+
+    cursor.execute("DELETE FROM price_models")
+    cursor.executemany(
+        "INSERT INTO price_models (make_norm, model_norm, model_json, n_samples, fitted_at) VALUES (?, ?, ?, ?, ?)",
+        model_rows
+    )
+    cursor.execute("UPDATE ads SET deal_score = NULL WHERE deal_score IS NOT NULL")
+    cursor.executemany("UPDATE ads SET deal_score = ? WHERE id = ?", score_rows)
+    return len(model_rows)
@@ -0,0 +1,51 @@
+"""
+Rate Limit Module
+Bugete de cereri per site (token bucket), împărțite de toate țintele pe care crawler-ul
+le parcurge în paralel: oricâte ținte rulează odată, OLX și Autovit primesc cel mult
+`rate` cereri pe secundă (cu rafale de până la `burst`). Scraperele primesc bucket-ul ca
+`throttle` și îl așteaptă înainte de fiecare cerere (pagină de listare sau de detaliu);
+repararea anunțurilor din ingest (enrichment.enrich_ads) folosește aceleași bucket-uri.
+"""
+
+import asyncio
+import time
+from typing import Dict
+
+# site -> (cereri pe secundă, rafală maximă)
+SITE_REQUEST_RATES = {
+    "olx": (1.0, 5),
+    "autovit": (0.5, 3),
+}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.waits = 0
+        # Așteptările sunt servite în ordine: cine a cerut primul primește primul token
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                self.waits += 1
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    async def __call__(self):
+        await self.acquire()
+
+
+def site_budgets() -> Dict[str, TokenBucket]:
+    """Câte un bucket per site, de creat o dată per proces (crawler) și împărțit între ținte"""
+    return {site: TokenBucket(rate, burst) for site, (rate, burst) in SITE_REQUEST_RATES.items()}
@@ -0,0 +1,148 @@
+"""
+Async Scheduler
+Joburi periodice rulate pe event loop-ul aplicației (pornite din lifespan-ul FastAPI),
+în locul thread-urilor care creau câte un event loop nou la fiecare rulare:
+- interval + jitter (procesele pornite odată nu lovesc DB-ul / site-urile în același moment)
+- fără suprapuneri: dacă rularea anterioară nu s-a terminat, tick-ul e sărit și numărat
+- metrici per job (rulări, eșecuri, durate) pentru /api/metrics/scheduler
+- joburile cu `leader=True` rulează într-un singur proces: cel care deține lease-ul din
+  tabela scheduler_leases (reînnoit la fiecare tick, și cât timp jobul rulează, preluat de
+  altul doar după expirare)
+"""
+
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+from async_db import async_car_db
+
+# ID-ul acestui proces pentru lease-uri (unic și între mașini care împart volumul DB)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class Job:
+    def __init__(self, name: str, func: Callable[[], Awaitable], interval: float,
+                 jitter: float = 0.0, initial_delay: float = 0.0, leader: bool = False):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.initial_delay = initial_delay
+        self.leader = leader
+        self.lease_ttl = max(3 * interval, 30)
+
+        self.runs = 0
+        self.failures = 0
+        self.skipped_overlap = 0
+        self.skipped_not_leader = 0
+        self.last_started = None
+        self.last_duration_ms = None
+        self.avg_duration_ms = None
+        self.max_duration_ms = 0.0
+        self.last_error = None
+        self.is_leader = False
+        self._running: Optional[asyncio.Task] = None
+
+    def snapshot(self) -> Dict:
+        return {
+            "interval": self.interval,
+            "leader_only": self.leader,
+            "is_leader": self.is_leader if self.leader else None,
+            "running": self._running is not None and not self._running.done(),
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped_overlap": self.skipped_overlap,
+            "skipped_not_leader": self.skipped_not_leader,
+            "last_started": self.last_started,
+            "last_duration_ms": self.last_duration_ms,
+            "avg_duration_ms": self.avg_duration_ms,
+            "max_duration_ms": round(self.max_duration_ms, 2),
+            "last_error": self.last_error,
+        }
+
+
+class AsyncScheduler:
+    def __init__(self, worker_id: str = WORKER_ID):
+        self.worker_id = worker_id
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def add_job(self, name: str, func: Callable[[], Awaitable], interval: float, **options) -> Job:
+        job = Job(name, func, interval, **options)
+        self.jobs[name] = job
+        return job
+
+    async def _execute(self, job: Job):
+        start = time.perf_counter()
+        job.last_started = time.time()
+        try:
+            await job.func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.failures += 1
+            job.last_error = f"{type(e).__name__}: {e}"
+            logging.exception(f"[Scheduler] Jobul {job.name} a eșuat")
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            job.runs += 1
+            job.last_duration_ms = round(duration_ms, 2)
+            job.max_duration_ms = max(job.max_duration_ms, duration_ms)
+            # Medie exponențială, ca la loop_monitor
+            job.avg_duration_ms = round(duration_ms if job.avg_duration_ms is None
+                                        else 0.9 * job.avg_duration_ms + 0.1 * duration_ms, 2)
+
+    async def _holds_lease(self, job: Job) -> bool:
+        try:
+            job.is_leader = await async_car_db.acquire_lease(f"job:{job.name}", self.worker_id, job.lease_ttl)
+        except Exception as e:
+            logging.warning(f"[Scheduler] Lease indisponibil pentru {job.name}: {e}")
+            job.is_leader = False
+        return job.is_leader
+
+    async def _loop(self, job: Job):
+        await asyncio.sleep(job.initial_delay + random.uniform(0, job.jitter))
+        while True:
+            if job._running is not None and not job._running.done():
+                job.skipped_overlap += 1
+                # O rulare mai lungă decât lease_ttl nu trebuie să lase lease-ul să expire sub ea
+                if job.leader and not await self._holds_lease(job):
+                    logging.warning(f"[Scheduler] Lease-ul pentru {job.name} a fost pierdut; opresc rularea")
+                    job._running.cancel()
+            elif job.leader and not await self._holds_lease(job):
+                job.skipped_not_leader += 1
+            else:
+                job._running = asyncio.get_running_loop().create_task(self._execute(job))
+            await asyncio.sleep(job.interval + random.uniform(-job.jitter, job.jitter))
+
+    def start(self):
+        for name, job in self.jobs.items():
+            task = self._tasks.get(name)
+            if task is None or task.done():
+                self._tasks[name] = asyncio.get_running_loop().create_task(self._loop(job))
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for job in self.jobs.values():
+            if job._running is not None:
+                tasks.append(job._running)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = {}
+        for job in self.jobs.values():
+            if job.leader and job.is_leader:
+                # Alt worker poate prelua imediat, fără să aștepte expirarea
+                await async_car_db.release_lease(f"job:{job.name}", self.worker_id)
+                job.is_leader = False
+
+    def snapshot(self) -> Dict:
+        return {"worker_id": self.worker_id, "jobs": {name: job.snapshot() for name, job in self.jobs.items()}}
+
+
+app_scheduler = AsyncScheduler()
@@ -0,0 +1,234 @@
+import re
+import datetime
+
+# Structured attributes (year, km, fuel, cc, hp) extracted from listing cards.
+# Used by both scrapers so filters can be applied before any detail-page fetch.
+
+ATTRIBUTE_KEYS = ("year", "km", "fuel", "cc", "hp")
+
+_MAX_YEAR = datetime.date.today().year + 1
+
+_YEAR_RE = re.compile(r"(?<![\d.,])(19[5-9]\d|20\d{2})(?!\d|[.,]\d)(?!\s*(?:cm|cc|cp|hp|ps|kw))", re.I)
+_KM_RE = re.compile(r"(?<![\d.,])(\d{1,3}(?:[.\s, ]\d{3})+|\d{1,7})\s*km\b", re.I)
+_CC_RE = re.compile(r"(?<![\d.,])(\d[\d.\s]{2,5})\s*(?:cm3|cm³|cmc|cc)\b", re.I)
+_LITERS_RE = re.compile(r"(?<![\d.,])([1-6][.,]\d)\s*(?:l\b|tdi|tsi|tfsi|fsi|tdci|cdi|crdi|hdi|dci|jtd|d\b|i\b|t\b|mpi|v6|v8)", re.I)
+_NUMBER_RE = re.compile(r"\d{1,3}(?:[.\s, ]\d{3})+(?!\d)|\d+")
+_HP_RE = re.compile(r"(?<![\d.,])(\d{2,4})\s*(cp|hp|ps|bhp|kw)\b", re.I)
+
+_FUEL_KEYWORDS = [
+    ("Hibrid", ("hibrid", "hybrid", "phev", "plug-in")),
+    ("Electric", ("electric", "electrica", "ev")),
+    ("GPL", ("gpl", "lpg")),
+    ("Diesel", ("diesel", "motorina", "tdi", "cdi", "hdi", "dci", "crdi", "tdci", "jtd", "multijet", "bluehdi")),
+    ("Benzina", ("benzina", "petrol", "gasoline", "tsi", "tfsi", "fsi", "mpi", "vti", "ecoboost")),
+]
+
+# Fuel types reported by Autovit / schema.org mapped to display labels
+_FUEL_ALIASES = {
+    "diesel": "Diesel",
+    "motorina": "Diesel",
+    "petrol": "Benzina",
+    "benzina": "Benzina",
+    "gasoline": "Benzina",
+    "petrol-lpg": "GPL",
+    "benzina + gpl": "GPL",
+    "lpg": "GPL",
+    "gpl": "GPL",
+    "hybrid": "Hibrid",
+    "hibrid": "Hibrid",
+    "plugin-hybrid": "Hibrid",
+    "electric": "Electric",
+    "electricity": "Electric",
+}
+
+
+def parse_int(value) -> int | None:
+    """Parse '150.000 km' / '1 995 cm3' / 2016 into an int, None if no digits."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    # First number only, thousands separators allowed ("1 995 cm3" -> 1995, not 19953)
+    m = _NUMBER_RE.search(str(value))
+    return int(re.sub(r"\D", "", m.group(0))) if m else None
+
+
+def normalize_fuel(value) -> str | None:
+    if not value:
+        return None
+    text = str(value).strip().lower()
+    # schema.org values can be URLs (https://schema.org/Diesel)
+    text = text.rsplit("/", 1)[-1]
+    if text in _FUEL_ALIASES:
+        return _FUEL_ALIASES[text]
+    return detect_fuel(text) or str(value).strip().title()
+
+
+def detect_fuel(text: str) -> str | None:
+    tokens = set(t for t in re.split(r"[^a-z0-9-]", (text or "").lower()) if t)
+    for label, keywords in _FUEL_KEYWORDS:
+        if any(k in tokens for k in keywords):
+            return label
+    # BMW style model codes: 320d, 520d, x5 30d
+    if re.search(r"\b\d{2,3}d\b", (text or "").lower()):
+        return "Diesel"
+    return None
+
+
+def extract_attributes(text: str) -> dict:
+    """
+    Fallback regex extractor for free text (titles, card parameter lines).
+    Ex: "320d 2016 150.000 km" -> {"year": 2016, "km": 150000, "fuel": "Diesel"}
+    Only keys that were found are returned.
+    """
+    attrs = {}
+    if not text:
+        return attrs
+
+    # Km first, so its digits are not mistaken for a year
+    km_match = _KM_RE.search(text)
+    if km_match:
+        km_val = parse_int(km_match.group(1))
+        if km_val is not None and km_val < 2_000_000:
+            attrs["km"] = km_val
+        text_wo_km = text[:km_match.start()] + " " + text[km_match.end():]
+    else:
+        text_wo_km = text
+
+    for m in _YEAR_RE.finditer(text_wo_km):
+        year_val = int(m.group(1))
+        if 1950 <= year_val <= _MAX_YEAR:
+            attrs["year"] = year_val
+            break
+
+    cc_match = _CC_RE.search(text)
+    if cc_match:
+        cc_val = parse_int(cc_match.group(1))
+        if cc_val and 500 <= cc_val <= 8500:
+            attrs["cc"] = cc_val
+    else:
+        liters_match = _LITERS_RE.search(text)
+        if liters_match:
+            attrs["cc"] = int(round(float(liters_match.group(1).replace(",", ".")) * 1000))
+
+    hp_match = _HP_RE.search(text)
+    if hp_match:
+        hp_val = int(hp_match.group(1))
+        if hp_match.group(2).lower() == "kw":
+            hp_val = int(round(hp_val * 1.341))
+        if 30 <= hp_val <= 2000:
+            attrs["hp"] = hp_val
+
+    fuel = detect_fuel(text)
+    if fuel:
+        attrs["fuel"] = fuel
+
+    return attrs
+
+
+def attributes_from_parameters(params: dict) -> dict:
+    """Map Autovit card parameters (data-parameter -> text) to attributes."""
+    attrs = {}
+    year_val = parse_int(params.get("year") or params.get("first_registration_year"))
+    if year_val and 1950 <= year_val <= _MAX_YEAR:
+        attrs["year"] = year_val
+    km_val = parse_int(params.get("mileage"))
+    if km_val is not None:
+        attrs["km"] = km_val
+    cc_val = parse_int(params.get("engine_capacity"))
+    if cc_val:
+        attrs["cc"] = cc_val
+    power = params.get("engine_power")
+    if power:
+        hp_val = parse_int(power)
+        if hp_val and "kw" in str(power).lower():
+            hp_val = int(round(hp_val * 1.341))
+        if hp_val:
+            attrs["hp"] = hp_val
+    fuel = normalize_fuel(params.get("fuel_type"))
+    if fuel:
+        attrs["fuel"] = fuel
+    return attrs
+
+
+def attributes_from_schema(item: dict) -> dict:
+    """Read attributes from a schema.org Car object (Autovit JSON-LD)."""
+    attrs = {}
+    if not isinstance(item, dict):
+        return attrs
+
+    def _value(node):
+        if isinstance(node, dict):
+            return node.get("value"), str(node.get("unitCode") or node.get("unitText") or "")
+        return node, ""
+
+    year_raw = item.get("vehicleModelDate") or item.get("modelDate") or item.get("productionDate")
+    year_val = parse_int(str(year_raw)[:4]) if year_raw else None
+    if year_val and 1950 <= year_val <= _MAX_YEAR:
+        attrs["year"] = year_val
+
+    km_raw, _ = _value(item.get("mileageFromOdometer"))
+    km_val = parse_int(str(km_raw).split(".")[0]) if km_raw is not None else None
+    if km_val is not None:
+        attrs["km"] = km_val
+
+    fuel = normalize_fuel(item.get("fuelType"))
+    if fuel:
+        attrs["fuel"] = fuel
+
+    engine = item.get("vehicleEngine")
+    if isinstance(engine, list):
+        engine = engine[0] if engine else None
+    if isinstance(engine, dict):
+        cc_raw, cc_unit = _value(engine.get("engineDisplacement"))
+        if cc_raw is not None:
+            try:
+                cc_float = float(str(cc_raw).replace(",", "."))
+                # Some listings report liters ("LTR") instead of cm3 ("CMQ")
+                attrs["cc"] = int(round(cc_float * 1000)) if cc_unit.upper() == "LTR" or cc_float < 20 else int(cc_float)
+            except ValueError:
+                pass
+        hp_raw, hp_unit = _value(engine.get("enginePower"))
+        hp_val = parse_int(str(hp_raw).split(".")[0]) if hp_raw is not None else None
+        if hp_val:
+            if hp_unit.upper() == "KWT":
+                hp_val = int(round(hp_val * 1.341))
+            attrs["hp"] = hp_val
+        if "fuel" not in attrs:
+            fuel = normalize_fuel(engine.get("fuelType"))
+            if fuel:
+                attrs["fuel"] = fuel
+
+    return attrs
+
+
+def fill_attributes(ad: dict, *sources: dict) -> dict:
+    """Fill missing attribute keys on `ad` from the given sources, in priority order."""
+    for attrs in sources:
+        for key in ATTRIBUTE_KEYS:
+            if ad.get(key) in (None, "") and attrs.get(key) not in (None, ""):
+                ad[key] = attrs[key]
+    return ad
+
+
+def matches_filters(
+    ad: dict,
+    *,
+    min_year: int | None = None,
+    max_year: int | None = None,
+    max_km: int | None = None,
+    min_cc: int | None = None,
+    min_hp: int | None = None,
+) -> bool:
+    """Attribute filters. Unknown values pass, same as the checks in search_cars."""
+    year_val = parse_int(ad.get("year"))
+    km_val = parse_int(ad.get("km"))
+    cc_val = parse_int(ad.get("cc"))
+    hp_val = parse_int(ad.get("hp"))
+
+    if min_year is not None and year_val is not None and year_val < min_year: return False
+    if max_year is not None and year_val is not None and year_val > max_year: return False
+    if max_km is not None and km_val is not None and km_val > max_km: return False
+    if min_cc is not None and cc_val is not None and cc_val < min_cc: return False
+    if min_hp is not None and hp_val is not None and hp_val < min_hp: return False
+    return True
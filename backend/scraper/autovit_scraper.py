@@ -2,7 +2,17 @@ import aiohttp
 import asyncio
 import re
 import json
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable
 from bs4 import BeautifulSoup
+from scraper.attributes import (
+    attributes_from_parameters,
+    attributes_from_schema,
+    extract_attributes,
+    fill_attributes,
+    matches_filters,
+)
+from scraper.listing_ids import canonical_ad_id
 
 BASE_URL = "https://www.autovit.ro/autoturisme/{}/{}"
 
@@ -14,12 +24,40 @@ async def scrape_autovit(
     max_pages: int = 5,
     enrich: bool = False,
     *,
+    stop_paging: Callable[[list[dict]], Awaitable[bool]] | None = None,
+    **options,
+):
+    # stop_paging(page_ads) -> True to stop after this page (incremental crawl, with newest_first).
+    # Other options are passed to iter_autovit_pages.
+    results = []
+    async with aclosing(iter_autovit_pages(make, model, page, limit, max_pages, **options)) as pages:
+        async for page_ads in pages:
+            results.extend(page_ads)
+            if stop_paging is not None and await stop_paging(page_ads):
+                break
+    return results
+
+async def iter_autovit_pages(
+    make: str,
+    model: str,
+    page: int = 1,
+    limit: int = 100,
+    max_pages: int = 5,
+    *,
     min_price: int | None = None,
     max_price: int | None = None,
     min_year: int | None = None,
     max_year: int | None = None,
     max_km: int | None = None,
-):
+    min_cc: int | None = None,
+    min_hp: int | None = None,
+    price_check: Callable[[int, int | None], bool] | None = None,
+    newest_first: bool = False,
+    throttle: Callable[[], Awaitable[None]] | None = None,
+) -> AsyncIterator[list[dict]]:
+    # Yields the ads one results page at a time (at most `limit` in total), so callers can
+    # stream them without holding the whole search in memory.
+    # throttle() is awaited before every request (shared per-site budget, see rate_limit.py)
     USER_AGENTS = [
         "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
         "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
@@ -31,9 +69,23 @@ async def scrape_autovit(
 
     import random
 
-    results: list[dict] = []
+    # HTML-fallback ads are parsed (and enriched) inside fetch_page; they wait here until the page is yielded
+    html_ads: list[dict] = []
     seen_links_total: set[str] = set()
-    scrape_stats = {"dupes": 0, "invalid": 0}
+    scrape_stats = {"dupes": 0, "invalid": 0, "filtered": 0}
+
+    def _passes_filters(ad: dict) -> bool:
+        if matches_filters(ad, min_year=min_year, max_year=max_year,
+                           max_km=max_km, min_cc=min_cc, min_hp=min_hp):
+            return True
+        scrape_stats["filtered"] += 1
+        return False
+
+    def _price_suspicious(price: int, year) -> bool:
+        # price_check(price, year) comes from the per-model price bands; without it keep the old cut-off
+        if price_check is not None:
+            return price_check(price, year)
+        return price < 15000
 
     # --- Helper: Fetch Details with FRESH Session ---
     async def _fetch_next_data_details(url: str) -> tuple[str | None, str | None]:
@@ -47,6 +99,8 @@ async def scrape_autovit(
         }
         
         try:
+            if throttle is not None:
+                await throttle()
             # Fresh Session
             async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False)) as sess:
                 async with sess.get(url, headers=headers_det, timeout=8) as r:
@@ -108,6 +162,8 @@ async def scrape_autovit(
             params["search[filter_float_year:from]"] = str(min_year)
         if max_km is not None:
             params["search[filter_float_mileage:to]"] = str(max_km)
+        if newest_first:
+            params["search[order]"] = "created_at_first:desc"
 
         url = BASE_URL.format(make.lower(), model.lower())
         
@@ -129,12 +185,16 @@ async def scrape_autovit(
         }
 
         page_ads = []
+        # Listings seen on the page before attribute filtering (a fully filtered page is not an empty page)
+        scrape_stats["page_raw"] = 0
         
         try:
             # Fresh Session
             async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False)) as sess:
                 # Random Sleep before request (human behavior)
                 await asyncio.sleep(random.uniform(0.5, 1.5))
+                if throttle is not None:
+                    await throttle()
                 
                 async with sess.get(url, params=params, headers=headers_req, timeout=12) as response:
                     if response.status == 429:
@@ -188,14 +248,19 @@ async def scrape_autovit(
                         if price_raw:
                             try:
                                 final_price = int(float(price_raw))
-                                page_ads.append({
+                                ad = {
+                                    "id": canonical_ad_id(link),
                                     "title": name,
                                     "price": f"{final_price} €",
                                     "link": link,
                                     "image": img_url,
                                     "subsource": "Autovit"
-                                })
+                                }
                                 found_json = True
+                                scrape_stats["page_raw"] += 1
+                                fill_attributes(ad, attributes_from_schema(item), extract_attributes(name))
+                                if _passes_filters(ad):
+                                    page_ads.append(ad)
                             except: pass
                 except: pass
             
@@ -240,6 +305,17 @@ async def scrape_autovit(
                         img = art.find("img")
                         image_url = img.get("src") if img else None
 
+                        # Card parameters (<dd data-parameter="mileage">150 000 km</dd>), title as fallback
+                        card_params = {
+                            el["data-parameter"]: el.get_text(" ", strip=True)
+                            for el in art.find_all(attrs={"data-parameter": True})
+                        }
+                        scrape_stats["page_raw"] += 1
+                        attrs = {}
+                        fill_attributes(attrs, attributes_from_parameters(card_params), extract_attributes(title))
+                        if not _passes_filters(attrs):
+                            continue
+
                         # Async Fallback
                         p_num = 0
                         try: p_num = int(float(str(price).replace("€", "").strip()))
@@ -248,8 +324,8 @@ async def scrape_autovit(
                         # Deep fetch if:
                         # 1. Price is 0 or invalid
                         # 2. Image is missing
-                        # 3. Price is too low (e.g. 9000 vs 90000) - Likely monthly rate or parsing error
-                        needs_enrichment = (p_num < 15000) or (not image_url)
+                        # 3. Price is implausible (e.g. 9000 vs 90000) - Likely monthly rate or parsing error
+                        needs_enrichment = _price_suspicious(p_num, attrs.get("year")) or (not image_url)
                         
                         if needs_enrichment:
                             try:
@@ -283,12 +359,14 @@ async def scrape_autovit(
                         # I will check scrape_stats AND mark seen.
                         
                         seen_links_total.add(lnk)
-                        results.append({
+                        html_ads.append({
+                            "id": canonical_ad_id(lnk),
                             "title": title,
                             "price": f"{price} €",
                             "link": lnk,
                             "image": image_url,
-                            "subsource": "Autovit"
+                            "subsource": "Autovit",
+                            **attrs
                         })
                     except: pass
             
@@ -298,26 +376,37 @@ async def scrape_autovit(
             # print(f"Error fetching page {page_num}: {e}")
             return None
 
+    def take_html_ads() -> list[dict]:
+        taken = html_ads[:]
+        html_ads.clear()
+        return taken
+
     # --- Main Loop ---
     # Sequential / Batched Loop
     current_p = page
     empty_pages = 0
     failed_pages = []
+    found = 0
     
-    while len(results) < limit:
+    while found < limit:
         # Fetch 1 page at a time (Sequential = Safest logic for Fresh Sessions)
         if current_p > max_pages: break
         
         ads = await fetch_page(current_p)
+        page_results = take_html_ads()
         
         if ads is None:
             # Error / 429
             # Skip and continue, AND mark for retry
             failed_pages.append(current_p)
             current_p += 1
+            if page_results:
+                page_results = page_results[:limit - found]
+                found += len(page_results)
+                yield page_results
             continue
             
-        if len(ads) == 0:
+        if len(ads) == 0 and scrape_stats["page_raw"] == 0:
             empty_pages += 1
             if empty_pages >= 2: break # Stop if 2 empty pages
         else:
@@ -325,56 +414,54 @@ async def scrape_autovit(
             
         # Enrich and Add
         # Concurrent enrichment
+        enrich_ads = []
         enrich_tasks = []
         for ad in ads:
             if ad["link"] not in seen_links_total:
                 seen_links_total.add(ad["link"])
+                page_results.append(ad)
                 # Check quality
                 p_n = 0
                 try: p_n = int(ad["price"].replace("€","").strip())
                 except: pass
                 
-                if (p_n < 15000 or not ad["image"]):
+                if _price_suspicious(p_n, ad.get("year")) or not ad["image"]:
+                    enrich_ads.append((ad, p_n))
                     enrich_tasks.append(_fetch_next_data_details(ad["link"]))
-                else:
-                    results.append(ad)
         
         # Execute enrichment
         if enrich_tasks:
             enriched_data = await asyncio.gather(*enrich_tasks)
-            # Basic re-merge logic (simplified)
-            for idx, e_data in enumerate(enriched_data):
-                p_new, i_new = e_data
-                # We need to find which ad this belongs to... 
-                # Actually, easier to just add them raw and let functii.py repair them.
-                # But we want to use the data if we have it now.
-                pass
+            for (ad, p_n), (p_new, i_new) in zip(enrich_ads, enriched_data):
+                # Same rule as the HTML path: take the detail price if it is higher or we had 0
+                try:
+                    if p_new and int(p_new) > p_n:
+                        ad["price"] = f"{p_new} €"
+                except ValueError:
+                    pass
+                if i_new and not ad["image"]:
+                    ad["image"] = i_new
 
-        # Re-loop over ads to append (after seen check)
-        for ad in ads:
-             # Just ensure it's in results (seen check handled above)
-             # But wait, seen check was inside the enrich loop.
-             # Let's simple-add again to be sure
-             if ad["link"] not in [r["link"] for r in results]:
-                 results.append(ad)
+        page_results = page_results[:limit - found]
+        found += len(page_results)
+        yield page_results
 
         current_p += 1
-        
-        # Global limit check
-        if len(results) >= limit: break
 
     # --- Retry Phase ---
-    if failed_pages:
+    if failed_pages and found < limit:
         print(f"🔄 Retrying {len(failed_pages)} failed pages: {failed_pages}")
         for p_idx in failed_pages:
-            if len(results) >= limit: break
+            if found >= limit: break
             await asyncio.sleep(random.uniform(2.0, 4.0)) # Heavier sleep for retry
             ads = await fetch_page(p_idx)
-            if ads:
-                for ad in ads:
-                    if ad["link"] not in seen_links_total:
-                        seen_links_total.add(ad["link"])
-                        results.append(ad)
+            page_results = take_html_ads()
+            for ad in ads or []:
+                if ad["link"] not in seen_links_total:
+                    seen_links_total.add(ad["link"])
+                    page_results.append(ad)
+            page_results = page_results[:limit - found]
+            found += len(page_results)
+            yield page_results
     
-    print(f"📊 Autovit Stats: Found {len(results)} | Skipped {scrape_stats['dupes']} Duplicates | Skipped {scrape_stats['invalid']} Invalid (Price=0)")
-    return results[:limit]
+    print(f"📊 Autovit Stats: Found {found} | Skipped {scrape_stats['dupes']} Duplicates | Skipped {scrape_stats['invalid']} Invalid (Price=0) | Filtered {scrape_stats['filtered']}")
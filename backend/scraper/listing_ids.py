@@ -0,0 +1,76 @@
+import hashlib
+import re
+from urllib.parse import urlsplit
+
+# Canonical listing identity: (source, external_id).
+# Same extractor for scrapers, deduplication and the `ads` table, so tracking
+# parameters or URL variants of one ad always map to the same key.
+
+SOURCE_OLX = "olx"
+SOURCE_AUTOVIT = "autovit"
+SOURCE_UNKNOWN = "unknown"
+
+SOURCE_LABELS = {
+    SOURCE_OLX: "OLX",
+    SOURCE_AUTOVIT: "Autovit",
+    SOURCE_UNKNOWN: "Unknown",
+}
+
+# Per-source ad ID patterns (both platforms currently end ad URLs in "-ID<alphanumeric>.html")
+_ID_PATTERNS = {
+    SOURCE_OLX: re.compile(r"-ID([A-Za-z0-9]+)\.html", re.I),
+    SOURCE_AUTOVIT: re.compile(r"-ID([A-Za-z0-9]+)\.html", re.I),
+}
+
+
+def detect_source(link: str | None, fallback: str | None = None) -> str:
+    """Source from the link domain; `fallback` (e.g. "OLX", "Autovit") if the domain is unknown."""
+    host = urlsplit(link or "").netloc.lower()
+    if host.endswith("autovit.ro"):
+        return SOURCE_AUTOVIT
+    if host.endswith("olx.ro"):
+        return SOURCE_OLX
+    fb = (fallback or "").strip().lower()
+    if fb in SOURCE_LABELS:
+        return fb
+    return SOURCE_UNKNOWN
+
+
+def normalize_link(link: str | None) -> str:
+    """Link without scheme, www., query string, fragment or trailing slash."""
+    parts = urlsplit((link or "").strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if host.startswith("m."):
+        host = host[2:]
+    return f"{host}{parts.path.rstrip('/')}"
+
+
+def extract_external_id(source: str, link: str | None) -> str | None:
+    """Platform ad ID from the link ("...-IDhFk3s.html" -> "hFk3s")."""
+    if not link:
+        return None
+    pattern = _ID_PATTERNS.get(source)
+    if pattern:
+        m = pattern.search(link)
+        if m:
+            return m.group(1)
+    # Fallback: stable hash of the normalized link
+    normalized = normalize_link(link)
+    if not normalized:
+        return None
+    return "h" + hashlib.md5(normalized.encode()).hexdigest()[:20]
+
+
+def canonical_ad_key(link: str | None, source: str | None = None) -> tuple[str, str | None]:
+    src = detect_source(link, source)
+    return src, extract_external_id(src, link)
+
+
+def canonical_ad_id(link: str | None, source: str | None = None) -> str | None:
+    """Single-string form of the canonical key, used as `ads.id` ("olx:hFk3s")."""
+    src, external_id = canonical_ad_key(link, source)
+    if not external_id:
+        return None
+    return f"{src}:{external_id}"
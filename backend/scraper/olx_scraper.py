@@ -3,10 +3,32 @@ import asyncio
 from bs4 import BeautifulSoup
 import re
 import json
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable
+from scraper.attributes import extract_attributes, fill_attributes, matches_filters
+from scraper.listing_ids import canonical_ad_id
 
 BASE_URL = "https://www.olx.ro/auto-masini-moto-ambarcatiuni/autoturisme/q-{}/"
 
 async def scrape_olx(
+    query: str,
+    page: int = 1,
+    limit: int = 100,
+    *,
+    stop_paging: Callable[[list[dict]], Awaitable[bool]] | None = None,
+    **options,
+):
+    # stop_paging(page_ads) -> True to stop after this page (incremental crawl, with newest_first).
+    # Other options are passed to iter_olx_pages.
+    ads = []
+    async with aclosing(iter_olx_pages(query, page, limit, **options)) as pages:
+        async for page_ads in pages:
+            ads.extend(page_ads)
+            if stop_paging is not None and await stop_paging(page_ads):
+                break
+    return ads
+
+async def iter_olx_pages(
     query: str,
     page: int = 1,
     limit: int = 100,
@@ -16,9 +38,24 @@ async def scrape_olx(
     min_year: int | None = None,
     max_year: int | None = None,
     max_km: int | None = None,
-): 
+    min_cc: int | None = None,
+    min_hp: int | None = None,
+    price_check: Callable[[int, int | None], bool] | None = None,
+    newest_first: bool = False,
+    throttle: Callable[[], Awaitable[None]] | None = None,
+    max_pages: int | None = None,
+) -> AsyncIterator[list[dict]]:
+    # Yields the ads one results page at a time (at most `limit` in total), so callers can
+    # stream them without holding the whole search in memory.
+    # Paging stops after `limit` raw cards (as before filtering moved in here: max_km / min_cc /
+    # min_hp are not URL params, so a selective filter would otherwise walk every results page)
+    # or after `max_pages` pages.
+    # price_check(price, year) -> True if the price looks wrong and the detail page should be fetched.
+    # Without one, only 0 and small prices on Autovit links (likely monthly rates) are fetched.
+    # throttle() is awaited before every request (shared per-site budget, see rate_limit.py).
 
-    ads = []
+    count = 0
+    seen = 0
     current_page = page
     
     # We will use a single session for all requests
@@ -26,7 +63,9 @@ async def scrape_olx(
         headers={"User-Agent": "Mozilla/5.0"}, 
         connector=aiohttp.TCPConnector(ssl=False)
     ) as session:
-        while len(ads) < limit:
+        while count < limit and seen < limit:
+            if max_pages is not None and current_page - page >= max_pages:
+                break
             # Construct URL/Params for current page
             url = BASE_URL.format(query.replace(" ", "-"))
             params = {"page": str(current_page)}
@@ -38,8 +77,12 @@ async def scrape_olx(
                 params["search[filter_float_year:from]"] = str(min_year)
             if max_year is not None:
                 params["search[filter_float_year:to]"] = str(max_year)
+            if newest_first:
+                params["search[order]"] = "created_at:desc"
 
             try:
+                if throttle is not None:
+                    await throttle()
                 async with session.get(url, params=params, timeout=10) as response:
                     # response.raise_for_status() # aiohttp doesn't raise automatically unless configured
                     if response.status != 200:
@@ -60,9 +103,10 @@ async def scrape_olx(
                     
                 page_ads = []
                 for item in items:
-                    if len(ads) + len(page_ads) >= limit:
+                    if count + len(page_ads) >= limit or seen >= limit:
                         break
-                        
+                    seen += 1
+
                     # Title
                     title_tag = item.select_one("h4") or item.select_one("h6.css-16v5mdi")            
                     
@@ -104,26 +148,53 @@ async def scrape_olx(
                              link_href = "https://www.olx.ro" + link_href
 
                         is_autovit = "autovit.ro" in link_href
+                        title_text = title_tag.get_text(strip=True)
 
-                        # Add to page list for parallel processing
-                        page_ads.append({
-                            "title": title_tag.get_text(strip=True),
+                        # Attributes: card parameter line ("2016 - 150.000 km"), then title as fallback.
+                        # Location/date line is skipped so the posting year is not read as the car year.
+                        card_params = [
+                            el.get_text(" ", strip=True)
+                            for el in item.find_all(["span", "p", "div"], recursive=True)
+                            if not el.find(["span", "p", "div"])
+                            and el is not price_tag
+                            and el.get("data-testid") != "location-date"
+                        ]
+                        card_attrs = extract_attributes(" | ".join(t for t in card_params if t and t != title_text))
+                        title_attrs = extract_attributes(title_text)
+
+                        ad_item = {
+                            "id": canonical_ad_id(link_href),
+                            "title": title_text,
                             "price": price_tag.get_text(strip=True),
                             "link": link_href,
                             "image": image_src,
                             "subsource": "Autovit" if is_autovit else "OLX"
-                        })
+                        }
+                        fill_attributes(ad_item, card_attrs, title_attrs)
+
+                        # Filter now, before any detail-page fetch is spent on this ad
+                        if not matches_filters(ad_item, min_year=min_year, max_year=max_year,
+                                               max_km=max_km, min_cc=min_cc, min_hp=min_hp):
+                            continue
+
+                        # Add to page list for parallel processing
+                        page_ads.append(ad_item)
 
                 # Process image/price fallbacks in parallel for this request using asyncio.gather
                 async def enrich_ad_data_async(ad_item):
                     # Check 1: Image needs fixing?
                     needs_img = not ad_item["image"] or "no_thumbnail" in ad_item["image"] or "/app/static" in ad_item["image"]
                     
-                    # Check 2: Price needs fixing? (0 EUR or likely monthly rate)
+                    # Check 2: Price needs fixing? (0 EUR, monthly rate or implausible for the model)
                     try:
                         p_val = int(re.sub(r"\D", "", ad_item["price"]))
-                        # Fix if price is 0 OR (small price on autovit link = monthly rate)
-                        needs_price = p_val == 0 or (p_val < 20000 and "autovit" in ad_item["link"])
+                        if price_check is not None:
+                            # Bands are in EUR; same RON conversion as search_cars
+                            is_ron = any(c in ad_item["price"].lower() for c in ("lei", "ron"))
+                            needs_price = price_check(p_val // 5 if is_ron else p_val, ad_item.get("year"))
+                        else:
+                            # Fix if price is 0 OR (small price on autovit link = monthly rate)
+                            needs_price = p_val == 0 or (p_val < 20000 and "autovit" in ad_item["link"])
                     except:
                         needs_price = True 
                     
@@ -134,6 +205,8 @@ async def scrape_olx(
                     new_price = None
                     
                     try:
+                        if throttle is not None:
+                            await throttle()
                         async with session.get(ad_item["link"], timeout=5) as r_det:
                             if r_det.status == 200:
                                 t_det = await r_det.text()
@@ -176,7 +249,8 @@ async def scrape_olx(
                         if res_price:
                             page_ads[i]["price"] = res_price
                 
-                ads.extend(page_ads)
+                count += len(page_ads)
+                yield page_ads
                 
                 # Next page
                 current_page += 1
@@ -184,5 +258,3 @@ async def scrape_olx(
             except Exception as e:
                 print(f"Error scraping OLX page {current_page}: {e}")
                 break
-
-    return ads
@@ -0,0 +1,124 @@
+"""
+Search Stats Write-Behind
+Statisticile de căutare nu mai sunt scrise la finalul fiecărei căutări: sunt
+agregate în memorie per (make, model) și scrise periodic, într-o singură
+tranzacție, ca upsert-uri pe cheia unică (vezi CarDatabaseOptimizer.apply_search_stats).
+"""
+
+import atexit
+import logging
+import threading
+import time
+from typing import Dict, Tuple
+
+from car_database import CarDatabaseOptimizer, car_db_optimizer
+
+
+class _PendingStats:
+    __slots__ = ("make", "model", "search_count", "last_searched",
+                 "price_sum", "price_samples", "year_sum", "year_samples", "km_sum", "km_samples")
+
+    def __init__(self, make: str, model: str):
+        self.make = make
+        self.model = model
+        self.search_count = 0
+        self.last_searched = None
+        self.price_sum = self.year_sum = self.km_sum = 0.0
+        self.price_samples = self.year_samples = self.km_samples = 0
+
+    def to_aggregate(self) -> Dict:
+        return {
+            "make": self.make,
+            "model": self.model,
+            "search_count": self.search_count,
+            "last_searched": self.last_searched,
+            "avg_price": self.price_sum / self.price_samples if self.price_samples else None,
+            "price_samples": self.price_samples,
+            "avg_year": self.year_sum / self.year_samples if self.year_samples else None,
+            "year_samples": self.year_samples,
+            "avg_km": self.km_sum / self.km_samples if self.km_samples else None,
+            "km_samples": self.km_samples,
+        }
+
+
+class SearchStatsWriter:
+    def __init__(self, optimizer: CarDatabaseOptimizer, flush_interval: float = 5.0):
+        self.optimizer = optimizer
+        self.flush_interval = flush_interval
+        self._pending: Dict[Tuple[str, str], _PendingStats] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, make: str, model: str,
+               avg_price: float = None, avg_year: float = None, avg_km: float = None,
+               price_count: int = 1, year_count: int = 1, km_count: int = 1):
+        """
+        Înregistrează o căutare (non-blocant). Mediile primite sunt ponderate cu
+        numărul de anunțuri din care au fost calculate.
+        """
+        key = (make.lower(), model.lower())
+        with self._lock:
+            stats = self._pending.get(key)
+            if stats is None:
+                stats = self._pending[key] = _PendingStats(*key)
+            stats.search_count += 1
+            stats.last_searched = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+            if avg_price is not None and price_count > 0:
+                stats.price_sum += avg_price * price_count
+                stats.price_samples += price_count
+            if avg_year is not None and year_count > 0:
+                stats.year_sum += avg_year * year_count
+                stats.year_samples += year_count
+            if avg_km is not None and km_count > 0:
+                stats.km_sum += avg_km * km_count
+                stats.km_samples += km_count
+        self._ensure_started()
+
+    def flush(self) -> int:
+        """Scrie tot ce e în buffer; întoarce numărul de perechi (make, model) scrise"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            self.optimizer.apply_search_stats([p.to_aggregate() for p in pending.values()])
+        except Exception as e:
+            logging.warning(f"[Stats] Flush eșuat, reîncerc la următorul interval: {e}")
+            with self._lock:
+                # Re-punem lotul înapoi, combinat cu ce s-a adunat între timp
+                for key, old in pending.items():
+                    new = self._pending.get(key)
+                    if new is None:
+                        self._pending[key] = old
+                        continue
+                    new.search_count += old.search_count
+                    new.price_sum += old.price_sum
+                    new.price_samples += old.price_samples
+                    new.year_sum += old.year_sum
+                    new.year_samples += old.year_samples
+                    new.km_sum += old.km_sum
+                    new.km_samples += old.km_samples
+            return 0
+        return len(pending)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="search-stats-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+
+search_stats_writer = SearchStatsWriter(car_db_optimizer)
@@ -4,8 +4,10 @@ Script de test pentru sistemul complet de optimizare a căutărilor auto
 Demonstrează funcționalitatea de scraping și optimizare
 """
 
-from car_database import car_db_optimizer, get_optimized_search_params
+from car_database import car_db_optimizer, get_optimized_search_params, CarDatabaseOptimizer
 from auto_data_scraper import AutoDataScraper
+import os
+import tempfile
 import time
 
 def test_database_optimization():
@@ -127,6 +129,50 @@ def test_integration():
     for i, model in enumerate(popular_models, 1):
         print(f"  {i}. {model['make'].upper()} {model['model'].upper()} - {model['search_count']} căutări")
 
+def _query_plan(db, query, params=()):
+    with db.db.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + query, params)
+        return [row[3] for row in cursor.fetchall()]
+
+def test_ads_query_plans():
+    """Verifică (EXPLAIN QUERY PLAN) că interogările pe ads folosesc indexurile, nu scanări"""
+    print("\n=== TESTARE PLANURI DE EXECUȚIE ADS ===")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = CarDatabaseOptimizer(os.path.join(tmp_dir, "plans.sqlite"))
+
+        # 1. Marcă + model + interval de preț, sortat după preț: totul din indexul compus
+        query, params = db._build_ads_search_query("BMW", "X6", min_price=5000, max_price=30000, limit=20)
+        plan = _query_plan(db, query, params)
+        assert any("USING INDEX idx_ads_active_make_model_price" in step and "model_norm=?" in step
+                   and "price>?" in step for step in plan), plan
+        assert not any("TEMP B-TREE" in step for step in plan), plan
+        print("✓ Căutare marcă/model/preț: idx_ads_active_make_model_price, fără sortare separată")
+
+        query, params = db._build_ads_search_query("BMW", "X6", limit=20, sort_by="price", order="desc")
+        plan = _query_plan(db, query, params)
+        assert not any("TEMP B-TREE" in step for step in plan), plan
+        print("✓ Sortare descrescătoare după preț: tot din index")
+
+        # 2. Fallback în titlu prin FTS5
+        if db.has_ads_fts():
+            query, params = db._build_ads_search_query("BMW", "320d", limit=20, model_match="fts")
+            plan = _query_plan(db, query, params)
+            assert any("ads_fts VIRTUAL TABLE" in step for step in plan), plan
+            assert not any(step.startswith("SCAN ads") and "ads_fts" not in step for step in plan), plan
+            print("✓ Căutare în titlu: ads_fts (FTS5)")
+        else:
+            print("✗ SQLite fără FTS5, planul pentru titlu nu a fost verificat")
+
+        # 3. Dezactivarea anunțurilor vechi: indexul (active, last_seen)
+        plan = _query_plan(
+            db, "UPDATE ads SET active = 0 WHERE active = 1 AND last_seen < datetime('now', ?)", ("-24 hours",)
+        )
+        assert any("idx_ads_active_last_seen" in step for step in plan), plan
+        print("✓ deactivate_stale_ads: idx_ads_active_last_seen")
+
+        db.db.close_all()
+
 def main():
     """Funcția principală de test"""
     print("🚗 TESTARE SISTEM COMPLET DE OPTIMIZARE CĂUTĂRI AUTO 🚗")
@@ -135,6 +181,9 @@ def main():
     try:
         # Testăm optimizarea bazei de date
         test_database_optimization()
+
+        # Testăm planurile de execuție pentru căutarea în anunțuri
+        test_ads_query_plans()
         
         # Testăm scraper-ul (doar cu limitări pentru test)
         print("\n" + "=" * 60)
@@ -36,13 +36,16 @@ const App = () => {
   // Search & UI State
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState("");
-  const [results, setResults] = useState([]);
+  const [results, setResults] = useState([]); // current page only
+  const [totalResults, setTotalResults] = useState(0);
   const [stats, setStats] = useState(null);
 
-  // Pagination & Sorting State
+  // Pagination & Sorting State (server-side, cursor based)
   const [currentPage, setCurrentPage] = useState(1);
   const [itemsPerPage] = useState(12);
-  const [sortBy, setSortBy] = useState("price-asc"); // price-asc, price-desc, year-desc, year-asc, km-asc
+  const [searchQuery, setSearchQuery] = useState("");
+  const [pageCursors, setPageCursors] = useState([null]); // pageCursors[n - 1] loads page n
+  const [sortBy, setSortBy] = useState("price-asc"); // price-asc, price-desc, year-desc, year-asc, km-asc, deal-desc
 
   // Data Fetching
   const fetchBrands = async () => {
@@ -118,66 +121,106 @@ const App = () => {
   }, [formData.make, formData.model]);
 
   // Search Handler
-  const handleSearch = async (e) => {
-    e.preventDefault();
+  const buildSearchQuery = (sort) => {
+    const params = new URLSearchParams();
+    // Map formData to API params
+    if (formData.make) params.append("make", formData.make);
+    if (formData.model) params.append("model", formData.model);
+    if (formData.generation) params.append("generation", formData.generation);
+    if (formData.minPrice) params.append("min_price", formData.minPrice);
+    if (formData.maxPrice) params.append("max_price", formData.maxPrice);
+    if (formData.minYear) params.append("min_year", formData.minYear);
+    if (formData.maxYear) params.append("max_year", formData.maxYear);
+    if (formData.maxKm) params.append("max_km", formData.maxKm);
+    params.append("site", formData.site);
+    params.append("limit", formData.limit);
+    params.append("max_pages", formData.maxPages);
+    // DB results first; the backend re-crawls stale models in the background
+    params.append("mode", "hybrid");
+    params.append("sort", sort.replace("-", "_"));
+    params.append("page_size", itemsPerPage);
+    return params.toString();
+  };
+
+  const fetchPage = async (query, cursor) => {
+    const params = new URLSearchParams(query);
+    if (cursor) params.append("cursor", cursor);
+
+    const url = `http://127.0.0.1:8000/api/search?${params.toString()}`;
+
+    const res = await fetch(url);
+    if (!res.ok) {
+      const errorData = await res.json().catch(() => ({}));
+      throw new Error(errorData.detail ? `Eroare server: ${JSON.stringify(errorData.detail)}` : `HTTP ${res.status}`);
+    }
+
+    const data = await res.json();
+    if (data.error) throw new Error(data.error);
+    return data;
+  };
+
+  const showPage = (data, pageNumber, cursors) => {
+    setResults(Array.isArray(data.results) ? data.results : []);
+    setTotalResults(data.total || 0);
+    const nextCursors = [...cursors];
+    if (data.next_cursor) nextCursors[pageNumber] = data.next_cursor;
+    setPageCursors(nextCursors);
+    setCurrentPage(pageNumber);
+  };
+
+  const runSearch = async (query) => {
     setError("");
     setLoading(true);
     setResults([]);
     setCurrentPage(1); // Reset to page 1 on new search
 
     try {
-      const params = new URLSearchParams();
-      // Map formData to API params
-      if (formData.make) params.append("make", formData.make);
-      if (formData.model) params.append("model", formData.model);
-      if (formData.generation) params.append("generation", formData.generation);
-      if (formData.minPrice) params.append("min_price", formData.minPrice);
-      if (formData.maxPrice) params.append("max_price", formData.maxPrice);
-      if (formData.minYear) params.append("min_year", formData.minYear);
-      if (formData.maxYear) params.append("max_year", formData.maxYear);
-      if (formData.maxKm) params.append("max_km", formData.maxKm);
-      params.append("site", formData.site);
-      params.append("limit", formData.limit);
-      params.append("max_pages", formData.maxPages);
-
-      const url = `http://127.0.0.1:8000/api/search?${params.toString()}`;
-
-      const res = await fetch(url);
-      if (!res.ok) {
-        const errorData = await res.json().catch(() => ({}));
-        throw new Error(errorData.detail ? `Eroare server: ${JSON.stringify(errorData.detail)}` : `HTTP ${res.status}`);
-      }
-
-      const data = await res.json();
-      setResults(Array.isArray(data.results) ? data.results : []);
-
-      // Fetch stats for this model
-      if (formData.make && formData.model) {
-        try {
-          const statsRes = await fetch(`http://127.0.0.1:8000/api/stats/${formData.make}/${formData.model}`);
-          if (statsRes.ok) {
-            const statsData = await statsRes.json();
-            if (!statsData.error) {
-              setStats(statsData);
-            } else {
-              setStats(null);
-            }
-          }
-        } catch (e) {
-          console.error("Failed to fetch stats", e);
-          setStats(null);
-        }
-      } else {
-        setStats(null);
-      }
+      const data = await fetchPage(query, null);
+      setSearchQuery(query);
+      showPage(data, 1, [null]);
+      return true;
     } catch (err) {
       console.error("Catch Error:", err);
       setError(err.message || "A apărut o eroare la conexiunea cu serverul.");
+      return false;
     } finally {
       setLoading(false);
     }
   };
 
+  const handleSearch = async (e) => {
+    e.preventDefault();
+    const ok = await runSearch(buildSearchQuery(sortBy));
+
+    // Fetch stats for this model
+    if (ok && formData.make && formData.model) {
+      try {
+        const statsRes = await fetch(`http://127.0.0.1:8000/api/stats/${formData.make}/${formData.model}`);
+        if (statsRes.ok) {
+          const statsData = await statsRes.json();
+          if (!statsData.error) {
+            setStats(statsData);
+          } else {
+            setStats(null);
+          }
+        }
+      } catch (e) {
+        console.error("Failed to fetch stats", e);
+        setStats(null);
+      }
+    } else {
+      setStats(null);
+    }
+  };
+
+  // Sorting is done by the server, so a new sort order reruns the last search from page 1
+  const handleSortChange = (e) => {
+    setSortBy(e.target.value);
+    const params = new URLSearchParams(searchQuery);
+    params.set("sort", e.target.value.replace("-", "_"));
+    runSearch(params.toString());
+  };
+
   // Alert Handler
   const [isAlertOpen, setIsAlertOpen] = useState(false);
 
@@ -203,34 +246,20 @@ const App = () => {
     }
   };
 
-  // Logic for Sorting
-  const getSortedResults = () => {
-    const sorted = [...results];
-    switch (sortBy) {
-      case "price-asc":
-        return sorted.sort((a, b) => a.price - b.price);
-      case "price-desc":
-        return sorted.sort((a, b) => b.price - a.price);
-      case "year-desc":
-        return sorted.sort((a, b) => (b.year || 0) - (a.year || 0));
-      case "year-asc":
-        return sorted.sort((a, b) => (a.year || 0) - (b.year || 0));
-      case "km-asc":
-        return sorted.sort((a, b) => (a.km || 0) - (b.km || 0));
-      default:
-        return sorted;
-    }
-  };
-
   // Logic for Pagination
-  const sortedResults = getSortedResults();
-  const indexOfLastCar = currentPage * itemsPerPage;
-  const indexOfFirstCar = indexOfLastCar - itemsPerPage;
-  const currentCars = sortedResults.slice(indexOfFirstCar, indexOfLastCar);
-
-  const paginate = (pageNumber) => {
-    setCurrentPage(pageNumber);
-    window.scrollTo({ top: 800, behavior: 'smooth' }); // Auto-scroll to results
+  const paginate = async (pageNumber) => {
+    if (pageNumber < 1 || pageNumber > pageCursors.length) return;
+    setLoading(true);
+    try {
+      const data = await fetchPage(searchQuery, pageCursors[pageNumber - 1]);
+      showPage(data, pageNumber, pageCursors);
+      window.scrollTo({ top: 800, behavior: 'smooth' }); // Auto-scroll to results
+    } catch (err) {
+      console.error("Catch Error:", err);
+      setError(err.message || "A apărut o eroare la conexiunea cu serverul.");
+    } finally {
+      setLoading(false);
+    }
   };
 
   return (
@@ -276,13 +305,13 @@ const App = () => {
             {results.length > 0 && (
               <div className="results-header">
                 <span className="results-count">
-                  Am găsit <strong>{results.length}</strong> rezultate
+                  Am găsit <strong>{totalResults}</strong> rezultate
                 </span>
 
                 <div className="sort-controls">
                   <select
                     value={sortBy}
-                    onChange={(e) => setSortBy(e.target.value)}
+                    onChange={handleSortChange}
                     className="sort-select"
                   >
                     <option value="price-asc">Preț (Crescător)</option>
@@ -290,6 +319,7 @@ const App = () => {
                     <option value="year-desc">An (Cel mai nou)</option>
                     <option value="year-asc">An (Cel mai vechi)</option>
                     <option value="km-asc">Km (Cei mai puțini)</option>
+                    <option value="deal-desc">Cele mai bune oferte</option>
                   </select>
                 </div>
               </div>
@@ -297,12 +327,13 @@ const App = () => {
 
             {stats && <PriceStats stats={stats} currentSearch={formData} />}
 
-            <ResultsList results={currentCars} />
+            <ResultsList results={results} />
 
             {results.length > 0 && (
               <Pagination
                 carsPerPage={itemsPerPage}
-                totalCars={results.length}
+                totalCars={totalResults}
+                reachablePages={pageCursors.length}
                 paginate={paginate}
                 currentPage={currentPage}
               />
@@ -1,9 +1,68 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
+
+// Cards flagged needs_enrichment ask the backend for image, price and liveness.
+// Cards rendered in the same tick are batched into a single POST /api/enrich.
+const pendingEnrichment = new Map(); // ad id -> resolve callbacks
+let enrichmentTimer = null;
+
+const flushEnrichment = async () => {
+    enrichmentTimer = null;
+    const batch = new Map(pendingEnrichment);
+    pendingEnrichment.clear();
+
+    let results = {};
+    try {
+        const response = await fetch('http://127.0.0.1:8000/api/enrich', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ ids: [...batch.keys()] })
+        });
+        const data = await response.json();
+        results = data.results || {};
+    } catch (err) {
+        console.error('Error enriching listings:', err);
+    }
+    batch.forEach((callbacks, id) => callbacks.forEach(resolve => resolve(results[id] || null)));
+};
+
+const requestEnrichment = (id) => new Promise(resolve => {
+    pendingEnrichment.set(id, [...(pendingEnrichment.get(id) || []), resolve]);
+    if (!enrichmentTimer) enrichmentTimer = setTimeout(flushEnrichment, 50);
+});
+
+const parsePrice = (price) => parseInt(String(price).replace(/\D/g, '')) || 0;
+
+const CarCard = ({ car: listing }) => {
+    const [car, setCar] = useState(listing);
+    const [removed, setRemoved] = useState(false);
+
+    useEffect(() => {
+        setCar(listing);
+        setRemoved(false);
+        if (!listing.needs_enrichment || !listing.id) return;
+
+        let cancelled = false;
+        requestEnrichment(listing.id).then(details => {
+            if (cancelled || !details || details.error) return;
+            if (!details.alive) {
+                setRemoved(true); // Listing was deleted from the site
+                return;
+            }
+            setCar(prev => ({
+                ...prev,
+                image: details.image || prev.image,
+                price: details.price && details.price > parsePrice(prev.price) ? details.price : prev.price,
+                needs_enrichment: false
+            }));
+        });
+        return () => { cancelled = true; };
+    }, [listing]);
+
+    if (removed) return null;
 
-const CarCard = ({ car }) => {
     // Format price
     let displayPrice = "";
-    const rawPrice = parseInt(String(car.price).replace(/\D/g, '')) || 0;
+    const rawPrice = parsePrice(car.price);
 
     if (rawPrice === 0) {
         displayPrice = "Preț la cerere";
@@ -1,8 +1,10 @@
 import React from 'react';
 
-const Pagination = ({ carsPerPage, totalCars, paginate, currentPage }) => {
+// Pages are loaded with server cursors: only pages already visited (and the next one) can be opened
+const Pagination = ({ carsPerPage, totalCars, reachablePages, paginate, currentPage }) => {
     const pageNumbers = [];
     const totalPages = Math.ceil(totalCars / carsPerPage);
+    const isReachable = (page) => page <= reachablePages;
 
     // Logic to show limited page numbers (e.g., current - 2 to current + 2)
     let startPage = Math.max(1, currentPage - 2);
@@ -43,6 +45,7 @@ const Pagination = ({ carsPerPage, totalCars, paginate, currentPage }) => {
                 <button
                     key={number}
                     onClick={() => paginate(number)}
+                    disabled={!isReachable(number)}
                     className={`page-btn ${currentPage === number ? 'active' : ''}`}
                 >
                     {number}
@@ -52,14 +55,14 @@ const Pagination = ({ carsPerPage, totalCars, paginate, currentPage }) => {
             {endPage < totalPages && (
                 <>
                     {endPage < totalPages - 1 && <span style={{ color: 'var(--text-secondary)' }}>...</span>}
-                    <button onClick={() => paginate(totalPages)} className="page-btn">{totalPages}</button>
+                    <button onClick={() => paginate(totalPages)} disabled={!isReachable(totalPages)} className="page-btn">{totalPages}</button>
                 </>
             )}
 
             <button
                 className="page-btn"
                 onClick={() => paginate(currentPage + 1)}
-                disabled={currentPage === totalPages}
+                disabled={currentPage === totalPages || !isReachable(currentPage + 1)}
             >
                 →
             </button>
@@ -3,7 +3,7 @@ import React from 'react';
 const PriceStats = ({ stats, currentSearch }) => {
     if (!stats) return null;
 
-    const { avg_price, avg_year, avg_km, search_count } = stats;
+    const { avg_price, avg_year, avg_km, search_count, count, median, p10, p90 } = stats;
 
     // Format price
     const formatPrice = (price) => {
@@ -26,7 +26,7 @@ const PriceStats = ({ stats, currentSearch }) => {
                     📊 Analiză Piață: {currentSearch.make} {currentSearch.model}
                 </h3>
                 <span style={{ fontSize: '0.9rem', color: 'var(--text-secondary)' }}>
-                    Bazat pe {search_count} căutări anterioare
+                    {count ? `Bazat pe ${count} anunțuri active` : `Bazat pe ${search_count} căutări anterioare`}
                 </span>
             </div>
 
@@ -38,6 +38,20 @@ const PriceStats = ({ stats, currentSearch }) => {
                     </div>
                 </div>
 
+                {median && (
+                    <div className="stat-item" style={{ textAlign: 'center', padding: '1rem', background: 'rgba(255,255,255,0.05)', borderRadius: '8px' }}>
+                        <div style={{ fontSize: '0.9rem', color: 'var(--text-secondary)', marginBottom: '0.5rem' }}>Preț Median</div>
+                        <div style={{ fontSize: '1.5rem', fontWeight: 'bold', color: '#4ade80' }}>
+                            {formatPrice(median)}
+                        </div>
+                        {p10 && p90 && (
+                            <div style={{ fontSize: '0.8rem', color: 'var(--text-secondary)', marginTop: '0.25rem' }}>
+                                80% între {formatPrice(p10)} și {formatPrice(p90)}
+                            </div>
+                        )}
+                    </div>
+                )}
+
                 <div className="stat-item" style={{ textAlign: 'center', padding: '1rem', background: 'rgba(255,255,255,0.05)', borderRadius: '8px' }}>
                     <div style={{ fontSize: '0.9rem', color: 'var(--text-secondary)', marginBottom: '0.5rem' }}>An Mediu</div>
                     <div style={{ fontSize: '1.5rem', fontWeight: 'bold', color: '#60a5fa' }}>